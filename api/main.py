@@ -1,30 +1,102 @@
 import os
+import asyncio
+import json
+import time
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
+from contextlib import asynccontextmanager
 import uuid
 from datetime import datetime
 
 from src.config import SUPPORTED_FILE_TYPES
-from src.text_processors import format_for_ai
-from src.file_extractors import extract_content_by_type
+from src.text_processors import format_for_ai, detect_language, extract_content_section, select_passages
 from src.metadata_handlers import (
     generate_auto_title,
     parse_filename,
     create_metadata_for_ai,
-    create_dynamodb_item
+    create_dynamodb_item,
+    create_processing_item,
+    PROCESSING_STATUS_PROCESSING,
+    PROCESSING_STATUS_READY,
+    PROCESSING_STATUS_FAILED,
 )
-from src.aws_services import aws_services
-from src.models import Document, SearchRequest, SearchResponse, UploadResponse, AccessLog, IncentiveRequest, IncentiveResponse, IncentiveSummary
+from src.aws_services import aws_services, DOCUMENT_RESPONSE_FIELDS, TEXT_POINTER_FIELDS
+from src.models import Document, SearchRequest, SearchResponse, BatchSearchRequest, BatchSearchResult, BatchSearchResponse, SuggestResponse, UploadResponse, AccessLog, IncentiveRequest, IncentiveResponse, IncentiveSummary
 from src.auth.cognito_auth import get_current_user, get_current_user_optional, require_admin
 from src.services.opensearch_service import opensearch_service
 from src.services.access_logger_service import access_logger_service
-from src.config import S3_BUCKET_NAME
-from boto3.dynamodb.conditions import Attr
+from src.services.search_cache import search_cache, suggest_cache
+from src.services.local_search_index import local_search_index
+from src.services.metrics import metrics
+from src.services.opensearch_migration import opensearch_migrator, JobStateCheckpointStore
+from src.services.job_runner import job_runner, JobContext, JobConflictError, JobNotFoundError
+from src.services.ingest_queue import ingest_queue, ingest_workers
+from src.services.extraction_pool import extraction_pool, ExtractionPoolBusyError
+from src.services.async_storage import storage
+from src.services.upload_stream import stream_upload, spool_from_s3, UploadTooLargeError
+from src.services.content_index import content_index
+from src.services.text_store import text_store
+from src.services.search_cursor import (
+    BACKEND_DYNAMODB,
+    BACKEND_LOCAL,
+    BACKEND_OPENSEARCH,
+    InvalidCursorError,
+    decode_cursor,
+    encode_cursor,
+    query_fingerprint,
+)
+from src.config import SEARCH_SOURCE_MODE, SEARCH_CURSOR_USE_PIT, SEARCH_CURSOR_KEEP_ALIVE, SEARCH_BATCH_MAX_QUERIES, SEARCH_STREAM_HYDRATE_BATCH, SUGGEST_TIMEOUT, INGEST_MODE, UPLOAD_MAX_BYTES
+from src.config import PASSAGE_INDEX_ENABLED, PASSAGE_CHARS, PASSAGE_OVERLAP, SEARCH_PASSAGES_PER_DOCUMENT, SEARCH_PASSAGES_MAX
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    アプリケーションのライフサイクル管理
+    起動時にOpenSearchのバックグラウンドヘルスプローブを開始し、終了時にコネクションプールを解放する
+    ローカル検索インデックスは起動時に読み込み、存在しない場合はバックグラウンドでDynamoDBから構築する
+    """
+    opensearch_service.start_health_monitor()
+    # 新しいフィールドを持つドキュメントを登録する前に、既存インデックスに不足しているフィールド定義を追加する
+    # （doc_idなどが動的マッピングで別の型として登録されるのを防ぎ、検索の同順位解決に使うフィールドを決める）
+    mapping_update = asyncio.create_task(opensearch_service.update_mapping_async())
+    extraction_pool.start()
+    if ingest_workers.concurrency > 0:
+        ingest_workers.start(_process_ingest_message, _mark_ingest_failed)
+    if local_search_index.enabled and not local_search_index.load():
+        asyncio.get_running_loop().run_in_executor(None, _rebuild_local_index)
+    yield
+    mapping_update.cancel()
+    await ingest_workers.stop()
+    await extraction_pool.shutdown()
+    await job_runner.shutdown()
+    await opensearch_service.close_async()
+    local_search_index.close()
+
+
+def _rebuild_local_index() -> int:
+    """DynamoDBの全ドキュメントからローカル検索インデックスを構築"""
+    try:
+        return opensearch_service.rebuild_local_index(text_store.iter_with_text(aws_services.iter_all_documents()))
+    except Exception as e:
+        print(f"ローカルインデックス構築エラー: {e}")
+        return 0
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+
+# /searchのストリーミング応答のメディアタイプ
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# /searchの検索モード（documentはドキュメント単位、passageはドキュメントごとの上位パッセージを返す）
+SEARCH_MODE_DOCUMENT = "document"
+SEARCH_MODE_PASSAGE = "passage"
+
+# アップロードのContent-Lengthのうちファイル以外（マルチパートの境界・タイトルなどのフォーム項目）に見込む分
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
 
 # CORS設定
 app.add_middleware(
@@ -40,6 +112,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def reject_oversized_upload(request: Request, call_next):
+    """
+    Content-Lengthが上限を超えるアップロードは本文を受信する前に413で拒否する
+    （Content-Lengthがない場合はアップロード処理が読みながら上限を確認する）
+    """
+    if request.method == "POST" and request.url.path == "/upload/file":
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and \
+                int(content_length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": str(UploadTooLargeError(UPLOAD_MAX_BYTES))}
+            )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    """
+    リクエストごとに処理段階のスパンを集め、Server-Timingヘッダーとルート単位のメトリクスに反映する
+    （ストリーミング応答はヘッダー送信までの時間を記録する）
+    """
+    spans, token = metrics.start_request()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        metrics.end_request(token, request.method, getattr(route, "path", "unmatched"), status_code, elapsed)
+    if metrics.server_timing_enabled:
+        response.headers["Server-Timing"] = metrics.server_timing(spans, elapsed)
+    return response
+
+
 @app.get("/")
 async def read_root():
     return HTMLResponse("<h1>Hello from FastAPI on Fargate!</h1>")
@@ -56,6 +167,14 @@ async def health_check():
     }
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus形式のメトリクス（ルートごとのレイテンシー・件数と、処理段階ごとのレイテンシー・エラー数）
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/admin/opensearch/init")
 async def init_opensearch(current_user: dict = Depends(require_admin)):
     """
@@ -63,14 +182,19 @@ async def init_opensearch(current_user: dict = Depends(require_admin)):
     """
     try:
         # ヘルスチェック
-        if not opensearch_service.health_check():
+        if not await opensearch_service.health_check_async():
             raise HTTPException(
                 status_code=503, 
                 detail="OpenSearchクラスターに接続できません"
             )
         
         # インデックス作成
-        result = opensearch_service.create_index()
+        result = await opensearch_service.create_index_async()
+        
+        # 既存インデックスの場合は不足しているフィールド定義のみ追加
+        error = result.get("error")
+        if isinstance(error, dict) and error.get("type") == "resource_already_exists_exception":
+            result = await opensearch_service.update_mapping_async()
         
         if "error" in result:
             raise HTTPException(
@@ -78,6 +202,15 @@ async def init_opensearch(current_user: dict = Depends(require_admin)):
                 detail=f"インデックス作成に失敗しました: {result['error']}"
             )
         
+        # パッセージ検索用のインデックスも作成
+        if opensearch_service.passages_enabled:
+            passage_result = await opensearch_service.create_passage_index_async()
+            if "error" in passage_result:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"パッセージインデックス作成に失敗しました: {passage_result['error']}"
+                )
+        
         return {
             "success": True,
             "message": "OpenSearchインデックスが正常に作成されました",
@@ -100,11 +233,17 @@ async def opensearch_status(current_user: dict = Depends(require_admin)):
     OpenSearchステータス確認（管理者専用）
     """
     try:
-        health_status = opensearch_service.health_check()
+        # 管理者の確認時は実際にプローブし、その結果も共有ヘルス状態に反映する
+        health_status = await opensearch_service.probe_health_async()
         
         return {
             "success": True,
             "opensearch_healthy": health_status,
+            "circuit_breaker": opensearch_service.health.snapshot(),
+            "query_tiers": opensearch_service.query_tier_stats(),
+            "fallback_search": aws_services.fallback_search_stats(),
+            "local_index": local_search_index.stats(),
+            "migration": opensearch_migrator.progress(),
             "endpoint": opensearch_service.endpoint,
             "index_name": opensearch_service.index_name
         }
@@ -117,58 +256,243 @@ async def opensearch_status(current_user: dict = Depends(require_admin)):
         )
 
 
-@app.post("/admin/opensearch/migrate")
+@app.get("/admin/search/cache")
+async def search_cache_status(current_user: dict = Depends(require_admin)):
+    """
+    検索結果キャッシュの統計確認（管理者専用）
+    """
+    return {
+        "success": True,
+        "cache": search_cache.stats(),
+        "suggest_cache": suggest_cache.stats()
+    }
+
+
+@app.delete("/admin/search/cache")
+async def clear_search_cache(current_user: dict = Depends(require_admin)):
+    """
+    検索結果キャッシュを全削除（管理者専用）
+    """
+    search_cache.clear()
+    suggest_cache.clear()
+    return {
+        "success": True,
+        "message": "検索キャッシュを削除しました"
+    }
+
+
+@app.get("/admin/local-index")
+async def local_index_status(current_user: dict = Depends(require_admin)):
+    """
+    ローカル検索インデックスの状態確認（管理者専用）
+    """
+    return {"success": True, "local_index": local_search_index.stats()}
+
+
+@app.post("/admin/local-index/rebuild")
+async def rebuild_local_index(current_user: dict = Depends(require_admin)):
+    """
+    ローカル検索インデックスをDynamoDBから再構築（管理者専用）
+    """
+    if not local_search_index.enabled:
+        raise HTTPException(status_code=400, detail="ローカル検索インデックスが無効です")
+    
+    try:
+        indexed = await asyncio.get_running_loop().run_in_executor(None, _rebuild_local_index)
+        return {
+            "success": True,
+            "message": "ローカル検索インデックスを再構築しました",
+            "indexed_documents": indexed,
+            "local_index": local_search_index.stats()
+        }
+    except Exception as e:
+        print(f"ローカルインデックス再構築エラー: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"ローカルインデックス再構築中にエラーが発生しました: {str(e)}"
+        )
+
+
+@app.get("/admin/extraction")
+async def extraction_status(current_user: dict = Depends(require_admin)):
+    """
+    テキスト抽出プロセスプールの稼働状況（処理中・待ち件数、タイムアウト・異常終了の件数）を確認（管理者専用）
+    """
+    return {"success": True, "extraction": extraction_pool.stats()}
+
+
+@app.get("/admin/ingest")
+async def ingest_status(current_user: dict = Depends(require_admin)):
+    """
+    非同期取り込みのキュー件数とワーカーの処理件数を確認（管理者専用）
+    """
+    return {"success": True, "mode": INGEST_MODE, "ingest": ingest_workers.stats()}
+
+
+@app.get("/admin/content-cache")
+async def content_cache_status(current_user: dict = Depends(require_admin)):
+    """
+    内容の重複排除と抽出結果キャッシュの効果（重複アップロード件数・キャッシュヒット率・削減したバイト数）を確認（管理者専用）
+    """
+    return {"success": True, "content_cache": content_index.stats()}
+
+
+@app.get("/admin/text-store")
+async def text_store_status(current_user: dict = Depends(require_admin)):
+    """
+    整形済みテキストのS3保存の状況（保存件数・圧縮率・読み込みキャッシュのヒット率）を確認（管理者専用）
+    """
+    return {"success": True, "text_store": text_store.stats()}
+
+
+@app.post("/admin/text-store/backfill", status_code=202)
+async def backfill_text_store(current_user: dict = Depends(require_admin)):
+    """
+    保存済みのドキュメントの大きな整形済みテキストをS3に移す（管理者専用）
+    
+    移行はバックグラウンドジョブとして実行し、ジョブIDをすぐに返す（進捗は GET /admin/jobs/{job_id}）
+    """
+    if not text_store.enabled:
+        raise HTTPException(status_code=400, detail="整形済みテキストのS3保存が無効です")
+    try:
+        job = await job_runner.submit(JOB_TEXT_BACKFILL)
+        return {
+            "success": True,
+            "message": "整形済みテキストの移行ジョブを開始しました",
+            "job": job
+        }
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+async def _run_text_backfill_job(context: JobContext) -> dict:
+    """
+    整形済みテキストの移行ジョブ
+    
+    テーブルをページ単位にスキャンし、ページごとに次の開始位置を状態として保存する（再開時はその続きから）。
+    移行済み・小さい本文のアイテムはそのまま残す
+    """
+    state = {"k": None, "moved": 0, "skipped": 0, "failed": 0, "bytes_moved": 0, **context.state}
+    context.set_total(await context.run_sync(aws_services.approximate_document_count))
+    
+    while True:
+        context.check_cancelled()
+        page = await context.run_sync(aws_services.scan_segment_page, 0, 1, state["k"])
+        for item in page["items"]:
+            try:
+                moved = await context.run_sync(text_store.offload_existing, item)
+            except Exception as item_error:
+                print(f"整形済みテキスト移行エラー: {item.get('id')} - {item_error}")
+                state["failed"] += 1
+                continue
+            if moved is None:
+                state["skipped"] += 1
+            else:
+                state["moved"] += 1
+                state["bytes_moved"] += moved
+        
+        state["k"] = page["last_key"]
+        context.save_state(dict(state))
+        context.update(
+            processed=state["moved"] + state["skipped"],
+            failed=state["failed"],
+            bytes_processed=state["bytes_moved"]
+        )
+        if not page["last_key"]:
+            break
+    
+    return {
+        "moved_documents": state["moved"],
+        "skipped_documents": state["skipped"],
+        "failed_documents": state["failed"],
+        "bytes_moved": state["bytes_moved"]
+    }
+
+
+@app.post("/admin/opensearch/passages/rebuild", status_code=202)
+async def rebuild_passage_index(current_user: dict = Depends(require_admin)):
+    """
+    保存済みのドキュメントをパッセージに分けてパッセージインデックスに登録し直す（管理者専用）
+    
+    登録はバックグラウンドジョブとして実行し、ジョブIDをすぐに返す（進捗は GET /admin/jobs/{job_id}）
+    """
+    if not opensearch_service.passages_enabled:
+        raise HTTPException(status_code=400, detail="パッセージ検索は無効です")
+    if not await opensearch_service.health_check_async():
+        raise HTTPException(status_code=503, detail="OpenSearchクラスターに接続できません")
+    try:
+        job = await job_runner.submit(JOB_PASSAGE_INDEX)
+        return {
+            "success": True,
+            "message": "パッセージインデックスの再構築ジョブを開始しました",
+            "job": job
+        }
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+async def _run_passage_index_job(context: JobContext) -> dict:
+    """
+    パッセージインデックスの再構築ジョブ
+    
+    テーブルをページ単位にスキャンし、ページ内のドキュメントのパッセージをまとめて登録する。
+    ページごとに次の開始位置を状態として保存する（再開時はその続きから）
+    """
+    state = {"k": None, "documents": 0, "passages": 0, "failed": 0, **context.state}
+    await opensearch_service.create_passage_index_async()
+    context.set_total(await context.run_sync(aws_services.approximate_document_count))
+    
+    while True:
+        context.check_cancelled()
+        page = await context.run_sync(aws_services.scan_segment_page, 0, 1, state["k"])
+        # S3に保存した本文を読み込む（全件を順に読むのでキャッシュは使わない）
+        items = await context.run_sync(lambda: list(text_store.iter_with_text(page["items"])))
+        result = await opensearch_service.index_passages_async(items)
+        state["documents"] += result["documents"]
+        state["passages"] += result["passages"]
+        state["failed"] += result["failed"]
+        
+        state["k"] = page["last_key"]
+        context.save_state(dict(state))
+        context.update(processed=state["documents"], failed=state["failed"])
+        if not page["last_key"]:
+            break
+    
+    # 再登録したパッセージが検索に反映されてから、キャッシュ済みの検索結果を破棄
+    await opensearch_service.refresh_async(index_name=opensearch_service.passage_index_name)
+    search_cache.clear()
+    return {
+        "indexed_documents": state["documents"],
+        "indexed_passages": state["passages"],
+        "failed_passages": state["failed"]
+    }
+
+
+@app.post("/admin/opensearch/migrate", status_code=202)
 async def migrate_data_to_opensearch(current_user: dict = Depends(require_admin)):
     """
     既存DynamoDBデータをOpenSearchに移行（管理者専用）
+    
+    移行はバックグラウンドジョブとして実行し、ジョブIDをすぐに返す。
+    進捗は GET /admin/jobs/{job_id} で確認し、中断した移行は POST /admin/jobs/{job_id}/resume で再開する
     """
     try:
         # OpenSearchヘルスチェック
-        if not opensearch_service.health_check():
+        if not await opensearch_service.health_check_async():
             raise HTTPException(
                 status_code=503, 
                 detail="OpenSearchクラスターに接続できません"
             )
         
-        # DynamoDBから全データを取得
-        response = aws_services.get_dynamodb_table().scan()
-        items = response.get('Items', [])
-        
-        successful_migrations = 0
-        failed_migrations = 0
-        
-        for item in items:
-            try:
-                # DynamoDBアイテムからOpenSearch用データを作成
-                opensearch_result = opensearch_service.index_document(
-                    doc_id=item["id"],
-                    title=item.get("title", ""),
-                    content=item.get("formatted_text", ""),
-                    user_id=item.get("user_id", "anonymous"),
-                    file_type=item.get("file_type", "unknown"),
-                    uploaded_at=item.get("uploaded_at")
-                )
-                
-                if "error" not in opensearch_result:
-                    successful_migrations += 1
-                else:
-                    failed_migrations += 1
-                    print(f"移行失敗: {item['id']} - {opensearch_result.get('error')}")
-                    
-            except Exception as migration_error:
-                failed_migrations += 1
-                print(f"移行エラー: {item.get('id', 'unknown')} - {migration_error}")
-        
+        job = await job_runner.submit(JOB_OPENSEARCH_MIGRATION)
         return {
             "success": True,
-            "message": "データ移行が完了しました",
-            "statistics": {
-                "total_items": len(items),
-                "successful_migrations": successful_migrations,
-                "failed_migrations": failed_migrations
-            }
+            "message": "データ移行ジョブを開始しました",
+            "job": job
         }
         
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -178,8 +502,36 @@ async def migrate_data_to_opensearch(current_user: dict = Depends(require_admin)
             detail=f"データ移行中にエラーが発生しました: {str(e)}"
         )
 
+
+async def _run_migration_job(context: JobContext) -> dict:
+    """
+    データ移行ジョブ
+    
+    チェックポイントはジョブの状態としてDynamoDBに保存し、再起動後に別のタスクからも再開できる
+    """
+    # 検索結果生成用フィールドのマッピングを追加
+    await opensearch_service.update_mapping_async()
+    context.set_total(await context.run_sync(aws_services.approximate_document_count))
+    
+    statistics = await opensearch_migrator.run(
+        checkpoint_store=JobStateCheckpointStore(context),
+        on_progress=lambda stats: context.update(
+            processed=stats["successful_migrations"],
+            failed=stats["failed_migrations"],
+            bytes_processed=stats["bytes_sent"]
+        )
+    )
+    
+    # インデックス全体を再登録したため、検索に反映してからキャッシュ済みの検索結果をすべて破棄
+    await opensearch_service.refresh_async()
+    search_cache.clear()
+    suggest_cache.clear()
+    return statistics
+
+
 @app.post("/upload/file", response_model=dict)
 async def upload_file(
+    response: Response,
     file: UploadFile = File(...),
     title: str = Form(...),
     description: Optional[str] = Form(None),
@@ -189,11 +541,13 @@ async def upload_file(
     ファイルをアップロードしてS3に保存し、メタデータをDynamoDBに格納します
     対応ファイル形式：テキスト、HTML、PDF、Docx
     **認証必須**
+    
+    INGEST_MODE=asyncの場合は原本をS3に保存した時点で202（status: processing）を返し、
+    テキスト抽出・整形・インデックス登録は取り込みワーカーで行う（進捗は GET /files/{file_id}/status）
     """
+    spooled = None
+    content_registered = False
     try:
-        # ファイルの内容を読み込む
-        file_content = await file.read()
-        
         # ファイルタイプの確認
         if file.content_type not in SUPPORTED_FILE_TYPES:
             raise HTTPException(
@@ -204,65 +558,85 @@ async def upload_file(
         # ファイル名と拡張子を取得
         file_name, file_extension = parse_filename(file.filename)
         
-        # ファイルの内容からテキストとメタデータを抽出
-        extracted_text, file_metadata = extract_content_by_type(file_content, file.content_type)
-        
-        # ファイルタイプに応じてタイトルを生成
-        auto_title = generate_auto_title(title, file.content_type, extracted_text, file_metadata, file_name)
-        
         # UUIDを生成して使用
         file_id = str(uuid.uuid4())
         
         # 現在のタイムスタンプをISO 8601形式で取得
         uploaded_at = datetime.utcnow().isoformat()
         
-        # AIモデル用にテキストデータを整形
-        metadata_for_ai = create_metadata_for_ai(
-            auto_title, description, file_extension, file_name, uploaded_at, file_metadata
-        )
-        
-        # AI用に整形したテキストを生成
-        formatted_text = format_for_ai(extracted_text, metadata_for_ai)
-        
         # 拡張子に応じたS3フォルダを決定
         folder_name = file_extension.lower()
         
         # S3キーを生成（拡張子ごとのフォルダに保存）
         s3_key = f"{folder_name}/{file_id}.{file_extension}"
         
-        # S3に元のファイルをアップロード
-        aws_services.upload_file_to_s3(file_content, s3_key, file.content_type)
-        
-        # DynamoDBにメタデータと整形済みテキストを保存
-        item = create_dynamodb_item(
-            file_id=file_id, 
-            s3_key=s3_key, 
-            file_name=file_name, 
-            file_extension=file_extension, 
-            uploaded_at=uploaded_at, 
-            auto_title=auto_title, 
-            description=description, 
-            content_type=file.content_type, 
-            file_metadata=file_metadata, 
-            formatted_text=formatted_text,
-            user_info=current_user  # 認証必須なので常にユーザー情報あり
-        )
+        # 本文をチャンク単位で読み、抽出用の一時ファイルとS3（マルチパート）に同時に書き出す
+        # S3への保存はSHA-256で重複を確認するまで完了しない
+        with metrics.span("upload.stream"):
+            spooled = await stream_upload(file, s3_key, file.content_type, complete=False)
+        
+        # 同じ内容の原本が保存済みならそれを共有し、今回送信した分は破棄する
+        with metrics.span("upload.dedup"):
+            shared_key = await content_index.acquire(spooled.sha256, s3_key, file.content_type, spooled.size)
+            content_registered = shared_key is not None
+            if shared_key is None or shared_key == s3_key:
+                await spooled.complete_upload()
+            else:
+                await spooled.abort_upload()
+                s3_key = shared_key
         
-        aws_services.save_to_dynamodb(item)
+        # 抽出・登録に必要な情報（非同期取り込みではこのままキューのメッセージになる）
+        source = {
+            "file_id": file_id,
+            "s3_key": s3_key,
+            "file_name": file_name,
+            "file_extension": file_extension,
+            "content_type": file.content_type,
+            "title": title,
+            "description": description,
+            "uploaded_at": uploaded_at,
+            "user_id": current_user.get("user_id"),
+            "file_size": spooled.size,
+            "content_sha256": spooled.sha256
+        }
         
-        # OpenSearchにもドキュメントを登録（エラーが発生してもアップロード処理は継続）
-        try:
-            opensearch_result = opensearch_service.index_document(
-                doc_id=file_id,
-                title=auto_title,
-                content=formatted_text,
-                user_id=current_user.get("user_id", "anonymous"),
-                file_type=file_extension,
-                uploaded_at=uploaded_at
-            )
-            print(f"OpenSearch登録結果: {opensearch_result}")
-        except Exception as opensearch_error:
-            print(f"OpenSearch登録エラー（無視して処理継続）: {opensearch_error}")
+        if INGEST_MODE == "async":
+            # 原本（保存済み）と処理中のアイテムだけを保存し、抽出・登録は取り込みワーカーに任せる
+            await storage.put_document(create_processing_item(
+                file_id=file_id,
+                s3_key=s3_key,
+                file_name=file_name,
+                file_extension=file_extension,
+                uploaded_at=uploaded_at,
+                title=title,
+                description=description,
+                content_type=file.content_type,
+                user_id=current_user.get("user_id"),
+                file_size=spooled.size,
+                content_sha256=spooled.sha256
+            ))
+            try:
+                await ingest_queue.send(source)
+            except Exception as send_error:
+                # 取り込みを依頼できなかったアイテムは完了しないため削除する（原本への参照はfinallyで取り消す）
+                content_registered = await _discard_unqueued_item(file_id, send_error)
+                raise
+            content_registered = False
+            
+            response.status_code = 202
+            return {
+                "success": True,
+                "file_id": file_id,
+                "status": PROCESSING_STATUS_PROCESSING,
+                "message": "ファイルを受け付けました。テキスト抽出と検索への登録はバックグラウンドで行います",
+                "status_url": f"/files/{file_id}/status"
+            }
+        
+        # ファイルからテキストとメタデータを抽出し、DynamoDB用のアイテムを作成
+        item = await _extract_document(source, spooled.path)
+        
+        await _store_document(item)
+        content_registered = False
         
         return {
             "success": True,
@@ -271,20 +645,266 @@ async def upload_file(
             "metadata": item
         }
         
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ExtractionPoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"アップロード中にエラーが発生しました: {str(e)}")
+    finally:
+        if spooled is not None:
+            await spooled.abort_upload()
+            spooled.cleanup()
+        if content_registered:
+            # アイテムを保存できなかったので原本への参照を取り消す
+            await _release_content(spooled.sha256, s3_key)
+
+
+async def _discard_unqueued_item(file_id: str, send_error: Exception) -> bool:
+    """
+    取り込みキューに送信できなかった処理中のアイテムを削除する
+    
+    削除できなかった場合は失敗として記録する（processingのまま残さない）
+    
+    Returns:
+    --------
+    bool
+        アイテムを削除したかどうか（Trueなら呼び出し元で原本への参照を取り消す）
+    """
+    try:
+        await storage.delete_document(file_id)
+        return True
+    except Exception as delete_error:
+        print(f"処理中アイテムの削除エラー（失敗として記録します）: {delete_error}")
+    try:
+        await storage.update_processing_status(
+            file_id, PROCESSING_STATUS_FAILED, f"取り込みキューへの送信に失敗しました: {send_error}"
+        )
+    except Exception as status_error:
+        print(f"取り込み状態の更新エラー: {status_error}")
+    return False
+
+
+async def _release_content(content_hash: str, s3_key: str) -> None:
+    """
+    ファイルの原本への参照を取り消し、他のファイルから参照されていなければ原本を削除
+    
+    重複排除の導入前に保存したファイルなど、コンテンツインデックスに登録されていない原本はそのまま削除する
+    """
+    try:
+        if content_hash:
+            purged = await content_index.release_and_purge(content_hash, s3_key)
+            if purged is not None:
+                if not purged:
+                    print(f"他のファイルが参照しているため原本を残します: {s3_key}")
+                return
+        await storage.delete_object(s3_key)
+    except Exception as s3_error:
+        print(f"S3削除エラー (継続): {s3_error}")
+
+
+async def _extract_content(source: dict, file_path: Optional[str]) -> tuple:
+    """
+    ファイルからテキストとメタデータを抽出（同じ内容・同じ抽出バージョンの結果がキャッシュにあれば再利用）
+    
+    Parameters:
+    -----------
+    source : dict
+        アップロード時の情報（content_type, s3_key, file_size, content_sha256）
+    file_path : Optional[str]
+        ファイル（一時ファイル）のパス。Noneの場合はキャッシュにないときだけS3の原本をダウンロードする
+    
+    Returns:
+    --------
+    Tuple[str, Dict[str, Any]]
+        (抽出されたテキスト, メタデータ辞書)
+    """
+    content_type = source["content_type"]
+    content_hash = source.get("content_sha256")
+    
+    if content_hash:
+        with metrics.span("upload.extract_cache"):
+            cached = await content_index.get_extraction(content_hash, content_type, source.get("file_size") or 0)
+        if cached is not None:
+            return cached
+    
+    # CPUバウンドな解析は抽出ワーカープロセスで行う
+    if file_path is None:
+        spooled = await spool_from_s3(source["s3_key"])
+        try:
+            extracted_text, file_metadata = await extraction_pool.extract_file(spooled.path, content_type)
+        finally:
+            spooled.cleanup()
+    else:
+        extracted_text, file_metadata = await extraction_pool.extract_file(file_path, content_type)
+    
+    if content_hash and not file_metadata.get("error"):
+        await content_index.put_extraction(content_hash, content_type, extracted_text, file_metadata)
+    return extracted_text, file_metadata
+
+
+async def _extract_document(source: dict, file_path: Optional[str]) -> dict:
+    """
+    ファイルからテキストとメタデータを抽出し、DynamoDB用のアイテムを作成
+    
+    Parameters:
+    -----------
+    source : dict
+        アップロード時の情報（file_id, s3_key, file_name, file_extension, content_type,
+        title, description, uploaded_at, user_id, file_size, content_sha256）
+    file_path : Optional[str]
+        ファイル（一時ファイル）のパス。NoneならS3の原本から抽出する（抽出結果キャッシュにあればダウンロードしない）
+    """
+    content_type = source["content_type"]
+    
+    # ファイルの内容からテキストとメタデータを抽出
+    with metrics.span("upload.extract"):
+        extracted_text, file_metadata = await _extract_content(source, file_path)
+    
+    # 言語フィルター用に本文の言語を判定
+    with metrics.span("upload.detect_language"):
+        language = detect_language(extracted_text)
+    
+    # ファイルタイプに応じてタイトルを生成
+    auto_title = generate_auto_title(
+        source["title"], content_type, extracted_text, file_metadata, source["file_name"]
+    )
+    
+    # AIモデル用にテキストデータを整形
+    metadata_for_ai = create_metadata_for_ai(
+        auto_title, source["description"], source["file_extension"], source["file_name"],
+        source["uploaded_at"], file_metadata
+    )
+    
+    # AI用に整形したテキストを生成
+    with metrics.span("upload.format"):
+        formatted_text = format_for_ai(extracted_text, metadata_for_ai)
+    
+    # DynamoDBにメタデータと整形済みテキストを保存するアイテム
+    return create_dynamodb_item(
+        file_id=source["file_id"], 
+        s3_key=source["s3_key"], 
+        file_name=source["file_name"], 
+        file_extension=source["file_extension"], 
+        uploaded_at=source["uploaded_at"], 
+        auto_title=auto_title, 
+        description=source["description"], 
+        content_type=content_type, 
+        file_metadata=file_metadata, 
+        formatted_text=formatted_text,
+        user_info={"user_id": source["user_id"]},  # 認証必須なので常にユーザー情報あり
+        language=language,
+        file_size=source.get("file_size"),
+        content_sha256=source.get("content_sha256")
+    )
+
+
+async def _store_document(item: dict, require_existing: bool = False) -> bool:
+    """
+    アイテムをDynamoDBに保存してOpenSearchに登録し、キャッシュを無効化
+    
+    require_existingの場合は処理中のアイテムが残っているときだけ保存する（取り込み中に削除されたら何もしない）
+    
+    Returns:
+    --------
+    bool
+        保存したかどうか
+    """
+    # 大きな本文は圧縮してS3に保存し、DynamoDBには参照だけを保存する（OpenSearchには本文ごと登録する）
+    with metrics.span("upload.offload_text"):
+        stored_item = await storage.run(text_store.offload, item)
+    if not await storage.put_document(stored_item, require_existing=require_existing):
+        await storage.run(text_store.delete, stored_item)
+        return False
+    
+    # OpenSearchにもドキュメントを登録（エラーが発生してもアップロード処理は継続）
+    # 検索時にDynamoDBを参照せずに済むよう、レスポンス生成に必要な項目をすべて登録する
+    # （検索に反映されるまで待ち、反映前の古い結果がキャッシュに入らないようにする）
+    try:
+        opensearch_result = await opensearch_service.index_item_async(item, refresh="wait_for")
+        print(f"OpenSearch登録結果: {opensearch_result}")
+    except Exception as opensearch_error:
+        print(f"OpenSearch登録エラー（無視して処理継続）: {opensearch_error}")
+    
+    # 本文をパッセージに分けてパッセージインデックスにも登録（passageモードの検索用）
+    try:
+        with metrics.span("upload.index_passages"):
+            passage_result = await opensearch_service.index_passages_async([item], refresh="wait_for")
+        print(f"パッセージ登録結果: {passage_result}")
+    except Exception as passage_error:
+        print(f"パッセージ登録エラー（無視して処理継続）: {passage_error}")
+    
+    # 新しいドキュメントが検索結果に反映されるよう、登録後に所有者単位でキャッシュを無効化
+    search_cache.invalidate_owner(item.get("user_id"))
+    suggest_cache.invalidate_owner(item.get("user_id"))
+    return True
+
+
+async def _process_ingest_message(source: dict) -> None:
+    """
+    取り込みワーカーの処理：S3の原本からテキストを抽出し、DynamoDBとOpenSearchに登録
+    
+    例外を送出するとキューが再試行する（抽出待ちが上限に達している場合も後で再試行する）
+    """
+    file_id = source["file_id"]
+    
+    if await storage.get_document(file_id) is None:
+        print(f"取り込み対象が削除済みのためスキップ: {file_id}")
+        return
+    
+    item = await _extract_document(source, None)
+    item["processing_status"] = PROCESSING_STATUS_READY
+    
+    if await _store_document(item, require_existing=True):
+        print(f"取り込み完了: {file_id}")
+    else:
+        print(f"取り込み対象が削除済みのためスキップ: {file_id}")
+
+
+async def _mark_ingest_failed(source: dict, error: str) -> None:
+    """再試行上限に達した取り込みを失敗として記録"""
+    await storage.update_processing_status(source["file_id"], PROCESSING_STATUS_FAILED, error)
+
+
+@app.get("/files/{file_id}/status", response_model=dict)
+async def get_file_status(file_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    アップロードしたファイルの取り込み状態を取得します（processing / ready / failed）
+    """
+    item = await storage.get_document(file_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="ファイルが見つかりません")
+    if item.get("user_id") != current_user.get("user_id") and "admin" not in current_user.get("groups", []):
+        raise HTTPException(status_code=403, detail="このファイルを参照する権限がありません")
+    
+    return {
+        "success": True,
+        "file_id": file_id,
+        "status": item.get("processing_status", PROCESSING_STATUS_READY),
+        "error": item.get("processing_error"),
+        "title": item.get("title"),
+        "uploaded_at": item.get("uploaded_at")
+    }
 
 
 @app.post("/search", response_model=SearchResponse)
-async def search_documents(search_request: SearchRequest, current_user: dict = Depends(get_current_user_optional)):
+async def search_documents(search_request: SearchRequest, request: Request, stream: bool = False,
+                           current_user: dict = Depends(get_current_user_optional)):
     """
     保存されたドキュメントを検索します（認証ユーザーのみ）
     
+    Acceptヘッダーがapplication/x-ndjson、またはクエリパラメータstream=trueの場合は
+    1行に1件のDocumentを順にストリーミングし、最終行に{"summary": ...}を返す
+    
     Parameters:
     -----------
     search_request : SearchRequest
         検索リクエスト（query: 検索語句, language: 言語コード, max_results: 最大結果数, user_only: ユーザー固有検索）
+    stream : bool
+        NDJSONでストリーミングするかどうか
     
     Returns:
     --------
@@ -292,88 +912,26 @@ async def search_documents(search_request: SearchRequest, current_user: dict = D
         検索結果
     """
     try:
-        # バリデーション
-        if not search_request.query.strip():
-            raise HTTPException(status_code=400, detail="検索クエリが空です")
-        
-        if search_request.max_results < 1 or search_request.max_results > 50:
-            raise HTTPException(status_code=400, detail="max_resultsは1〜50の範囲で指定してください")
+        prepared = _prepare_search(search_request, current_user)
         
-        # ユーザー固有の検索かどうかを判定
-        user_id = None
-        if search_request.user_only:
-            user_id = current_user.get("user_id") if current_user else None  # 認証オプションなのでcurrent_userがNoneの可能性あり
-        
-        # OpenSearchで検索を試行（フォールバック付き）
-        search_results = []
-        opensearch_success = False
-        
-        try:
-            # OpenSearchが利用可能かチェック
-            if opensearch_service.health_check():
-                print("OpenSearchで検索実行中...")
-                opensearch_response = opensearch_service.search(
-                    query=search_request.query,
-                    user_id=user_id,
-                    size=search_request.max_results
-                )
-                
-                if "error" not in opensearch_response and "hits" in opensearch_response:
-                    # OpenSearchの結果をDynamoDBフォーマットに変換
-                    for hit in opensearch_response["hits"]["hits"][:search_request.max_results]:
-                        source = hit["_source"]
-                        # OpenSearchからDynamoDBの詳細データを取得
-                        try:
-                            dynamodb_item = aws_services.get_dynamodb_table().get_item(
-                                Key={"id": hit["_id"]}
-                            ).get("Item")
-                            if dynamodb_item:
-                                search_results.append(dynamodb_item)
-                        except Exception as db_error:
-                            print(f"DynamoDB取得エラー: {db_error}")
-                            continue
-                    
-                    opensearch_success = True
-                    print(f"OpenSearch検索成功: {len(search_results)}件")
-                else:
-                    print(f"OpenSearch応答エラー: {opensearch_response}")
-            else:
-                print("OpenSearchヘルスチェック失敗")
-        except Exception as opensearch_error:
-            print(f"OpenSearch検索エラー: {opensearch_error}")
-        
-        # OpenSearchが失敗した場合はDynamoDBフォールバック
-        if not opensearch_success:
-            print("DynamoDBフォールバック検索実行中...")
-            search_results = aws_services.search_documents(
-                query=search_request.query,
-                max_results=search_request.max_results,
-                user_id=user_id
+        if stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+            return StreamingResponse(
+                _stream_search(search_request, prepared, current_user),
+                media_type=NDJSON_MEDIA_TYPE
             )
         
-        # 言語フィルタリング（指定されている場合）
-        if search_request.language and search_request.language != "en":
-            filtered_results = [
-                result for result in search_results 
-                if result.get('language', 'en') == search_request.language
-            ]
-            search_results = filtered_results
+        # キャッシュを確認し、なければバックエンドで検索
+        with metrics.span("search.cache"):
+            search_page = search_cache.get(prepared["cache_key"])
+        if search_page is None:
+            search_page = await _execute_search(
+                search_request, prepared["user_id"], prepared["fingerprint"], prepared["cursor_state"]
+            )
+            search_cache.set(prepared["cache_key"], search_page, scope_user_id=prepared["user_id"])
+        search_results = search_page["results"]
         
         # Documentモデルに変換
-        results = []
-        for result in search_results:
-            document = Document(
-                id=result['id'],  # 正確なフィールド名
-                s3_key=result['s3_key'],
-                file_name=result['file_name'],
-                file_type=result['file_type'],
-                formatted_text=result['formatted_text'],
-                uploaded_at=result['uploaded_at'],
-                title=result['title'],
-                description=result['description'],
-                extracted_metadata=result['extracted_metadata']
-            )
-            results.append(document)
+        results = [_to_document(result) for result in search_results]
         
         # 🎯 アクセス履歴記録（非同期・ノンブロッキング）
         if current_user and search_results:
@@ -381,7 +939,7 @@ async def search_documents(search_request: SearchRequest, current_user: dict = D
                 accessing_user_id = current_user.get("user_id")
                 if accessing_user_id:
                     # バックグラウンドでアクセス記録（エラーが発生しても検索レスポンスには影響しない）
-                    access_logger_service.log_search_access(
+                    await storage.log_search_access(
                         accessed_documents=search_results,
                         accessing_user_id=accessing_user_id,
                         search_query=search_request.query
@@ -393,7 +951,9 @@ async def search_documents(search_request: SearchRequest, current_user: dict = D
             success=True,
             query=search_request.query,
             total_results=len(results),
-            results=results
+            results=results,
+            next_cursor=search_page.get("next_cursor"),
+            query_tier=search_page.get("query_tier")
         )
         
     except HTTPException:
@@ -403,13 +963,683 @@ async def search_documents(search_request: SearchRequest, current_user: dict = D
         print(f"Search Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"検索中にエラーが発生しました: {str(e)}")
 
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_documents_batch(batch_request: BatchSearchRequest,
+                                 current_user: dict = Depends(get_current_user_optional)):
+    """
+    複数の検索をまとめて実行します（ダッシュボードやプロンプト生成などの一括検索用）
+    
+    OpenSearchへの検索は_msearchの1リクエストにまとめ、DynamoDBでの補完も全検索分を
+    重複を除いて1回で行う。検索ごとの失敗はその検索のerrorとして返し、他の検索は継続する
+    
+    Parameters:
+    -----------
+    batch_request : BatchSearchRequest
+        検索リクエストのリスト（各要素は/searchと同じ形式）
+    
+    Returns:
+    --------
+    BatchSearchResponse
+        検索ごとの結果（リクエストと同じ順序）
+    """
+    if not batch_request.searches:
+        raise HTTPException(status_code=400, detail="検索リクエストが空です")
+    if len(batch_request.searches) > SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"一括検索は最大{SEARCH_BATCH_MAX_QUERIES}件まで指定できます"
+        )
+    
+    try:
+        entries = []
+        for search_request in batch_request.searches:
+            entry = {"request": search_request, "page": None, "error": None}
+            try:
+                entry.update(_prepare_search(search_request, current_user))
+                entry["page"] = search_cache.get(entry["cache_key"])
+            except HTTPException as validation_error:
+                entry["error"] = validation_error.detail
+            entries.append(entry)
+        
+        # キャッシュになかった検索のうち、OpenSearchで実行できるものを_msearchでまとめて実行
+        pending = [entry for entry in entries if entry["error"] is None and entry["page"] is None]
+        opensearch_entries = [
+            entry for entry in pending
+            if (entry["cursor_state"] is None or entry["cursor_state"]["b"] == BACKEND_OPENSEARCH)
+            and entry["request"].search_mode != SEARCH_MODE_PASSAGE
+        ]
+        if opensearch_entries and opensearch_service.health.allow_request():
+            print(f"OpenSearchで一括検索実行中... ({len(opensearch_entries)}件)")
+            responses = await opensearch_service.msearch_async([
+                _opensearch_search_args(entry["request"], entry["user_id"], entry["cursor_state"])
+                for entry in opensearch_entries
+            ])
+            
+            succeeded = []
+            for entry, opensearch_response in zip(opensearch_entries, responses):
+                if "error" not in opensearch_response and "hits" in opensearch_response:
+                    entry["response"] = opensearch_response
+                    succeeded.append(entry)
+                else:
+                    print(f"OpenSearch応答エラー: {opensearch_response.get('error')}")
+            
+            # 全検索のヒットをまとめてレコード化（DynamoDBでの補完は1回のBatchGetItemに集約）
+            hit_groups = [
+                (entry["response"]["hits"]["hits"][:entry["request"].max_results], entry["request"].include_content)
+                for entry in succeeded
+            ]
+            finished_pits = []
+            for entry, (hits, _), records in zip(succeeded, hit_groups, await _records_from_hit_groups(hit_groups)):
+                pit_id = entry["cursor_state"].get("pit") if entry["cursor_state"] else None
+                pit_id = entry["response"].get("pit_id", pit_id)
+                entry["page"] = _opensearch_page(
+                    entry["request"], entry["fingerprint"], hits, records, pit_id,
+                    entry["response"].get("query_tier")
+                )
+                finished_pits.append(_close_finished_pit(entry["page"], pit_id))
+            await asyncio.gather(*finished_pits)
+        
+        # passageモードの検索とOpenSearchで取得できなかった検索は個別に検索
+        for entry in pending:
+            if entry["page"] is not None:
+                continue
+            search_function = (
+                _execute_passage_search if entry["request"].search_mode == SEARCH_MODE_PASSAGE
+                else _execute_fallback_search
+            )
+            try:
+                entry["page"] = await search_function(
+                    entry["request"], entry["user_id"], entry["fingerprint"], entry["cursor_state"]
+                )
+            except HTTPException as search_error:
+                entry["error"] = search_error.detail
+        
+        for entry in pending:
+            if entry["page"] is not None:
+                search_cache.set(entry["cache_key"], entry["page"], scope_user_id=entry["user_id"])
+        
+        # アクセス履歴は一括検索全体で1回の一括書き込みにまとめる
+        accessing_user_id = current_user.get("user_id") if current_user else None
+        if accessing_user_id:
+            try:
+                await storage.log_search_access_batch(
+                    accessing_user_id,
+                    [
+                        (entry["request"].query, entry["page"]["results"])
+                        for entry in entries if entry["page"] and entry["page"]["results"]
+                    ]
+                )
+            except Exception as log_error:
+                print(f"アクセス記録エラー（無視して処理継続）: {log_error}")
+        
+        responses = []
+        for entry in entries:
+            if entry["page"] is None:
+                responses.append(BatchSearchResult(
+                    success=False,
+                    query=entry["request"].query,
+                    error=entry["error"]
+                ))
+                continue
+            results = [_to_document(result) for result in entry["page"]["results"]]
+            responses.append(BatchSearchResult(
+                success=True,
+                query=entry["request"].query,
+                total_results=len(results),
+                results=results,
+                next_cursor=entry["page"].get("next_cursor"),
+                query_tier=entry["page"].get("query_tier")
+            ))
+        
+        return BatchSearchResponse(
+            success=True,
+            total_queries=len(responses),
+            failed_queries=sum(1 for response in responses if not response.success),
+            responses=responses
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Batch Search Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"一括検索中にエラーが発生しました: {str(e)}")
+
+
+async def _stream_search(search_request: SearchRequest, prepared: dict, current_user: Optional[dict]):
+    """
+    検索結果をNDJSONで1件ずつ返すジェネレーター
+    
+    レスポンス全体を組み立てずに1件ずつシリアライズして送り出し、最終行に件数と
+    次ページのカーソルを含むsummaryレコードを返す（途中で失敗した場合はsummaryにerrorを含める）。
+    OpenSearchのヒットはSEARCH_STREAM_HYDRATE_BATCH件ずつ補完し、補完できた分から順に送り出す
+    （ページ全体のレコードを保持しないため、キャッシュにあるページのみ使い、検索結果はキャッシュしない）
+    """
+    sent_results = []
+    try:
+        with metrics.span("search.cache"):
+            search_page = search_cache.get(prepared["cache_key"])
+        if search_page is None:
+            search_page = await _execute_search(
+                search_request, prepared["user_id"], prepared["fingerprint"], prepared["cursor_state"],
+                hydrate=False
+            )
+        
+        hits = search_page.get("hits")
+        if hits is None:
+            for result in search_page["results"]:
+                yield _ndjson_line(_to_document(result))
+                sent_results.append(result)
+        else:
+            for start in range(0, len(hits), SEARCH_STREAM_HYDRATE_BATCH):
+                batch = hits[start:start + SEARCH_STREAM_HYDRATE_BATCH]
+                for result in await _records_from_hits(batch, search_request.include_content):
+                    yield _ndjson_line(_to_document(result))
+                    sent_results.append(result)
+        
+        summary = {
+            "success": True,
+            "query": search_request.query,
+            "total_results": len(sent_results),
+            "next_cursor": search_page.get("next_cursor"),
+            "query_tier": search_page.get("query_tier")
+        }
+    except Exception as e:
+        print(f"Search Stream Error: {str(e)}")
+        detail = e.detail if isinstance(e, HTTPException) else f"検索中にエラーが発生しました: {str(e)}"
+        summary = {"success": False, "query": search_request.query, "total_results": len(sent_results), "error": detail}
+    
+    yield _ndjson_line({"summary": summary})
+    
+    # 🎯 アクセス履歴記録（送信し終えた結果のみ）
+    accessing_user_id = current_user.get("user_id") if current_user else None
+    if accessing_user_id and sent_results:
+        try:
+            await storage.log_search_access(
+                accessed_documents=sent_results,
+                accessing_user_id=accessing_user_id,
+                search_query=search_request.query
+            )
+        except Exception as log_error:
+            print(f"アクセス記録エラー（無視して処理継続）: {log_error}")
+
+
+def _ndjson_line(value) -> bytes:
+    """NDJSONの1行を作成"""
+    return (json.dumps(jsonable_encoder(value), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@app.get("/search/suggest", response_model=SuggestResponse)
+async def suggest_titles(q: str, size: int = 5, user_only: bool = False,
+                         current_user: dict = Depends(get_current_user_optional)):
+    """
+    入力中の文字列からタイトルの候補を返します（検索ボックスの入力補完用）
+    
+    titleのsearch_as_you_typeサブフィールドに対する軽量なプレフィックス検索で、IDとタイトルのみを返す。
+    DynamoDBは参照せず、同じ入力はプロセス内のプレフィックスキャッシュから返す
+    
+    Parameters:
+    -----------
+    q : str
+        入力中の文字列
+    size : int
+        返す候補数（1〜20）
+    user_only : bool
+        自分のファイルのみを候補にするかどうか
+    """
+    prefix = q.strip()
+    if not prefix:
+        raise HTTPException(status_code=400, detail="入力文字列が空です")
+    if len(prefix) > 100:
+        raise HTTPException(status_code=400, detail="入力文字列は100文字以内で指定してください")
+    if size < 1 or size > 20:
+        raise HTTPException(status_code=400, detail="sizeは1〜20の範囲で指定してください")
+    
+    user_id = current_user.get("user_id") if user_only and current_user else None
+    cache_key = suggest_cache.make_key(
+        query=prefix,
+        user_only=user_only,
+        user_id=user_id,
+        language=None,
+        max_results=size
+    )
+    cached = suggest_cache.get(cache_key)
+    if cached is not None:
+        return SuggestResponse(success=True, query=prefix, suggestions=cached["results"])
+    
+    # OpenSearchが使えない間は候補なしで返す（入力補完のためにDynamoDBはスキャンしない）
+    if not opensearch_service.health.allow_request():
+        return SuggestResponse(success=True, query=prefix, suggestions=[])
+    
+    response = await opensearch_service.suggest_async(prefix, user_id, size, timeout=SUGGEST_TIMEOUT)
+    if "error" in response or "hits" not in response:
+        print(f"入力補完応答エラー: {response.get('error')}")
+        return SuggestResponse(success=True, query=prefix, suggestions=[])
+    
+    # 無効化用に所有者IDも保持する（レスポンスにはIDとタイトルのみ含める）
+    results = [
+        {
+            "id": hit["_id"],
+            "title": hit.get("_source", {}).get("title", ""),
+            "user_id": hit.get("_source", {}).get("user_id")
+        }
+        for hit in response["hits"]["hits"]
+    ]
+    suggest_cache.set(cache_key, {"results": results}, scope_user_id=user_id)
+    return SuggestResponse(success=True, query=prefix, suggestions=results)
+
+
+def _prepare_search(search_request: SearchRequest, current_user: Optional[dict]) -> dict:
+    """
+    検索リクエストを検証し、検索範囲・カーソル・キャッシュキーを求める
+    
+    Raises:
+    -------
+    HTTPException
+        リクエストまたはカーソルが不正な場合（400）
+    
+    Returns:
+    --------
+    dict
+        {"user_id": 検索範囲のユーザーID, "fingerprint", "cursor_state", "cache_key"}
+    """
+    # バリデーション
+    if not search_request.query.strip():
+        raise HTTPException(status_code=400, detail="検索クエリが空です")
+    
+    if search_request.max_results < 1 or search_request.max_results > 50:
+        raise HTTPException(status_code=400, detail="max_resultsは1〜50の範囲で指定してください")
+    
+    search_mode = search_request.search_mode or SEARCH_MODE_DOCUMENT
+    if search_mode not in (SEARCH_MODE_DOCUMENT, SEARCH_MODE_PASSAGE):
+        raise HTTPException(status_code=400, detail="search_modeはdocumentまたはpassageを指定してください")
+    if search_mode == SEARCH_MODE_PASSAGE:
+        if not PASSAGE_INDEX_ENABLED:
+            raise HTTPException(status_code=400, detail="パッセージ検索は無効です")
+        passages = search_request.passages_per_document or SEARCH_PASSAGES_PER_DOCUMENT
+        if passages < 1 or passages > SEARCH_PASSAGES_MAX:
+            raise HTTPException(
+                status_code=400,
+                detail=f"passages_per_documentは1〜{SEARCH_PASSAGES_MAX}の範囲で指定してください"
+            )
+    
+    # ユーザー固有の検索かどうかを判定
+    user_id = None
+    if search_request.user_only:
+        user_id = current_user.get("user_id") if current_user else None  # 認証オプションなのでcurrent_userがNoneの可能性あり
+    
+    # カーソル指定時は続きのページを取得（別の検索条件で発行されたカーソルは拒否）
+    fingerprint = query_fingerprint(
+        search_request.query, user_id, search_request.language,
+        search_mode if search_mode != SEARCH_MODE_DOCUMENT else None
+    )
+    cursor_state = None
+    if search_request.cursor:
+        try:
+            cursor_state = decode_cursor(search_request.cursor, fingerprint)
+        except InvalidCursorError as cursor_error:
+            raise HTTPException(status_code=400, detail=str(cursor_error))
+    
+    cache_key = search_cache.make_key(
+        query=search_request.query,
+        user_only=search_request.user_only,
+        user_id=current_user.get("user_id") if current_user else None,
+        language=search_request.language,
+        max_results=search_request.max_results,
+        include_content=search_request.include_content,
+        cursor=search_request.cursor or "",
+        search_mode=search_mode,
+        passages_per_document=search_request.passages_per_document
+    )
+    return {
+        "user_id": user_id,
+        "fingerprint": fingerprint,
+        "cursor_state": cursor_state,
+        "cache_key": cache_key
+    }
+
+
+def _to_document(result: dict) -> Document:
+    """検索結果レコードをDocumentモデルに変換"""
+    return Document(
+        id=result['id'],  # 正確なフィールド名
+        s3_key=result['s3_key'],
+        file_name=result['file_name'],
+        file_type=result['file_type'],
+        formatted_text=result['formatted_text'],
+        uploaded_at=result['uploaded_at'],
+        title=result['title'],
+        description=result['description'],
+        extracted_metadata=result['extracted_metadata'],
+        language=result.get('language'),
+        passages=result.get('passages')
+    )
+
+
+async def _execute_search(search_request: SearchRequest, user_id: Optional[str],
+                          fingerprint: str, cursor_state: Optional[dict] = None,
+                          hydrate: bool = True) -> dict:
+    """
+    OpenSearchで検索し、失敗時はローカル検索インデックス、それも使えなければDynamoDBフォールバックで検索する
+    
+    カーソル指定時は、カーソルを発行したバックエンドで続きのページを取得する
+    （OpenSearchはsearch_after、ローカルインデックスはオフセット、DynamoDBは各スキャンセグメントのExclusiveStartKey）
+    
+    Parameters:
+    -----------
+    hydrate : bool
+        Falseの場合、OpenSearchのヒットはレコードに変換せず"hits"として返す（ストリーミング検索で少しずつ補完する）
+    
+    Returns:
+    --------
+    dict
+        {"results": レスポンス用レコードのリスト（検索順位順）, "next_cursor": 次ページのカーソル}
+    """
+    if search_request.search_mode == SEARCH_MODE_PASSAGE:
+        return await _execute_passage_search(search_request, user_id, fingerprint, cursor_state)
+    
+    cursor_backend = cursor_state["b"] if cursor_state else None
+    # このリクエストで作成したPoint-in-Time（検索に失敗した場合に削除する）
+    opened_pit_id = None
+    
+    try:
+        # 共有ヘルス状態（サーキットブレーカー）で利用可否を判定（リクエストごとのプローブは行わない）
+        if cursor_backend in (BACKEND_DYNAMODB, BACKEND_LOCAL):
+            print(f"{cursor_backend}カーソルのため、同じバックエンドで続きを検索")
+        elif opensearch_service.health.allow_request():
+            print("OpenSearchで検索実行中...")
+            search_args = _opensearch_search_args(search_request, user_id, cursor_state)
+            if cursor_state is None and SEARCH_CURSOR_USE_PIT:
+                # 最初のページでPoint-in-Timeを作成し、以降のページは同じスナップショットを参照する
+                opened_pit_id = await opensearch_service.open_point_in_time_async(SEARCH_CURSOR_KEEP_ALIVE)
+                search_args["pit_id"] = opened_pit_id
+            
+            opensearch_response = await opensearch_service.search_async(**search_args)
+            
+            if "error" not in opensearch_response and "hits" in opensearch_response:
+                hits = opensearch_response["hits"]["hits"][:search_request.max_results]
+                pit_id = opensearch_response.get("pit_id", search_args["pit_id"])
+                search_page = _opensearch_page(
+                    search_request, fingerprint, hits,
+                    await _records_from_hits(hits, search_request.include_content) if hydrate else [],
+                    pit_id,
+                    opensearch_response.get("query_tier")
+                )
+                if not hydrate:
+                    search_page["hits"] = hits
+                opened_pit_id = None
+                await _close_finished_pit(search_page, pit_id)
+                print(f"OpenSearch検索成功: {len(hits)}件")
+                return search_page
+            else:
+                print(f"OpenSearch応答エラー: {opensearch_response}")
+        else:
+            print("OpenSearchサーキットブレーカー遮断中: DynamoDBフォールバックへ切り替え")
+    except Exception as opensearch_error:
+        print(f"OpenSearch検索エラー: {opensearch_error}")
+    
+    if opened_pit_id:
+        # 最初のページの検索に失敗したため、作成したPoint-in-Timeは使われない
+        await opensearch_service.close_point_in_time_async(opened_pit_id)
+    return await _execute_fallback_search(search_request, user_id, fingerprint, cursor_state)
+
+
+async def _close_finished_pit(search_page: dict, pit_id: Optional[str]) -> None:
+    """
+    最後のページを返す場合はPoint-in-Timeを削除する
+    （続きのページがあればカーソルが参照する。取得されなかったカーソルのPITはkeep_aliveで期限切れになる）
+    """
+    if pit_id and search_page["next_cursor"] is None:
+        await opensearch_service.close_point_in_time_async(pit_id)
+
+
+async def _execute_passage_search(search_request: SearchRequest, user_id: Optional[str],
+                                  fingerprint: str, cursor_state: Optional[dict] = None) -> dict:
+    """
+    passageモードの検索：パッセージインデックスを検索し、ドキュメントごとに上位パッセージをまとめて返す
+    
+    OpenSearchのカーソルはドキュメント単位のオフセットを保持する。OpenSearchを使えない場合は
+    ドキュメント単位のフォールバック検索の結果から、本文を分割してクエリの語を多く含むパッセージを選ぶ
+    """
+    passages_per_document = search_request.passages_per_document or SEARCH_PASSAGES_PER_DOCUMENT
+    cursor_backend = cursor_state["b"] if cursor_state else None
+    
+    if cursor_backend in (None, BACKEND_OPENSEARCH) and opensearch_service.health.allow_request():
+        print("OpenSearchでパッセージ検索実行中...")
+        offset = cursor_state.get("o", 0) if cursor_state else 0
+        response = await opensearch_service.search_passages_async(
+            query=search_request.query,
+            user_id=user_id,
+            size=search_request.max_results,
+            passages_per_document=passages_per_document,
+            offset=offset,
+            language=search_request.language
+        )
+        if "error" not in response and "hits" in response:
+            hits = response["hits"]["hits"][:search_request.max_results]
+            next_cursor = None
+            if len(hits) == search_request.max_results:
+                next_cursor = encode_cursor(BACKEND_OPENSEARCH, fingerprint, o=offset + len(hits))
+            print(f"パッセージ検索成功: {len(hits)}件")
+            return {
+                "results": [opensearch_service.record_from_passage_hit(hit) for hit in hits],
+                "next_cursor": next_cursor
+            }
+        print(f"パッセージ検索応答エラー: {response.get('error')}")
+    
+    # フォールバック検索は本文を読み込み、レスポンスにはパッセージだけを含める
+    search_page = await _execute_fallback_search(
+        search_request, user_id, fingerprint, cursor_state, include_content=True
+    )
+    results = []
+    for result in search_page["results"]:
+        passages = select_passages(
+            extract_content_section(result.get("formatted_text", "")), search_request.query,
+            PASSAGE_CHARS, PASSAGE_OVERLAP, passages_per_document
+        )
+        results.append({
+            **result,
+            "formatted_text": "",
+            "extracted_metadata": {},
+            "passages": [{"id": f"{result['id']}:{passage['ordinal']}", **passage} for passage in passages]
+        })
+    return {"results": results, "next_cursor": search_page["next_cursor"]}
+
+
+def _opensearch_search_args(search_request: SearchRequest, user_id: Optional[str],
+                            cursor_state: Optional[dict] = None) -> dict:
+    """OpenSearchの検索引数を作成（OpenSearchのカーソルならsearch_after・PIT・検索段を引き継ぐ）"""
+    return {
+        "query": search_request.query,
+        "user_id": user_id,
+        "size": search_request.max_results,
+        "include_content": search_request.include_content,
+        "search_after": cursor_state.get("sa") if cursor_state else None,
+        "pit_id": cursor_state.get("pit") if cursor_state else None,
+        "keep_alive": SEARCH_CURSOR_KEEP_ALIVE,
+        "language": search_request.language,
+        "tier": cursor_state.get("t") if cursor_state else None
+    }
+
+
+def _opensearch_page(search_request: SearchRequest, fingerprint: str, hits: list,
+                     records: list, pit_id: Optional[str] = None,
+                     query_tier: Optional[str] = None) -> dict:
+    """OpenSearchのヒットとレコードから検索結果ページを作成"""
+    next_cursor = None
+    # ページが埋まった場合のみ、最後のヒットのソート値から次ページのカーソルを発行
+    # （続きのページも同じ検索段で取得し、スコアの基準を揃える）
+    if len(hits) == search_request.max_results and hits[-1].get("sort"):
+        next_cursor = encode_cursor(
+            BACKEND_OPENSEARCH,
+            fingerprint,
+            sa=hits[-1]["sort"],
+            pit=pit_id,
+            t=query_tier
+        )
+    return {"results": records, "next_cursor": next_cursor, "query_tier": query_tier}
+
+
+@metrics.timed("search.fallback")
+async def _execute_fallback_search(search_request: SearchRequest, user_id: Optional[str],
+                             fingerprint: str, cursor_state: Optional[dict] = None,
+                             include_content: Optional[bool] = None) -> dict:
+    """
+    OpenSearchを使えない場合の検索（ローカル検索インデックス、使えなければDynamoDBフォールバック）
+    
+    include_contentを指定するとリクエストの指定に代えて使う（passageモードは本文を読み込んで分割する）
+    
+    Raises:
+    -------
+    HTTPException
+        カーソルを発行したバックエンドが使えず、続きのページを取得できない場合（503）
+    """
+    search_results = []
+    next_cursor = None
+    cursor_backend = cursor_state["b"] if cursor_state else None
+    if include_content is None:
+        include_content = search_request.include_content
+    
+    # OpenSearchのカーソルはDynamoDBでは続きを取得できない
+    if cursor_backend == BACKEND_OPENSEARCH:
+        raise HTTPException(
+            status_code=503,
+            detail="検索エンジンが一時的に利用できません。最初のページから検索し直してください"
+        )
+    
+    # OpenSearchが失敗した場合はローカル検索インデックスで検索（DynamoDBカーソルの続きを除く）
+    local_success = False
+    if cursor_backend != BACKEND_DYNAMODB and local_search_index.ready:
+        try:
+            offset = cursor_state.get("o", 0) if cursor_backend == BACKEND_LOCAL else 0
+            local_response = local_search_index.search(
+                query=search_request.query,
+                user_id=user_id,
+                size=search_request.max_results,
+                offset=offset,
+                include_content=include_content,
+                language=search_request.language
+            )
+            search_results = local_response["results"]
+            next_offset = offset + len(search_results)
+            if next_offset < local_response["total"]:
+                next_cursor = encode_cursor(BACKEND_LOCAL, fingerprint, o=next_offset)
+            local_success = True
+            print(f"ローカルインデックス検索成功: {len(search_results)}件 / {local_response['took_ms']}ms")
+        except Exception as local_error:
+            print(f"ローカルインデックス検索エラー: {local_error}")
+    
+    if local_success:
+        return {"results": search_results, "next_cursor": next_cursor}
+    
+    if cursor_backend == BACKEND_LOCAL:
+        raise HTTPException(
+            status_code=503,
+            detail="ローカル検索インデックスが利用できません。最初のページから検索し直してください"
+        )
+    
+    # ローカル検索インデックスも使えない場合はDynamoDBフォールバック
+    print("DynamoDBフォールバック検索実行中...")
+    fallback = await storage.parallel_scan_search(
+        query=search_request.query,
+        max_results=search_request.max_results,
+        user_id=user_id,
+        segment_states=cursor_state.get("segs") if cursor_state else None,
+        language=search_request.language
+    )
+    search_results = fallback["results"]
+    if fallback["next_segment_states"]:
+        next_cursor = encode_cursor(BACKEND_DYNAMODB, fingerprint, segs=fallback["next_segment_states"])
+    
+    # 本文が不要な場合はDynamoDBフォールバック結果もプレビューに置き換える（S3に保存した本文は読み込まない）
+    if include_content:
+        search_results = await text_store.hydrate(search_results)
+    else:
+        search_results = [
+            {**text_store.strip(result), "formatted_text": result.get("preview", "")}
+            for result in search_results
+        ]
+    
+    return {"results": search_results, "next_cursor": next_cursor}
+
+
+async def _records_from_hits(hits: list, include_content: bool = True) -> list:
+    """
+    OpenSearchのヒットからレスポンス用レコードを作成する
+    
+    _sourceにレスポンス項目がそろっているヒットはそのまま使い、拡張マッピング導入前の
+    ドキュメントのみBatchGetItemでDynamoDBから補完する（OpenSearchの順位を維持）
+    """
+    return (await _records_from_hit_groups([(hits, include_content)]))[0]
+
+
+@metrics.timed("search.hydrate")
+async def _records_from_hit_groups(hit_groups: list) -> list:
+    """
+    複数検索のヒットからレスポンス用レコードを作成する（一括検索用）
+    
+    DynamoDBでの補完が必要なドキュメントは全検索分の重複を除いて1回のBatchGetItemで取得する
+    
+    Parameters:
+    -----------
+    hit_groups : list
+        (ヒットのリスト, include_content) のリスト
+    
+    Returns:
+    --------
+    list
+        検索ごとのレコードのリスト（各検索内はOpenSearchの順位順）
+    """
+    group_records = []
+    missing_ids = []
+    needs_content = False
+    
+    for hits, include_content in hit_groups:
+        records_by_id = {}
+        for hit in hits:
+            record = opensearch_service.record_from_hit(hit) if SEARCH_SOURCE_MODE == "source" else None
+            if record:
+                records_by_id[hit["_id"]] = record
+            else:
+                missing_ids.append(hit["_id"])
+                needs_content = needs_content or include_content
+        group_records.append(records_by_id)
+    
+    if missing_ids:
+        fields = DOCUMENT_RESPONSE_FIELDS if needs_content else [
+            field for field in DOCUMENT_RESPONSE_FIELDS
+            if field != "formatted_text" and field not in TEXT_POINTER_FIELDS
+        ]
+        hydrated = {item["id"]: item for item in await storage.batch_get_documents(missing_ids, fields)}
+        # S3に保存した本文は本文を返す検索で使うドキュメントの分だけ読み込む
+        content_ids = {
+            hit["_id"] for (hits, include_content), records_by_id in zip(hit_groups, group_records)
+            if include_content for hit in hits if hit["_id"] not in records_by_id
+        }
+        for item in await text_store.hydrate([item for doc_id, item in hydrated.items() if doc_id in content_ids]):
+            hydrated[item["id"]] = item
+        for (hits, include_content), records_by_id in zip(hit_groups, group_records):
+            for hit in hits:
+                item = hydrated.get(hit["_id"])
+                if hit["_id"] in records_by_id or item is None:
+                    continue
+                if not include_content:
+                    item = {**text_store.strip(item), "formatted_text": opensearch_service.snippet_from_hit(hit)}
+                records_by_id[hit["_id"]] = item
+    
+    return [
+        [records_by_id[hit["_id"]] for hit in hits if hit["_id"] in records_by_id]
+        for (hits, _), records_by_id in zip(hit_groups, group_records)
+    ]
+
+
 @app.get("/debug/scan-all")
 async def debug_scan_all():
     """
     デバッグ用：DynamoDBの全データをスキャンして構造を確認
     """
     try:
-        response = aws_services.get_dynamodb_table().scan()
+        response = await storage.documents.scan()
         items = response.get('Items', [])
         
         return {
@@ -429,11 +1659,7 @@ async def get_user_files(current_user: dict = Depends(get_current_user)):
         user_id = current_user.get("user_id")
         
         # ユーザーのファイルを検索
-        response = aws_services.get_dynamodb_table().scan(
-            FilterExpression=Attr('user_id').eq(user_id)
-        )
-        
-        files = response.get('Items', [])
+        files = await storage.list_user_documents(user_id)
         
         # ファイル情報を整形
         file_list = []
@@ -445,7 +1671,8 @@ async def get_user_files(current_user: dict = Depends(get_current_user)):
                 "file_type": file_item["file_type"],
                 "uploaded_at": file_item["uploaded_at"],
                 "description": file_item.get("description", ""),
-                "s3_key": file_item["s3_key"]
+                "s3_key": file_item["s3_key"],
+                "status": file_item.get("processing_status", PROCESSING_STATUS_READY)
             }
             file_list.append(file_info)
         
@@ -472,11 +1699,7 @@ async def get_user_stats(current_user: dict = Depends(get_current_user)):
         user_id = current_user.get("user_id")
         
         # ユーザーのファイルを検索
-        response = aws_services.get_dynamodb_table().scan(
-            FilterExpression=Attr('user_id').eq(user_id)
-        )
-        
-        files = response.get('Items', [])
+        files = await storage.list_user_documents(user_id)
         
         # 統計を計算
         total_files = len(files)
@@ -488,9 +1711,8 @@ async def get_user_stats(current_user: dict = Depends(get_current_user)):
             file_type = file_item.get("file_type", "unknown")
             file_types[file_type] = file_types.get(file_type, 0) + 1
             
-            # テキスト長の統計
-            formatted_text = file_item.get("formatted_text", "")
-            total_text_length += len(formatted_text)
+            # テキスト長の統計（S3に保存した本文は読み込まず、保存時の文字数を使う）
+            total_text_length += text_store.text_length(file_item)
         
         return {
             "success": True,
@@ -516,35 +1738,41 @@ async def delete_user_file(file_id: str, current_user: dict = Depends(get_curren
         user_id = current_user.get("user_id")
         
         # ファイルの所有者確認
-        response = aws_services.get_dynamodb_table().get_item(
-            Key={'id': file_id}
-        )
+        file_item = await storage.get_document(file_id)
         
-        if 'Item' not in response:
+        if file_item is None:
             raise HTTPException(status_code=404, detail="ファイルが見つかりません")
-        
-        file_item = response['Item']
+
         file_user_id = file_item.get('user_id')
         
         # 所有者チェック
         if file_user_id != user_id:
             raise HTTPException(status_code=403, detail="このファイルを削除する権限がありません")
         
-        # S3からファイルを削除
+        # S3からファイルを削除（同じ内容の他のファイルと共有している原本は最後の1件の削除時に消す）
         s3_key = file_item.get('s3_key')
         if s3_key:
-            try:
-                aws_services.get_s3_client().delete_object(
-                    Bucket=S3_BUCKET_NAME,
-                    Key=s3_key
-                )
-            except Exception as s3_error:
-                print(f"S3削除エラー (継続): {s3_error}")
+            await _release_content(file_item.get('content_sha256'), s3_key)
+        
+        # S3に保存した整形済みテキストを削除
+        try:
+            await storage.run(text_store.delete, file_item)
+        except Exception as s3_error:
+            print(f"S3削除エラー (継続): {s3_error}")
         
         # DynamoDBからレコードを削除
-        aws_services.get_dynamodb_table().delete_item(
-            Key={'id': file_id}
-        )
+        await storage.delete_document(file_id)
+        
+        # OpenSearchからも削除（_sourceから検索結果を返すため、残っていると削除済みファイルがヒットする）
+        try:
+            await opensearch_service.delete_document_async(file_id, refresh="wait_for")
+            await opensearch_service.delete_passages_async(file_id, refresh=True)
+        except Exception as opensearch_error:
+            print(f"OpenSearch削除エラー (継続): {opensearch_error}")
+        
+        # 削除したドキュメントを含むキャッシュ結果を無効化
+        search_cache.invalidate_document(file_id, user_id)
+        suggest_cache.invalidate_document(file_id, user_id)
         
         return {
             "success": True,
@@ -575,8 +1803,6 @@ async def debug_opensearch_search(search_data: dict):
         # OpenSearchで直接検索
         if query == "*" or query == "":
             # 全ドキュメント取得用の特別なクエリ
-            import requests
-            from requests.auth import HTTPBasicAuth
             search_body = {
                 "query": {"match_all": {}},
                 "size": size
@@ -589,20 +1815,9 @@ async def debug_opensearch_search(search_data: dict):
                     }
                 }
             
-            try:
-                response = requests.post(
-                    f"{opensearch_service.endpoint}/{opensearch_service.index_name}/_search",
-                    json=search_body,
-                    headers={"Content-Type": "application/json"},
-                    auth=opensearch_service.auth,
-                    verify=opensearch_service.verify_ssl,
-                    timeout=10
-                )
-                result = response.json()
-            except Exception as e:
-                return {"error": str(e)}
+            result = await opensearch_service.search_raw_async(search_body)
         else:
-            result = opensearch_service.search_documents(query, user_id=user_id, size=size)
+            result = await opensearch_service.search_documents_async(query, user_id=user_id, size=size)
         
         if "error" in result:
             return {"error": result["error"]}
@@ -639,7 +1854,7 @@ async def get_user_access_logs(current_user: dict = Depends(get_current_user)):
     try:
         user_id = current_user.get("user_id")
         
-        access_logs = access_logger_service.get_user_access_logs(
+        access_logs = await storage.get_user_access_logs(
             user_id=user_id,
             limit=100
         )
@@ -671,7 +1886,7 @@ async def get_weekly_user_activity(
     """
     try:
         # 週間ユーザーアクティビティデータを取得
-        weekly_data = access_logger_service.get_weekly_user_activity(days=days)
+        weekly_data = await storage.get_weekly_user_activity(days=days)
         
         return weekly_data
         
@@ -702,7 +1917,7 @@ async def get_user_incentive_summary(
             period = datetime.now().strftime("%Y-%m")
         
         # インセンティブポイントを計算
-        incentive_data = access_logger_service.calculate_incentive_points(
+        incentive_data = await storage.calculate_incentive_points(
             owner_user_id=user_id,
             period_month=period
         )
@@ -719,7 +1934,7 @@ async def get_user_incentive_summary(
             }
         
         # 集計結果を保存
-        access_logger_service.save_incentive_summary(incentive_data)
+        await storage.save_incentive_summary(incentive_data)
         
         return {
             "success": True,
@@ -743,14 +1958,11 @@ async def get_document_access_stats(
         user_id = current_user.get("user_id")
         
         # ドキュメントの所有者確認
-        response = aws_services.get_dynamodb_table().get_item(
-            Key={'id': document_id}
-        )
+        document_item = await storage.get_document(document_id)
         
-        if 'Item' not in response:
+        if document_item is None:
             raise HTTPException(status_code=404, detail="ドキュメントが見つかりません")
-        
-        document_item = response['Item']
+
         document_owner_id = document_item.get('user_id')
         
         # 所有者チェック
@@ -758,7 +1970,7 @@ async def get_document_access_stats(
             raise HTTPException(status_code=403, detail="このドキュメントの統計を確認する権限がありません")
         
         # アクセス統計を取得
-        access_stats = access_logger_service.get_document_access_stats(
+        access_stats = await storage.get_document_access_stats(
             document_id=document_id,
             period_days=30
         )
@@ -781,57 +1993,137 @@ async def get_document_access_stats(
         raise HTTPException(status_code=500, detail=f"統計取得中にエラーが発生しました: {str(e)}")
 
 
-@app.post("/admin/incentive/batch-calculate")
+@app.post("/admin/incentive/batch-calculate", status_code=202)
 async def batch_calculate_incentives(current_user: dict = Depends(require_admin)):
     """
     全ユーザーのインセンティブを一括計算します（管理者専用）
+    
+    計算はバックグラウンドジョブとして実行し、ジョブIDをすぐに返す（進捗は GET /admin/jobs/{job_id}）
     """
     try:
-        from datetime import datetime
         current_month = datetime.now().strftime("%Y-%m")
-        
-        # 全ユーザーを取得
-        response = aws_services.get_dynamodb_table().scan()
-        items = response.get('Items', [])
-        
-        # ユニークなユーザーIDを抽出
-        user_ids = set()
-        for item in items:
-            user_id = item.get('user_id')
-            if user_id and user_id != 'anonymous':
-                user_ids.add(user_id)
-        
-        processed_users = 0
-        failed_users = 0
-        
-        for user_id in user_ids:
-            try:
-                # インセンティブ計算
-                incentive_data = access_logger_service.calculate_incentive_points(
-                    owner_user_id=user_id,
-                    period_month=current_month
-                )
-                
-                if incentive_data:
-                    # 集計結果を保存
-                    access_logger_service.save_incentive_summary(incentive_data)
-                    processed_users += 1
-                
-            except Exception as user_error:
-                print(f"ユーザー {user_id} のインセンティブ計算エラー: {user_error}")
-                failed_users += 1
-        
+        job = await job_runner.submit(JOB_INCENTIVE_BATCH, {"period": current_month})
         return {
             "success": True,
-            "message": "インセンティブ一括計算が完了しました",
-            "statistics": {
-                "total_users": len(user_ids),
-                "processed_users": processed_users,
-                "failed_users": failed_users,
-                "period": current_month
-            }
+            "message": "インセンティブ一括計算ジョブを開始しました",
+            "job": job
         }
         
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print(f"インセンティブ一括計算エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"一括計算中にエラーが発生しました: {str(e)}")
+
+
+async def _run_incentive_job(context: JobContext) -> dict:
+    """
+    インセンティブ一括計算ジョブ
+    
+    ユーザーをID順に処理し、最後に処理したユーザーIDを状態として保存する（再開時はその次のユーザーから）
+    """
+    period = context.params["period"]
+    state = {"last_user_id": None, "processed_users": 0, "skipped_users": 0, "failed_users": 0, **context.state}
+    
+    # 全ドキュメントの所有者を抽出
+    user_ids = sorted(await context.run_sync(_collect_document_owners))
+    context.set_total(len(user_ids))
+    
+    for user_id in user_ids:
+        if state["last_user_id"] is not None and user_id <= state["last_user_id"]:
+            continue
+        context.check_cancelled()
+        try:
+            # インセンティブ計算
+            incentive_data = await context.run_sync(
+                access_logger_service.calculate_incentive_points, user_id, period
+            )
+            
+            if incentive_data:
+                # 集計結果を保存
+                await context.run_sync(access_logger_service.save_incentive_summary, incentive_data)
+                state["processed_users"] += 1
+            else:
+                state["skipped_users"] += 1
+            
+        except Exception as user_error:
+            print(f"ユーザー {user_id} のインセンティブ計算エラー: {user_error}")
+            state["failed_users"] += 1
+        
+        state["last_user_id"] = user_id
+        context.save_state(dict(state))
+        context.update(
+            processed=state["processed_users"] + state["skipped_users"],
+            failed=state["failed_users"]
+        )
+    
+    return {
+        "total_users": len(user_ids),
+        "processed_users": state["processed_users"],
+        "failed_users": state["failed_users"],
+        "period": period
+    }
+
+
+def _collect_document_owners() -> set:
+    """全ドキュメントの所有者ID（匿名を除く）"""
+    return {
+        item["user_id"] for item in aws_services.iter_all_documents()
+        if item.get("user_id") and item["user_id"] != "anonymous"
+    }
+
+
+@app.get("/admin/jobs")
+async def list_jobs(limit: int = 50, current_user: dict = Depends(require_admin)):
+    """
+    バックグラウンドジョブの一覧（管理者専用）
+    """
+    return {"success": True, "jobs": await job_runner.list_jobs(limit)}
+
+
+@app.get("/admin/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(require_admin)):
+    """
+    バックグラウンドジョブの状態（進捗・スループット・残り時間の見積もり）（管理者専用）
+    """
+    try:
+        return {"success": True, "job": await job_runner.get_job(job_id)}
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/admin/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, current_user: dict = Depends(require_admin)):
+    """
+    バックグラウンドジョブのキャンセル（管理者専用）
+    """
+    try:
+        return {"success": True, "job": await job_runner.cancel(job_id)}
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/admin/jobs/{job_id}/resume", status_code=202)
+async def resume_job(job_id: str, current_user: dict = Depends(require_admin)):
+    """
+    失敗・キャンセル・中断したバックグラウンドジョブを保存済みの状態から再開（管理者専用）
+    """
+    try:
+        return {"success": True, "job": await job_runner.resume(job_id)}
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+# バックグラウンドジョブの種類（再起動後に別のタスクからも再開できるよう、起動時に登録する）
+JOB_OPENSEARCH_MIGRATION = "opensearch_migration"
+JOB_INCENTIVE_BATCH = "incentive_batch"
+JOB_TEXT_BACKFILL = "text_backfill"
+JOB_PASSAGE_INDEX = "passage_index"
+job_runner.register(JOB_OPENSEARCH_MIGRATION, _run_migration_job)
+job_runner.register(JOB_INCENTIVE_BATCH, _run_incentive_job)
+job_runner.register(JOB_TEXT_BACKFILL, _run_text_backfill_job)
+job_runner.register(JOB_PASSAGE_INDEX, _run_passage_index_job)
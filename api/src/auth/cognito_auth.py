@@ -5,10 +5,12 @@ from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from functools import lru_cache
 from ..constants.cognito import COGNITO_REGION, COGNITO_USER_POOL_ID, COGNITO_CLIENT_ID
+from ..services.metrics import metrics
 
 security = HTTPBearer(auto_error=False)
 
 @lru_cache()
+@metrics.timed("auth.jwks_fetch")
 def get_cognito_public_keys() -> Dict[str, Any]:
     """CognitoのJWKS（JSON Web Key Set）を取得"""
     if not COGNITO_USER_POOL_ID:
@@ -23,6 +25,7 @@ def get_cognito_public_keys() -> Dict[str, Any]:
         print(f"Failed to get Cognito public keys: {e}")
         raise HTTPException(status_code=500, detail="Failed to get Cognito public keys")
 
+@metrics.timed("auth.jwt_verify")
 def verify_cognito_token(token: str) -> Dict[str, Any]:
     """Cognito JWTトークンを検証"""
     print(f"[DEBUG] Starting token verification for token: {token[:20]}...")
@@ -2,10 +2,61 @@
 AWS サービス操作モジュール
 S3とDynamoDB操作を担当
 """
+import threading
+import time
 import boto3
 from boto3.dynamodb.conditions import Key, Attr
-from typing import Dict, Any, List
-from .config import REGION_NAME, DYNAMODB_TABLE_NAME, S3_BUCKET_NAME
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional
+from .config import (
+    REGION_NAME,
+    DYNAMODB_TABLE_NAME,
+    S3_BUCKET_NAME,
+    DYNAMODB_BATCH_GET_MAX_WORKERS,
+    DYNAMODB_BATCH_GET_MAX_RETRIES,
+    FALLBACK_SCAN_TOTAL_SEGMENTS,
+    FALLBACK_SCAN_MAX_WORKERS,
+    AWS_MAX_POOL_CONNECTIONS,
+    AWS_CONNECT_TIMEOUT,
+    AWS_READ_TIMEOUT,
+    AWS_MAX_ATTEMPTS,
+)
+from .services.metrics import metrics
+
+# BatchGetItemの1リクエストあたりの最大キー数（DynamoDBの上限）
+BATCH_GET_CHUNK_SIZE = 100
+
+# boto3クライアント共通の設定（スレッドプールから並列に呼ばれるため接続プールを広げる）
+BOTO_CONFIG = Config(
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    connect_timeout=AWS_CONNECT_TIMEOUT,
+    read_timeout=AWS_READ_TIMEOUT,
+    retries={"max_attempts": AWS_MAX_ATTEMPTS, "mode": "standard"}
+)
+
+# 整形済みテキストをS3に保存したアイテムが本文の代わりに持つ属性（保存先・圧縮形式・先頭部分）
+TEXT_POINTER_FIELDS = [
+    "text_s3_key",
+    "text_encoding",
+    "text_preview",
+]
+
+# 検索レスポンス（Documentモデル）とアクセス記録に必要な属性
+DOCUMENT_RESPONSE_FIELDS = [
+    "id",
+    "s3_key",
+    "file_name",
+    "file_type",
+    "formatted_text",
+    "uploaded_at",
+    "title",
+    "description",
+    "extracted_metadata",
+    "user_id",
+    "language",
+    *TEXT_POINTER_FIELDS,
+]
 
 
 class AWSServices:
@@ -13,10 +64,30 @@ class AWSServices:
     
     def __init__(self):
         """AWS クライアントを初期化"""
-        self.s3_client = boto3.client('s3', region_name=REGION_NAME)
-        self.dynamodb_client = boto3.resource('dynamodb', region_name=REGION_NAME)
+        self.s3_client = boto3.client('s3', region_name=REGION_NAME, config=BOTO_CONFIG)
+        self.dynamodb_client = boto3.resource('dynamodb', region_name=REGION_NAME, config=BOTO_CONFIG)
         self.table = self.dynamodb_client.Table(DYNAMODB_TABLE_NAME)
+        # BatchGetItemのチャンクを並列実行するスレッドプール
+        self._batch_get_executor = ThreadPoolExecutor(
+            max_workers=DYNAMODB_BATCH_GET_MAX_WORKERS,
+            thread_name_prefix="dynamodb-batch-get"
+        )
+        # フォールバック検索のセグメントを並列スキャンするスレッドプール
+        self._scan_executor = ThreadPoolExecutor(
+            max_workers=FALLBACK_SCAN_MAX_WORKERS,
+            thread_name_prefix="dynamodb-parallel-scan"
+        )
+        # フォールバック検索の累計コスト（障害時のコスト把握用）
+        self._fallback_stats_lock = threading.Lock()
+        self._fallback_stats = {
+            "searches": 0,
+            "scanned_items": 0,
+            "matched_items": 0,
+            "consumed_rcu": 0.0,
+            "pages": 0
+        }
     
+    @metrics.timed("s3.put_text")
     def upload_to_s3(self, content: str, s3_key: str) -> None:
         """
         S3にテキストコンテンツをアップロードする
@@ -35,6 +106,7 @@ class AWSServices:
             ContentType='text/plain; charset=utf-8'
         )
     
+    @metrics.timed("s3.put_object")
     def upload_file_to_s3(self, file_content: bytes, s3_key: str, content_type: str) -> None:
         """
         S3にファイルをアップロードする（バイナリデータ用）
@@ -55,7 +127,114 @@ class AWSServices:
             ContentType=content_type
         )
     
-    def save_to_dynamodb(self, item: Dict[str, Any]) -> None:
+    @metrics.timed("s3.get_object")
+    def download_file_from_s3(self, s3_key: str) -> bytes:
+        """
+        S3からファイルをダウンロードする
+        
+        Parameters:
+        -----------
+        s3_key : str
+            S3オブジェクトキー
+        """
+        response = self.s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+        return response["Body"].read()
+    
+    def get_object_if_exists(self, s3_key: str) -> Optional[bytes]:
+        """S3オブジェクトの内容を取得（存在しなければNone）"""
+        try:
+            return self.download_file_from_s3(s3_key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+    
+    @metrics.timed("s3.delete_object")
+    def delete_prefix(self, prefix: str) -> int:
+        """
+        プレフィックス配下のS3オブジェクトをすべて削除
+        
+        Returns:
+        --------
+        int
+            削除したオブジェクト数
+        """
+        deleted = 0
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=prefix):
+            keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+            if keys:
+                self.s3_client.delete_objects(Bucket=S3_BUCKET_NAME, Delete={"Objects": keys})
+                deleted += len(keys)
+        return deleted
+    
+    @metrics.timed("s3.get_object")
+    def download_file_to_path(self, s3_key: str, file_path: str) -> None:
+        """
+        S3からファイルをダウンロードしてファイルに書き込む（メモリに全体を載せない）
+        
+        Parameters:
+        -----------
+        s3_key : str
+            S3オブジェクトキー
+        file_path : str
+            書き込み先のパス
+        """
+        self.s3_client.download_file(S3_BUCKET_NAME, s3_key, file_path)
+    
+    @metrics.timed("s3.create_multipart_upload")
+    def create_multipart_upload(self, s3_key: str, content_type: str) -> str:
+        """マルチパートアップロードを開始してUploadIdを返す"""
+        response = self.s3_client.create_multipart_upload(
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            ContentType=content_type
+        )
+        return response["UploadId"]
+    
+    @metrics.timed("s3.upload_part")
+    def upload_part(self, s3_key: str, upload_id: str, part_number: int,
+                    body: bytes, content_md5: str) -> str:
+        """
+        マルチパートアップロードのパートを1つ送信してETagを返す
+        
+        Parameters:
+        -----------
+        s3_key : str
+            S3オブジェクトキー
+        upload_id : str
+            create_multipart_uploadで取得したUploadId
+        part_number : int
+            パート番号（1から）
+        body : bytes
+            パートの内容
+        content_md5 : str
+            パートのMD5（Base64）。S3が受信内容と照合する
+        """
+        response = self.s3_client.upload_part(
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
+            ContentMD5=content_md5
+        )
+        return response["ETag"]
+    
+    @metrics.timed("s3.complete_multipart_upload")
+    def complete_multipart_upload(self, s3_key: str, upload_id: str, parts: List[Dict[str, Any]]) -> None:
+        """送信済みのパート（PartNumber・ETag）を結合してオブジェクトを作成"""
+        self.s3_client.complete_multipart_upload(
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+    
+    def abort_multipart_upload(self, s3_key: str, upload_id: str) -> None:
+        """マルチパートアップロードを中止し、送信済みのパートを破棄"""
+        self.s3_client.abort_multipart_upload(Bucket=S3_BUCKET_NAME, Key=s3_key, UploadId=upload_id)
+    
+    @metrics.timed("dynamodb.put_item")
+    def save_to_dynamodb(self, item: Dict[str, Any], require_existing: bool = False) -> bool:
         """
         DynamoDBにアイテムを保存する
         
@@ -63,8 +242,130 @@ class AWSServices:
         -----------
         item : Dict[str, Any]
             保存するアイテム辞書
+        require_existing : bool
+            同じIDのアイテムが存在する場合のみ上書きする（処理中に削除されたドキュメントを復活させないため）
+        
+        Returns:
+        --------
+        bool
+            保存したかどうか（require_existingで対象が存在しなかった場合はFalse）
+        """
+        if not require_existing:
+            self.table.put_item(Item=item)
+            return True
+        try:
+            self.table.put_item(Item=item, ConditionExpression=Attr("id").exists())
+            return True
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+    
+    def update_processing_status(self, doc_id: str, status: str, error: Optional[str] = None) -> None:
+        """
+        非同期取り込みの処理状態を更新する（削除済みのドキュメントは更新しない）
+        
+        Parameters:
+        -----------
+        doc_id : str
+            ドキュメントID
+        status : str
+            処理状態
+        error : Optional[str]
+            失敗した場合のエラー内容
         """
-        self.table.put_item(Item=item)
+        try:
+            self.table.update_item(
+                Key={"id": doc_id},
+                UpdateExpression="SET processing_status = :status, processing_error = :error",
+                ConditionExpression=Attr("id").exists(),
+                ExpressionAttributeValues={":status": status, ":error": error}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            print(f"処理状態の更新対象が見つかりません（削除済み）: {doc_id}")
+    
+    @metrics.timed("dynamodb.update_item")
+    def replace_document_text(self, doc_id: str, attributes: Dict[str, Any]) -> bool:
+        """
+        アイテムの整形済みテキストを削除し、S3に保存した本文の参照（text_s3_keyなど）に置き換える
+        
+        Parameters:
+        -----------
+        doc_id : str
+            ドキュメントID
+        attributes : Dict[str, Any]
+            本文の代わりに設定する属性
+        
+        Returns:
+        --------
+        bool
+            置き換えたかどうか（削除済み・置き換え済みのアイテムはFalse）
+        """
+        names = {f"#a{i}": name for i, name in enumerate(attributes)}
+        values = {f":v{i}": value for i, value in enumerate(attributes.values())}
+        try:
+            self.table.update_item(
+                Key={"id": doc_id},
+                UpdateExpression="SET " + ", ".join(f"{n} = {v}" for n, v in zip(names, values)) + " REMOVE formatted_text",
+                ConditionExpression=Attr("formatted_text").exists(),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+            return True
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+    
+    @metrics.timed("dynamodb.get_item")
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """IDでドキュメントを1件取得（存在しなければNone）"""
+        return self.table.get_item(Key={"id": doc_id}).get("Item")
+    
+    @metrics.timed("dynamodb.delete_item")
+    def delete_document(self, doc_id: str) -> None:
+        """IDでドキュメントを削除"""
+        self.table.delete_item(Key={"id": doc_id})
+    
+    @metrics.timed("dynamodb.scan")
+    def list_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        ユーザーがアップロードしたドキュメントをすべて取得（LastEvaluatedKeyをたどる）
+        
+        Parameters:
+        -----------
+        user_id : str
+            所有者のユーザーID
+        """
+        items: List[Dict[str, Any]] = []
+        scan_kwargs: Dict[str, Any] = {"FilterExpression": Attr("user_id").eq(user_id)}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            items.extend(response.get("Items", []))
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                return items
+            scan_kwargs["ExclusiveStartKey"] = last_key
+    
+    @metrics.timed("s3.delete_object")
+    def delete_file_from_s3(self, s3_key: str) -> None:
+        """S3からファイルを削除"""
+        self.s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+    
+    @metrics.timed("dynamodb.update_item")
+    def update_document_language(self, doc_id: str, language: str) -> None:
+        """
+        ドキュメントの言語コードを更新する（言語判定導入前のドキュメントの補完用）
+        
+        Parameters:
+        -----------
+        doc_id : str
+            ドキュメントID
+        language : str
+            言語コード
+        """
+        self.table.update_item(
+            Key={"id": doc_id},
+            UpdateExpression="SET #language = :language",
+            ExpressionAttributeNames={"#language": "language"},
+            ExpressionAttributeValues={":language": language}
+        )
     
     def get_s3_client(self):
         """S3クライアントを取得（下位互換性のため）"""
@@ -74,7 +375,137 @@ class AWSServices:
         """DynamoDBテーブルを取得（下位互換性のため）"""
         return self.table
     
-    def search_documents(self, query: str, max_results: int = 5, user_id: str = None) -> List[Dict]:
+    def iter_all_documents(self) -> Iterator[Dict[str, Any]]:
+        """テーブルの全ドキュメントをLastEvaluatedKeyをたどって順に返す"""
+        scan_kwargs: Dict[str, Any] = {}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            yield from response.get("Items", [])
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                break
+            scan_kwargs["ExclusiveStartKey"] = last_key
+    
+    def approximate_document_count(self) -> int:
+        """テーブルの概算件数（DynamoDBが約6時間ごとに更新するItemCount）"""
+        response = self.dynamodb_client.meta.client.describe_table(TableName=DYNAMODB_TABLE_NAME)
+        return response["Table"].get("ItemCount", 0)
+    
+    @metrics.timed("dynamodb.scan_page")
+    def scan_segment_page(self, segment: int, total_segments: int,
+                          start_key: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        並列スキャンの1セグメントから1ページ（最大1MB）を読む（データ移行用）
+        
+        Parameters:
+        -----------
+        segment : int
+            セグメント番号
+        total_segments : int
+            全セグメント数
+        start_key : Optional[Dict[str, Any]]
+            前ページのLastEvaluatedKey（先頭ページはNone）
+        
+        Returns:
+        --------
+        Dict[str, Any]
+            items: アイテムのリスト, last_key: 次ページの開始位置（最終ページの場合はNone）
+        """
+        kwargs = {
+            "TableName": DYNAMODB_TABLE_NAME,
+            "Segment": segment,
+            "TotalSegments": total_segments
+        }
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        # リソースに紐づくクライアントはスレッドセーフかつ型変換済みの値を返す
+        response = self.dynamodb_client.meta.client.scan(**kwargs)
+        return {"items": response.get("Items", []), "last_key": response.get("LastEvaluatedKey")}
+    
+    @metrics.timed("dynamodb.batch_get")
+    def batch_get_documents(self, doc_ids: List[str],
+                            fields: Optional[List[str]] = DOCUMENT_RESPONSE_FIELDS) -> List[Dict]:
+        """
+        BatchGetItemで複数ドキュメントをまとめて取得する（検索結果のハイドレーション用）
+        
+        Parameters:
+        -----------
+        doc_ids : List[str]
+            取得するドキュメントIDのリスト（この順序で結果を返す）
+        fields : Optional[List[str]]
+            取得する属性（ProjectionExpression）。Noneの場合は全属性
+            
+        Returns:
+        --------
+        List[Dict]
+            入力IDの順序を保ったアイテムのリスト（存在しないIDは除外）
+        """
+        # 重複を除きつつ順序を維持
+        unique_ids = list(dict.fromkeys(doc_id for doc_id in doc_ids if doc_id))
+        if not unique_ids:
+            return []
+        
+        chunks = [
+            unique_ids[i:i + BATCH_GET_CHUNK_SIZE]
+            for i in range(0, len(unique_ids), BATCH_GET_CHUNK_SIZE)
+        ]
+        
+        # チャンクが1つならスレッドを経由せずに実行
+        if len(chunks) == 1:
+            chunk_results = [self._batch_get_chunk(chunks[0], fields)]
+        else:
+            chunk_results = list(self._batch_get_executor.map(
+                lambda chunk: self._batch_get_chunk(chunk, fields), chunks
+            ))
+        
+        items_by_id = {}
+        for items in chunk_results:
+            for item in items:
+                items_by_id[item["id"]] = item
+        
+        # OpenSearchのランキング順を維持
+        return [items_by_id[doc_id] for doc_id in unique_ids if doc_id in items_by_id]
+    
+    def _batch_get_chunk(self, doc_ids: List[str], fields: Optional[List[str]]) -> List[Dict]:
+        """
+        1チャンク（最大100件）をBatchGetItemで取得し、UnprocessedKeysを指数バックオフで再試行する
+        """
+        keys_and_attributes: Dict[str, Any] = {
+            "Keys": [{"id": doc_id} for doc_id in doc_ids]
+        }
+        if fields:
+            keys_and_attributes.update(self._projection_kwargs(fields))
+        
+        request_items = {DYNAMODB_TABLE_NAME: keys_and_attributes}
+        items: List[Dict] = []
+        
+        # リソースに紐づくクライアントはスレッドセーフかつ型変換済みの値を返す
+        client = self.dynamodb_client.meta.client
+        for attempt in range(DYNAMODB_BATCH_GET_MAX_RETRIES + 1):
+            response = client.batch_get_item(RequestItems=request_items)
+            items.extend(response.get("Responses", {}).get(DYNAMODB_TABLE_NAME, []))
+            
+            request_items = response.get("UnprocessedKeys") or {}
+            if not request_items:
+                return items
+            
+            if attempt < DYNAMODB_BATCH_GET_MAX_RETRIES:
+                time.sleep(min(0.05 * (2 ** attempt), 1.0))
+        
+        unprocessed = len(request_items.get(DYNAMODB_TABLE_NAME, {}).get("Keys", []))
+        print(f"BatchGetItem未処理キー: {unprocessed}件（再試行上限に達しました）")
+        return items
+    
+    def _projection_kwargs(self, fields: List[str]) -> Dict[str, Any]:
+        """ProjectionExpressionの引数を作成（予約語との衝突を避けるため属性名はすべてプレースホルダーにする）"""
+        names = {f"#f{i}": field for i, field in enumerate(dict.fromkeys(["id", *fields]))}
+        return {
+            "ProjectionExpression": ", ".join(names.keys()),
+            "ExpressionAttributeNames": names
+        }
+    
+    def search_documents(self, query: str, max_results: int = 5, user_id: str = None,
+                         language: Optional[str] = None) -> List[Dict]:
         """
         DynamoDBからドキュメントを検索する
         
@@ -86,65 +517,228 @@ class AWSServices:
             返す最大結果数
         user_id : str
             ユーザーID（指定した場合、そのユーザーのファイルのみを検索）
+        language : Optional[str]
+            言語コード（指定した場合、その言語のファイルのみを検索）
             
         Returns:
         --------
         List[Dict]
             検索結果のリスト
         """
+        return self.parallel_scan_search(query, max_results, user_id, language=language)["results"]
+    
+    @metrics.timed("dynamodb.scan_search")
+    def parallel_scan_search(self, query: str, max_results: int = 5, user_id: str = None,
+                             segment_states: Optional[List[Dict[str, Any]]] = None,
+                             total_segments: int = FALLBACK_SCAN_TOTAL_SEGMENTS,
+                             language: Optional[str] = None) -> Dict[str, Any]:
+        """
+        並列セグメントスキャンでDynamoDBからドキュメントを検索する（OpenSearch障害時のフォールバック）
+        
+        テーブルをSegment/TotalSegmentsで分割して並列にスキャンし、各セグメントは
+        LastEvaluatedKeyをたどって1MBを超えて読み進める。合計でmax_results件の一致が
+        見つかった時点で全セグメントが次のページの読み込みを止める。
+        
+        Parameters:
+        -----------
+        query : str
+            検索クエリ
+        max_results : int
+            返す最大結果数
+        user_id : str
+            ユーザーID（指定した場合、そのユーザーのファイルのみを検索）
+        segment_states : Optional[List[Dict[str, Any]]]
+            前ページの続きから検索する場合の各セグメントの位置（{"k": 開始キー, "done": 完了済みか}）
+        total_segments : int
+            セグメント数（segment_states指定時はその長さを使う）
+        language : Optional[str]
+            言語コード（指定した場合、その言語のファイルのみを検索）
+            
+        Returns:
+        --------
+        Dict[str, Any]
+            results: 検索結果のリスト
+            next_segment_states: 次ページの各セグメントの位置（最終ページの場合はNone）
+            scanned_items / matched_items / consumed_rcu / pages / elapsed_ms: 今回のスキャンのコスト
+        """
+        started = time.monotonic()
         try:
-            # ベースのフィルタ式を作成
-            filter_expression = Attr('formatted_text').contains(query)
+            # ベースのフィルタ式を作成（本文をS3に保存したアイテムは先頭部分のみが対象）
+            filter_expression = Attr('formatted_text').contains(query) | Attr('text_preview').contains(query)
             
             # ユーザーIDが指定されている場合、ユーザー固有のフィルタを追加
             if user_id:
                 user_filter = Attr('user_id').eq(user_id)
                 filter_expression = filter_expression & user_filter
             
-            # DynamoDBでスキャンして検索
-            response = self.table.scan(
-                FilterExpression=filter_expression,
-            )
+            # 言語が指定されている場合、言語のフィルタを追加
+            if language:
+                filter_expression = filter_expression & Attr('language').eq(language)
+            
+            if not segment_states:
+                segment_states = [{"k": None, "done": False} for _ in range(total_segments)]
+            
+            stop_event = threading.Event()
+            matched_lock = threading.Lock()
+            matched_count = [0]
+            
+            def on_page(items: List[Dict]) -> None:
+                # 必要件数がそろったら全セグメントに停止を通知
+                with matched_lock:
+                    matched_count[0] += len(items)
+                    if matched_count[0] >= max_results:
+                        stop_event.set()
             
-            items = response.get('Items', [])
-            print(f"検索結果: {len(items)}件のアイテムが見つかりました")
-            
-            # デバッグ用：最初のアイテムの構造を出力
-            if items:
-                print(f"最初のアイテム構造: {list(items[0].keys())}")
-                print(f"最初のアイテムの一部: {dict(list(items[0].items())[:3])}")
-            
-            # 結果を制限
-            limited_items = items[:max_results]
-            
-            # 検索結果を整形（DynamoDBスキーマに基づく正確なマッピング）
-            search_results = []
-            for item in limited_items:
-                # DynamoDBから取得した実際のフィールドをそのまま使用
-                result = {
-                    # SearchResultモデルに必要なフィールド
-                    'id': item['id'],  # UUID
-                    's3_key': item['s3_key'],  # string
-                    'file_name': item['file_name'],  # string
-                    'file_type': item['file_type'],  # string（拡張子）
-                    'formatted_text': item['formatted_text'],  # string
-                    'uploaded_at': item['uploaded_at'],  # date (ISO 8601)
-                    'title': item['title'],  # string
-                    'description': item['description'],  # string
-                    'extracted_metadata': item['extracted_metadata'],  # JSON
-                    # プレビュー用（オプション）
-                    'preview': item['formatted_text'][:200] + '...' if len(item['formatted_text']) > 200 else item['formatted_text']
-                }
-                search_results.append(result)
-            
-            return search_results
+            scan_kwargs = {
+                "FilterExpression": filter_expression,
+                **self._projection_kwargs(DOCUMENT_RESPONSE_FIELDS)
+            }
+            segment_results = list(self._scan_executor.map(
+                lambda segment: self._scan_segment(
+                    segment, len(segment_states), segment_states[segment], scan_kwargs, stop_event, on_page
+                ),
+                range(len(segment_states))
+            ))
+            
+            # セグメント順に結果を集め、次ページの各セグメントの位置を決める
+            results: List[Dict] = []
+            next_states: List[Dict[str, Any]] = []
+            for segment, segment_result in enumerate(segment_results):
+                remaining = max_results - len(results)
+                taken = segment_result["items"][:max(remaining, 0)]
+                results.extend(taken)
+                
+                if len(taken) < len(segment_result["items"]):
+                    # 返しきれなかった分は、最後に返したアイテムの直後（1件も返していなければ今回の開始位置）から再開
+                    resume_key = {"id": taken[-1]["id"]} if taken else segment_states[segment]["k"]
+                    next_states.append({"k": resume_key, "done": False})
+                else:
+                    next_states.append({"k": segment_result["last_key"], "done": segment_result["done"]})
+            
+            stats = {
+                "scanned_items": sum(r["scanned"] for r in segment_results),
+                "matched_items": sum(len(r["items"]) for r in segment_results),
+                "consumed_rcu": sum(r["rcu"] for r in segment_results),
+                "pages": sum(r["pages"] for r in segment_results),
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+            }
+            self._record_fallback_stats(stats)
+            print(f"フォールバック検索: {len(results)}件返却 / スキャン{stats['scanned_items']}件 / "
+                  f"{stats['consumed_rcu']}RCU / {stats['pages']}ページ / {stats['elapsed_ms']}ms")
+            
+            has_more = any(not state["done"] for state in next_states)
+            return {
+                "results": [self._format_search_result(item) for item in results],
+                "next_segment_states": next_states if has_more else None,
+                **stats
+            }
             
         except Exception as e:
             print(f"検索エラー: {e}")
             print(f"エラーの詳細: {type(e).__name__}: {str(e)}")
             import traceback
             traceback.print_exc()
-            return []
+            return {
+                "results": [],
+                "next_segment_states": None,
+                "scanned_items": 0,
+                "matched_items": 0,
+                "consumed_rcu": 0.0,
+                "pages": 0,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+            }
+    
+    def _scan_segment(self, segment: int, total_segments: int, state: Dict[str, Any],
+                      scan_kwargs: Dict[str, Any], stop_event: threading.Event,
+                      on_page=None) -> Dict[str, Any]:
+        """
+        1セグメントをLastEvaluatedKeyをたどってスキャンする（stop_eventがセットされたら次のページを読まない）
+        """
+        result = {
+            "items": [],
+            "last_key": state.get("k"),
+            "done": bool(state.get("done")),
+            "scanned": 0,
+            "rcu": 0.0,
+            "pages": 0
+        }
+        if result["done"]:
+            return result
+        
+        # リソースに紐づくクライアントはスレッドセーフかつ型変換済みの値を返す
+        client = self.dynamodb_client.meta.client
+        start_key = result["last_key"]
+        while not stop_event.is_set():
+            kwargs = {
+                "TableName": DYNAMODB_TABLE_NAME,
+                "Segment": segment,
+                "TotalSegments": total_segments,
+                "ReturnConsumedCapacity": "TOTAL",
+                **scan_kwargs
+            }
+            if start_key:
+                kwargs["ExclusiveStartKey"] = start_key
+            
+            response = client.scan(**kwargs)
+            items = response.get("Items", [])
+            result["items"].extend(items)
+            result["scanned"] += response.get("ScannedCount", 0)
+            result["rcu"] += response.get("ConsumedCapacity", {}).get("CapacityUnits", 0.0)
+            result["pages"] += 1
+            
+            start_key = response.get("LastEvaluatedKey")
+            result["last_key"] = start_key
+            if on_page:
+                on_page(items)
+            if not start_key:
+                result["done"] = True
+                break
+        
+        return result
+    
+    def _record_fallback_stats(self, stats: Dict[str, Any]) -> None:
+        """フォールバック検索の累計コストを更新"""
+        with self._fallback_stats_lock:
+            self._fallback_stats["searches"] += 1
+            for key in ("scanned_items", "matched_items", "consumed_rcu", "pages"):
+                self._fallback_stats[key] += stats[key]
+    
+    def fallback_search_stats(self) -> Dict[str, Any]:
+        """フォールバック検索の累計コストを返す"""
+        with self._fallback_stats_lock:
+            return dict(self._fallback_stats)
+    
+    def _format_search_result(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """検索結果を整形（DynamoDBスキーマに基づく正確なマッピング）"""
+        # DynamoDBから取得した実際のフィールドをそのまま使用
+        return {
+            # SearchResultモデルに必要なフィールド
+            'id': item['id'],  # UUID
+            's3_key': item['s3_key'],  # string
+            'file_name': item['file_name'],  # string
+            'file_type': item['file_type'],  # string（拡張子）
+            'formatted_text': item.get('formatted_text'),  # string（S3に保存した本文は呼び出し元で読み込む）
+            'uploaded_at': item['uploaded_at'],  # date (ISO 8601)
+            'title': item['title'],  # string
+            'description': item['description'],  # string
+            'extracted_metadata': item['extracted_metadata'],  # JSON
+            # アクセス記録用（ドキュメント所有者）
+            'user_id': item.get('user_id', 'unknown'),
+            # アップロード時に判定した言語（判定導入前のドキュメントはNone）
+            'language': item.get('language'),
+            # プレビュー用（オプション）
+            'preview': self._preview(item),
+            # S3に保存した本文の参照
+            **{field: item[field] for field in TEXT_POINTER_FIELDS if field in item}
+        }
+    
+    def _preview(self, item: Dict[str, Any]) -> str:
+        """検索結果のプレビュー（本文の先頭200文字）"""
+        if 'formatted_text' not in item:
+            # S3に保存されるのは長い本文だけなので、先頭部分は常に途中までになる
+            return item.get('text_preview', '')[:200] + '...'
+        text = item['formatted_text']
+        return text[:200] + '...' if len(text) > 200 else text
 
 
 # シングルトンインスタンス
@@ -9,11 +9,156 @@ AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-1")  # access_logger_service
 DYNAMODB_TABLE_NAME = os.getenv("DYNAMODB_TABLE_NAME", "factify-dynamodb-table-471112951833-ap-northeast-1")
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "factify-s3-bucket-471112951833-ap-northeast-1")
 
+# DynamoDB BatchGetItem設定（並列に処理するチャンク数と未処理キーの再試行回数）
+DYNAMODB_BATCH_GET_MAX_WORKERS = int(os.getenv("DYNAMODB_BATCH_GET_MAX_WORKERS", "4"))
+DYNAMODB_BATCH_GET_MAX_RETRIES = int(os.getenv("DYNAMODB_BATCH_GET_MAX_RETRIES", "5"))
+
+# DynamoDBフォールバック検索（並列セグメントスキャン）設定
+FALLBACK_SCAN_TOTAL_SEGMENTS = int(os.getenv("FALLBACK_SCAN_TOTAL_SEGMENTS", "4"))
+FALLBACK_SCAN_MAX_WORKERS = int(os.getenv("FALLBACK_SCAN_MAX_WORKERS", "4"))
+
+# boto3の接続設定と、同期boto3の呼び出しをイベントループの外で実行するスレッド数
+# （接続プールはスレッド数とBatchGetItem・並列スキャンのスレッド数を合わせた数以上にする）
+STORAGE_MAX_WORKERS = int(os.getenv("STORAGE_MAX_WORKERS", "32"))
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "3"))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "20"))
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "3"))
+
+# ローカル全文検索インデックス設定（OpenSearch障害時の検索バックエンド）
+# インデックスは各プロセスがLOCAL_INDEX_DIR/worker-<pid>に1プロセスだけで書き込む（ワーカー間で共有しない）
+LOCAL_INDEX_ENABLED = os.getenv("LOCAL_INDEX_ENABLED", "true").lower() == "true"
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "/tmp/factify-local-index")
+LOCAL_INDEX_FLUSH_THRESHOLD = int(os.getenv("LOCAL_INDEX_FLUSH_THRESHOLD", "200"))
+
 # OpenSearch設定（AWS OpenSearchサービス）
 OPENSEARCH_ENDPOINT = os.getenv("OPENSEARCH_ENDPOINT", "https://search-factify-search-demo-zv7xz3e4q2wwgm2eer2aoirt2e.ap-northeast-1.es.amazonaws.com")
 OPENSEARCH_USERNAME = os.getenv("OPENSEARCH_USERNAME", "admin")
 OPENSEARCH_PASSWORD = os.getenv("OPENSEARCH_PASSWORD", "TempPassword123!")
 
+# OpenSearch接続プール設定（keep-aliveで再利用するコネクション数とタイムアウト秒数）
+OPENSEARCH_POOL_SIZE = int(os.getenv("OPENSEARCH_POOL_SIZE", "20"))
+OPENSEARCH_TIMEOUT = float(os.getenv("OPENSEARCH_TIMEOUT", "10"))
+OPENSEARCH_CONNECT_TIMEOUT = float(os.getenv("OPENSEARCH_CONNECT_TIMEOUT", "3"))
+OPENSEARCH_HEALTH_TIMEOUT = float(os.getenv("OPENSEARCH_HEALTH_TIMEOUT", "5"))
+OPENSEARCH_KEEPALIVE_EXPIRY = float(os.getenv("OPENSEARCH_KEEPALIVE_EXPIRY", "30"))
+
+# 検索結果の生成元（"source": OpenSearchの_sourceから直接生成 / "hydrate": DynamoDBから取得）
+SEARCH_SOURCE_MODE = os.getenv("SEARCH_SOURCE_MODE", "source")
+
+# 検索結果キャッシュ設定（backend: "memory" = プロセス内 / "redis" = ワーカー間で共有）
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_BACKEND = os.getenv("SEARCH_CACHE_BACKEND", "memory")
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+SEARCH_CACHE_REDIS_URL = os.getenv("SEARCH_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# 検索カーソル設定（PIT使用時はページング中のインデックス更新の影響を受けない）
+SEARCH_CURSOR_USE_PIT = os.getenv("SEARCH_CURSOR_USE_PIT", "false").lower() == "true"
+SEARCH_CURSOR_KEEP_ALIVE = os.getenv("SEARCH_CURSOR_KEEP_ALIVE", "5m")
+
+# 一括検索（/search/batch）で1リクエストに指定できる最大検索数
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "50"))
+
+# ストリーミング検索（NDJSON）でDynamoDB・S3からまとめて補完する件数（補完できた分から順に送り出す）
+SEARCH_STREAM_HYDRATE_BATCH = max(int(os.getenv("SEARCH_STREAM_HYDRATE_BATCH", "10")), 1)
+
+# 段階的検索（完全一致・AND → OR → typo許容の順に、ヒットが足りない場合のみ広げる）
+SEARCH_TIERED_QUERY = os.getenv("SEARCH_TIERED_QUERY", "true").lower() == "true"
+# 次の段へ広げるヒット数の下限（ページサイズによらず、この件数に満たない場合のみ広げる）
+SEARCH_TIER_MIN_HITS = max(int(os.getenv("SEARCH_TIER_MIN_HITS", "1")), 1)
+
+# パッセージインデックス設定（本文を重なりのある一定長のパッセージに分けて別インデックスに登録し、
+# /searchのpassageモードでドキュメントごとの上位パッセージを返す）
+PASSAGE_INDEX_ENABLED = os.getenv("PASSAGE_INDEX_ENABLED", "true").lower() == "true"
+PASSAGE_INDEX_NAME = os.getenv("PASSAGE_INDEX_NAME", "factify-passages")
+PASSAGE_CHARS = max(int(os.getenv("PASSAGE_CHARS", "600")), 50)  # 1パッセージの最大文字数
+PASSAGE_OVERLAP = min(int(os.getenv("PASSAGE_OVERLAP", "100")), PASSAGE_CHARS // 2)  # 隣り合うパッセージの重なり（文字数）
+PASSAGE_MAX_PER_DOCUMENT = int(os.getenv("PASSAGE_MAX_PER_DOCUMENT", "5000"))  # 0で無制限
+SEARCH_PASSAGES_PER_DOCUMENT = int(os.getenv("SEARCH_PASSAGES_PER_DOCUMENT", "3"))  # passageモードで返す既定のパッセージ数
+SEARCH_PASSAGES_MAX = int(os.getenv("SEARCH_PASSAGES_MAX", "10"))
+
+# 入力補完（/search/suggest）のプレフィックスキャッシュ設定
+SUGGEST_CACHE_TTL = float(os.getenv("SUGGEST_CACHE_TTL", "30"))
+SUGGEST_CACHE_MAX_ENTRIES = int(os.getenv("SUGGEST_CACHE_MAX_ENTRIES", "5000"))
+SUGGEST_TIMEOUT = float(os.getenv("SUGGEST_TIMEOUT", "1"))
+
+# OpenSearchヘルスプローブ・サーキットブレーカー設定
+OPENSEARCH_HEALTH_PROBE_INTERVAL = float(os.getenv("OPENSEARCH_HEALTH_PROBE_INTERVAL", "15"))
+OPENSEARCH_BREAKER_FAILURE_THRESHOLD = int(os.getenv("OPENSEARCH_BREAKER_FAILURE_THRESHOLD", "3"))
+OPENSEARCH_BREAKER_RESET_TIMEOUT = float(os.getenv("OPENSEARCH_BREAKER_RESET_TIMEOUT", "30"))
+OPENSEARCH_BREAKER_HALF_OPEN_MAX_CALLS = int(os.getenv("OPENSEARCH_BREAKER_HALF_OPEN_MAX_CALLS", "1"))
+
+# OpenSearchデータ移行（/admin/opensearch/migrate）設定
+MIGRATE_TOTAL_SEGMENTS = int(os.getenv("MIGRATE_TOTAL_SEGMENTS", "4"))
+MIGRATE_MAX_CONCURRENT_BULKS = int(os.getenv("MIGRATE_MAX_CONCURRENT_BULKS", "4"))
+MIGRATE_BULK_MAX_BYTES = int(os.getenv("MIGRATE_BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+MIGRATE_BULK_MAX_DOCS = int(os.getenv("MIGRATE_BULK_MAX_DOCS", "500"))
+MIGRATE_MAX_RETRIES = int(os.getenv("MIGRATE_MAX_RETRIES", "3"))
+MIGRATE_RETRY_BACKOFF = float(os.getenv("MIGRATE_RETRY_BACKOFF", "0.5"))
+MIGRATE_CHECKPOINT_PATH = os.getenv("MIGRATE_CHECKPOINT_PATH", "/tmp/factify-migrate-checkpoint.json")
+MIGRATE_DISABLE_REFRESH = os.getenv("MIGRATE_DISABLE_REFRESH", "true").lower() == "true"
+
+# バックグラウンドジョブ（データ移行・インセンティブ一括計算）設定
+JOBS_TABLE_NAME = os.getenv("JOBS_TABLE_NAME", "factify-admin-jobs")
+JOBS_MAX_CONCURRENT = int(os.getenv("JOBS_MAX_CONCURRENT", "2"))
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", "4"))
+JOBS_HEARTBEAT_INTERVAL = float(os.getenv("JOBS_HEARTBEAT_INTERVAL", "5"))
+JOBS_HEARTBEAT_TIMEOUT = float(os.getenv("JOBS_HEARTBEAT_TIMEOUT", "60"))
+JOBS_RETENTION_DAYS = int(os.getenv("JOBS_RETENTION_DAYS", "30"))  # 最終更新からこの日数でTTLにより削除
+
+# 非同期取り込み（アップロードは原本の保存だけで202を返し、抽出・登録はワーカーで行う）設定
+INGEST_MODE = os.getenv("INGEST_MODE", "sync").lower()  # sync / async
+INGEST_QUEUE_BACKEND = os.getenv("INGEST_QUEUE_BACKEND", "local").lower()  # local / sqs
+INGEST_SQS_QUEUE_URL = os.getenv("INGEST_SQS_QUEUE_URL", "")
+INGEST_LOCAL_QUEUE_DIR = os.getenv("INGEST_LOCAL_QUEUE_DIR", "/tmp/factify-ingest-queue")
+INGEST_WORKER_CONCURRENCY = int(os.getenv("INGEST_WORKER_CONCURRENCY", "2"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_RETRY_BACKOFF = float(os.getenv("INGEST_RETRY_BACKOFF", "5"))
+INGEST_VISIBILITY_TIMEOUT = int(os.getenv("INGEST_VISIBILITY_TIMEOUT", "300"))
+
+# アップロード設定（本文をチャンク単位で一時ファイルとS3マルチパートアップロードへ流し、全体をメモリに載せない）
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_READ_CHUNK_SIZE = int(os.getenv("UPLOAD_READ_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "") or None  # 未指定ならシステムの一時ディレクトリ
+S3_MULTIPART_PART_SIZE = max(int(os.getenv("S3_MULTIPART_PART_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+S3_MULTIPART_CONCURRENCY = int(os.getenv("S3_MULTIPART_CONCURRENCY", "4"))
+
+# 同一内容のアップロードの重複排除（原本の共有と抽出結果キャッシュ）設定
+CONTENT_DEDUP_ENABLED = os.getenv("CONTENT_DEDUP_ENABLED", "true").lower() == "true"
+CONTENT_INDEX_TABLE_NAME = os.getenv("CONTENT_INDEX_TABLE_NAME", "factify-content-index")
+CONTENT_CACHE_PREFIX = os.getenv("CONTENT_CACHE_PREFIX", "content-cache")
+
+# 整形済みテキストの保存設定（大きな本文はDynamoDBのアイテムに入れず、圧縮してS3に保存する）
+TEXT_OFFLOAD_ENABLED = os.getenv("TEXT_OFFLOAD_ENABLED", "true").lower() == "true"
+TEXT_OFFLOAD_MIN_BYTES = int(os.getenv("TEXT_OFFLOAD_MIN_BYTES", "8192"))  # これ以上（UTF-8）の本文をS3に保存
+TEXT_OFFLOAD_PREFIX = os.getenv("TEXT_OFFLOAD_PREFIX", "formatted-text")
+TEXT_OFFLOAD_COMPRESSION = os.getenv("TEXT_OFFLOAD_COMPRESSION", "gzip").lower()  # gzip / zstd（zstandardが必要）
+TEXT_PREVIEW_CHARS = int(os.getenv("TEXT_PREVIEW_CHARS", "200"))
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# テキスト抽出プロセスプール設定（解析はワーカープロセスで行い、時間・メモリの上限を超えたら打ち切る）
+EXTRACTION_POOL_ENABLED = os.getenv("EXTRACTION_POOL_ENABLED", "true").lower() == "true"
+EXTRACTION_POOL_WORKERS = int(os.getenv("EXTRACTION_POOL_WORKERS", "2"))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "60"))
+EXTRACTION_MEMORY_LIMIT_MB = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "2048"))  # 0で無制限
+EXTRACTION_MAX_QUEUE = int(os.getenv("EXTRACTION_MAX_QUEUE", "16"))
+EXTRACTION_MAX_TASKS_PER_WORKER = int(os.getenv("EXTRACTION_MAX_TASKS_PER_WORKER", "200"))  # 0で入れ替えなし
+
+# PDF抽出設定（ページ数の多いPDFはページ範囲に分けて抽出ワーカーで並列に抽出する）
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "2000"))  # 0で無制限
+PDF_MAX_TEXT_BYTES = int(os.getenv("PDF_MAX_TEXT_BYTES", str(20 * 1024 * 1024)))  # 抽出テキスト（UTF-8）の上限。0で無制限
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))  # これ未満のページ数は1ワーカーで抽出
+PDF_PAGES_PER_TASK = max(int(os.getenv("PDF_PAGES_PER_TASK", "50")), 1)
+PDF_PAGE_SAMPLE_SIZE = int(os.getenv("PDF_PAGE_SAMPLE_SIZE", "20"))  # メタデータに記録する空ページ・画像のみのページ番号の件数（先頭から）
+
+# HTML抽出設定（lxmlがあれば1回の走査で抽出し、解釈が分かれる入力のみBeautifulSoupで抽出する）
+HTML_FAST_EXTRACTOR_ENABLED = os.getenv("HTML_FAST_EXTRACTOR_ENABLED", "true").lower() == "true"
+
+# 計測設定（処理段階ごとの所要時間を/metricsとServer-Timingヘッダーで公開）
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
 # 対応しているファイルタイプのリスト
 SUPPORTED_FILE_TYPES = [
     'text/plain',
@@ -32,7 +177,100 @@ __all__ = [
     'AWS_REGION',
     'DYNAMODB_TABLE_NAME',
     'S3_BUCKET_NAME',
+    'DYNAMODB_BATCH_GET_MAX_WORKERS',
+    'DYNAMODB_BATCH_GET_MAX_RETRIES',
+    'FALLBACK_SCAN_TOTAL_SEGMENTS',
+    'FALLBACK_SCAN_MAX_WORKERS',
+    'STORAGE_MAX_WORKERS',
+    'AWS_MAX_POOL_CONNECTIONS',
+    'AWS_CONNECT_TIMEOUT',
+    'AWS_READ_TIMEOUT',
+    'AWS_MAX_ATTEMPTS',
+    'LOCAL_INDEX_ENABLED',
+    'LOCAL_INDEX_DIR',
+    'LOCAL_INDEX_FLUSH_THRESHOLD',
     'OPENSEARCH_ENDPOINT',
+    'OPENSEARCH_POOL_SIZE',
+    'OPENSEARCH_TIMEOUT',
+    'OPENSEARCH_CONNECT_TIMEOUT',
+    'OPENSEARCH_HEALTH_TIMEOUT',
+    'OPENSEARCH_KEEPALIVE_EXPIRY',
+    'SEARCH_SOURCE_MODE',
+    'SEARCH_CACHE_ENABLED',
+    'SEARCH_CACHE_BACKEND',
+    'SEARCH_CACHE_TTL',
+    'SEARCH_CACHE_MAX_ENTRIES',
+    'SEARCH_CACHE_REDIS_URL',
+    'SEARCH_CURSOR_USE_PIT',
+    'SEARCH_CURSOR_KEEP_ALIVE',
+    'SEARCH_BATCH_MAX_QUERIES',
+    'SEARCH_STREAM_HYDRATE_BATCH',
+    'SEARCH_TIERED_QUERY',
+    'SEARCH_TIER_MIN_HITS',
+    'PASSAGE_INDEX_ENABLED',
+    'PASSAGE_INDEX_NAME',
+    'PASSAGE_CHARS',
+    'PASSAGE_OVERLAP',
+    'PASSAGE_MAX_PER_DOCUMENT',
+    'SEARCH_PASSAGES_PER_DOCUMENT',
+    'SEARCH_PASSAGES_MAX',
+    'SUGGEST_CACHE_TTL',
+    'SUGGEST_CACHE_MAX_ENTRIES',
+    'SUGGEST_TIMEOUT',
+    'MIGRATE_TOTAL_SEGMENTS',
+    'MIGRATE_MAX_CONCURRENT_BULKS',
+    'MIGRATE_BULK_MAX_BYTES',
+    'MIGRATE_BULK_MAX_DOCS',
+    'MIGRATE_MAX_RETRIES',
+    'MIGRATE_RETRY_BACKOFF',
+    'MIGRATE_CHECKPOINT_PATH',
+    'MIGRATE_DISABLE_REFRESH',
+    'JOBS_TABLE_NAME',
+    'JOBS_MAX_CONCURRENT',
+    'JOBS_MAX_WORKERS',
+    'JOBS_HEARTBEAT_INTERVAL',
+    'JOBS_HEARTBEAT_TIMEOUT',
+    'JOBS_RETENTION_DAYS',
+    'INGEST_MODE',
+    'INGEST_QUEUE_BACKEND',
+    'INGEST_SQS_QUEUE_URL',
+    'INGEST_LOCAL_QUEUE_DIR',
+    'INGEST_WORKER_CONCURRENCY',
+    'INGEST_MAX_ATTEMPTS',
+    'INGEST_RETRY_BACKOFF',
+    'INGEST_VISIBILITY_TIMEOUT',
+    'UPLOAD_MAX_BYTES',
+    'UPLOAD_READ_CHUNK_SIZE',
+    'UPLOAD_SPOOL_DIR',
+    'S3_MULTIPART_PART_SIZE',
+    'S3_MULTIPART_CONCURRENCY',
+    'CONTENT_DEDUP_ENABLED',
+    'CONTENT_INDEX_TABLE_NAME',
+    'CONTENT_CACHE_PREFIX',
+    'TEXT_OFFLOAD_ENABLED',
+    'TEXT_OFFLOAD_MIN_BYTES',
+    'TEXT_OFFLOAD_PREFIX',
+    'TEXT_OFFLOAD_COMPRESSION',
+    'TEXT_PREVIEW_CHARS',
+    'TEXT_CACHE_MAX_BYTES',
+    'EXTRACTION_POOL_ENABLED',
+    'EXTRACTION_POOL_WORKERS',
+    'EXTRACTION_TIMEOUT',
+    'EXTRACTION_MEMORY_LIMIT_MB',
+    'EXTRACTION_MAX_QUEUE',
+    'EXTRACTION_MAX_TASKS_PER_WORKER',
+    'PDF_MAX_PAGES',
+    'PDF_MAX_TEXT_BYTES',
+    'PDF_PARALLEL_MIN_PAGES',
+    'PDF_PAGES_PER_TASK',
+    'PDF_PAGE_SAMPLE_SIZE',
+    'HTML_FAST_EXTRACTOR_ENABLED',
+    'METRICS_ENABLED',
+    'SERVER_TIMING_ENABLED',
+    'OPENSEARCH_HEALTH_PROBE_INTERVAL',
+    'OPENSEARCH_BREAKER_FAILURE_THRESHOLD',
+    'OPENSEARCH_BREAKER_RESET_TIMEOUT',
+    'OPENSEARCH_BREAKER_HALF_OPEN_MAX_CALLS',
     'COGNITO_REGION',
     'COGNITO_USER_POOL_ID', 
     'COGNITO_CLIENT_ID',
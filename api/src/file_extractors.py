@@ -3,11 +3,23 @@
 各種ファイルタイプからテキストとメタデータを抽出する機能を提供
 """
 import io
-from typing import Dict, Any, Tuple
+import re
+from html.entities import html5 as _HTML5_ENTITIES
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
 import fitz  # PyMuPDF
 from docx import Document
 from bs4 import BeautifulSoup
 
+try:
+    from lxml import etree as _lxml_etree  # HTMLの高速抽出用（Cのパーサー）
+except ImportError:
+    _lxml_etree = None
+
+from .config import PDF_MAX_PAGES, PDF_MAX_TEXT_BYTES, PDF_PAGE_SAMPLE_SIZE, HTML_FAST_EXTRACTOR_ENABLED
+
+# 抽出処理のバージョン（抽出結果が変わる変更をしたら上げる。抽出結果キャッシュのキーに使う）
+EXTRACTOR_VERSION = "3"
+
 
 def extract_content_by_type(file_content: bytes, content_type: str) -> Tuple[str, Dict[str, Any]]:
     """
@@ -40,6 +52,31 @@ def extract_content_by_type(file_content: bytes, content_type: str) -> Tuple[str
         return "", {"error": f"サポートされていないファイルタイプ: {content_type}"}
 
 
+def extract_content_from_file(file_path: str, content_type: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    ファイルパスからコンテンツを抽出する（PDF・Docxはファイル全体をメモリに読み込まずに開く）
+    
+    Parameters:
+    -----------
+    file_path : str
+        ファイルのパス
+    content_type : str
+        ファイルのMIMEタイプ
+        
+    Returns:
+    --------
+    Tuple[str, Dict[str, Any]]
+        (抽出されたテキスト, メタデータ辞書)
+    """
+    if content_type == 'application/pdf':
+        return _extract_pdf_content(file_path, {})
+    elif content_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
+        return _extract_docx_content(file_path, {})
+    
+    with open(file_path, 'rb') as f:
+        return extract_content_by_type(f.read(), content_type)
+
+
 def _extract_plain_text(file_content: bytes, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
     """プレーンテキストファイルの内容を抽出"""
     text = file_content.decode('utf-8')
@@ -48,49 +85,195 @@ def _extract_plain_text(file_content: bytes, metadata: Dict[str, Any]) -> Tuple[
     return text, metadata
 
 
+# メタタグのname → メタデータのキー
+_HTML_META_KEYS = {"description": "html_description", "keywords": "html_keywords", "author": "html_author"}
+# 本文から除くタグ（BeautifulSoupでの抽出ではdecomposeするタグ）
+_HTML_SKIP_TAGS = frozenset(("script", "style"))
+# lxml（libxml2）が中身をタグとして解釈しない要素（html.parserはタグとして解釈する）
+_HTML_RAW_TEXT_TAGS = frozenset(("title", "textarea", "iframe", "xmp", "noembed", "noframes", "plaintext"))
+# パーサーが省略時に補うタグ（タグ数は元のHTMLに書かれているものだけを数える）
+_HTML_IMPLIED_TAGS = frozenset(("html", "head", "body"))
+_HTML_IMPLIED_TAG_RE = re.compile(r"<(?:html|head|body)[\s/>]", re.IGNORECASE)
+# 名前による文字参照（html.parserが参照とみなす範囲）
+_HTML_ENTITY_REF_RE = re.compile(r"&([A-Za-z][-.A-Za-z0-9]*)(;?)")
+# 数字のない数値文字参照（html.parserはそれ以降を文字列として扱う）
+_HTML_BROKEN_CHARREF_RE = re.compile(r"&#(?![0-9]|[xX][0-9A-Fa-f])")
+# 属性値の文字参照で取り除かれる制御文字・非文字（html.parserは取り除き、lxmlは残す）
+_HTML_INVALID_ATTR_CHAR_RE = re.compile(
+    "[\x01-\x08\x0b\x0e-\x1f\x7f\ufdd0-\ufdef"
+    + "".join(chr(plane * 0x10000 + 0xfffe) + chr(plane * 0x10000 + 0xffff) for plane in range(17))
+    + "]"
+)
+# ;なしで書ける文字参照（&ampなど）の名前の最大長
+_HTML_LEGACY_ENTITY_MAX_LENGTH = max(len(name) for name in _HTML5_ENTITIES if not name.endswith(";"))
+# タグの間の改行を含まない空白（1文字の空白以外）。BeautifulSoupは空白だけの文字列を1つの空白にまとめるが、
+# lxmlでは隣の文字列とつながる場合（対応しない終了タグ・補われたbodyなど）があり結果を揃えられない
+_HTML_AMBIGUOUS_SPACE_RE = re.compile(r">(?:[ \t\r\f]{2,}|[\t\r\f])<")
+
+
+class _HtmlFallback(Exception):
+    """lxmlとhtml.parserで解釈が分かれる入力（BeautifulSoupで抽出し直す）"""
+
+
+class _HtmlTextCollector:
+    """
+    lxmlのパーサーターゲット：1回の走査でテキスト・タイトル・メタタグ・タグ数を集める
+
+    BeautifulSoup（html.parser）での抽出と同じ結果になるよう、script/styleの中身は除き、
+    解釈が分かれる入力（templateの範囲、生テキスト要素内のタグなど）では_HtmlFallbackを送出する
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.title: Optional[str] = None
+        self.meta: Dict[str, str] = {}
+        self.tags_count = 0
+        self._title_parts: Optional[List[str]] = None
+        self._seen_meta = set()
+        self._skip_depth = 0
+        self._raw_text_depth = 0
+
+    def start(self, tag, attrib) -> None:
+        if self._skip_depth:
+            self._skip_depth += 1
+            return
+        if tag in _HTML_SKIP_TAGS:
+            self._skip_depth = 1
+            return
+        if tag == "template":
+            # html.parserはtemplate内のテキストを除くが、閉じていないタグがあると範囲の解釈が分かれる
+            raise _HtmlFallback()
+        if tag not in _HTML_IMPLIED_TAGS:
+            self.tags_count += 1
+        if tag in _HTML_RAW_TEXT_TAGS:
+            self._raw_text_depth += 1
+        if tag == "title" and self.title is None and self._title_parts is None:
+            self._title_parts = []
+        elif tag == "meta":
+            name = attrib.get("name")
+            if name in _HTML_META_KEYS and name not in self._seen_meta:
+                # 最初に見つかったメタタグのみ使う（contentが空なら設定しない）
+                self._seen_meta.add(name)
+                content = attrib.get("content")
+                if content and _HTML_INVALID_ATTR_CHAR_RE.search(content):
+                    raise _HtmlFallback()
+                if content:
+                    self.meta[_HTML_META_KEYS[name]] = content
+
+    def end(self, tag) -> None:
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        if tag in _HTML_RAW_TEXT_TAGS:
+            self._raw_text_depth -= 1
+        if tag == "title" and self._title_parts is not None and self.title is None:
+            self.title = "".join(self._title_parts)
+
+    def data(self, data) -> None:
+        if self._skip_depth:
+            return
+        if self._raw_text_depth and ("<" in data or "&" in data):
+            raise _HtmlFallback()
+        self.parts.append(data)
+        if self._title_parts is not None and self.title is None:
+            self._title_parts.append(data)
+
+    def comment(self, text) -> None:
+        # html.parserはCDATAセクションを本文として扱う
+        if not self._skip_depth and text.startswith("[CDATA["):
+            raise _HtmlFallback()
+
+    def close(self) -> "_HtmlTextCollector":
+        return self
+
+
+def _has_ambiguous_entity(html_content: str) -> bool:
+    """
+    html.parserとlxmlで展開結果が変わりうる文字参照があるか
+
+    html.parserは名前全体が既知の参照だけを展開し（未知の参照は末尾の;を落として残す）、
+    lxmlは;のない参照を;なしで書ける名前の前方一致で展開する
+    """
+    if _HTML_BROKEN_CHARREF_RE.search(html_content):
+        return True
+    for name, semicolon in set(_HTML_ENTITY_REF_RE.findall(html_content)):
+        if semicolon:
+            if name + ";" not in _HTML5_ENTITIES:
+                return True
+        elif name not in _HTML5_ENTITIES:
+            if name + ";" in _HTML5_ENTITIES:
+                return True
+            for length in range(2, min(len(name), _HTML_LEGACY_ENTITY_MAX_LENGTH) + 1):
+                if name[:length] in _HTML5_ENTITIES:
+                    return True
+    return False
+
+
+def _extract_html_single_pass(html_content: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    lxmlで1回だけ走査してHTMLのテキストとメタデータを抽出
+
+    Returns:
+    --------
+    Optional[Tuple[str, Dict[str, Any]]]
+        (抽出されたテキスト, HTMLのメタデータ)。解釈が分かれる入力（先頭のBOM・NUL文字・あいまいな文字参照・末尾の閉じていないタグなど）ではNone
+    """
+    if html_content.startswith("\ufeff") or "\x00" in html_content:
+        return None
+    if html_content.rfind("<!--") > html_content.rfind("-->"):
+        return None
+    tail = html_content[html_content.rfind(">") + 1:]
+    if "<" in tail or "&" in tail:
+        # 末尾の閉じていないタグ・文字参照（html.parserは文字列として残す）
+        return None
+    if _HTML_AMBIGUOUS_SPACE_RE.search(html_content) or _has_ambiguous_entity(html_content):
+        return None
+    collector = _HtmlTextCollector()
+    parser = _lxml_etree.HTMLParser(target=collector, huge_tree=True)
+    try:
+        parser.feed(html_content)
+        parser.close()
+    except _HtmlFallback:
+        return None
+    except _lxml_etree.LxmlError:
+        return None
+    
+    metadata: Dict[str, Any] = {}
+    if collector.title is not None:
+        metadata['html_title'] = collector.title.strip()
+    metadata.update(collector.meta)
+    text = _normalize_html_text("".join(collector.parts))
+    metadata['character_count'] = len(text)
+    metadata['html_tags_count'] = collector.tags_count + len(_HTML_IMPLIED_TAG_RE.findall(html_content))
+    return text, metadata
+
+
+def _normalize_html_text(text: str) -> str:
+    """HTMLから取り出したテキストの行を正規化"""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+
 def _extract_html_content(file_content: bytes, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
-    """HTMLファイルの内容とメタデータを抽出"""
+    """
+    HTMLファイルの内容とメタデータを抽出
+    
+    lxmlが使える場合は1回の走査で抽出し、lxmlとhtml.parserで解釈が分かれる入力はBeautifulSoupで抽出する
+    （どちらでも同じテキストとメタデータになる）
+    """
     try:
         # HTMLコンテンツをデコード
         html_content = file_content.decode('utf-8')
         
-        # Beautiful Soupでパース
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # メタデータを抽出
-        title_tag = soup.find('title')
-        if title_tag:
-            metadata['html_title'] = title_tag.get_text().strip()
-        
-        # メタタグからメタデータを抽出
-        meta_description = soup.find('meta', attrs={'name': 'description'})
-        if meta_description and meta_description.get('content'):
-            metadata['html_description'] = meta_description.get('content')
-            
-        meta_keywords = soup.find('meta', attrs={'name': 'keywords'})
-        if meta_keywords and meta_keywords.get('content'):
-            metadata['html_keywords'] = meta_keywords.get('content')
-            
-        meta_author = soup.find('meta', attrs={'name': 'author'})
-        if meta_author and meta_author.get('content'):
-            metadata['html_author'] = meta_author.get('content')
-        
-        # テキストコンテンツを抽出（スクリプトやスタイルは除外）
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        # テキストを抽出
-        text = soup.get_text()
+        if HTML_FAST_EXTRACTOR_ENABLED and _lxml_etree is not None:
+            extracted = _extract_html_single_pass(html_content)
+            if extracted is not None:
+                text, html_metadata = extracted
+                metadata.update(html_metadata)
+                return text, metadata
         
-        # 行の正規化
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        metadata['character_count'] = len(text)
-        metadata['html_tags_count'] = len(soup.find_all())
-        
-        return text, metadata
+        return _extract_html_with_soup(html_content, metadata)
         
     except Exception as e:
         # HTMLの解析に失敗した場合
@@ -98,31 +281,60 @@ def _extract_html_content(file_content: bytes, metadata: Dict[str, Any]) -> Tupl
         return "", {"error": str(e)}
 
 
-def _extract_pdf_content(file_content: bytes, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
-    """PDFファイルの内容とメタデータを抽出"""
-    try:
-        # PyMuPDFを使用してPDFを開く
-        pdf_document = fitz.open(stream=file_content, filetype="pdf")
-        page_count = len(pdf_document)
-        metadata['page_count'] = page_count
-        
-        # 全ページのテキストを抽出
-        text = ""
-        for page_num in range(page_count):
-            page = pdf_document[page_num]
-            text += page.get_text() + " "
-            
-        metadata['character_count'] = len(text)
+def _extract_html_with_soup(html_content: str, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """BeautifulSoup（html.parser）でHTMLのテキストとメタデータを抽出"""
+    # Beautiful Soupでパース
+    soup = BeautifulSoup(html_content, 'html.parser')
+    
+    # メタデータを抽出
+    title_tag = soup.find('title')
+    if title_tag:
+        metadata['html_title'] = title_tag.get_text().strip()
+    
+    # メタタグからメタデータを抽出
+    meta_description = soup.find('meta', attrs={'name': 'description'})
+    if meta_description and meta_description.get('content'):
+        metadata['html_description'] = meta_description.get('content')
         
-        # PDFのメタデータを取得
-        pdf_metadata = pdf_document.metadata
-        if pdf_metadata:
-            for key, value in pdf_metadata.items():
-                if value:  # 空でない値のみ保存
-                    clean_key = key.lower()
-                    metadata[f'pdf_{clean_key}'] = str(value)
+    meta_keywords = soup.find('meta', attrs={'name': 'keywords'})
+    if meta_keywords and meta_keywords.get('content'):
+        metadata['html_keywords'] = meta_keywords.get('content')
         
-        pdf_document.close()
+    meta_author = soup.find('meta', attrs={'name': 'author'})
+    if meta_author and meta_author.get('content'):
+        metadata['html_author'] = meta_author.get('content')
+    
+    # テキストコンテンツを抽出（スクリプトやスタイルは除外）
+    for script in soup(["script", "style"]):
+        script.decompose()
+    
+    # テキストを抽出
+    text = _normalize_html_text(soup.get_text())
+    
+    metadata['character_count'] = len(text)
+    metadata['html_tags_count'] = len(soup.find_all())
+    
+    return text, metadata
+
+
+def _extract_pdf_content(source: Union[bytes, str], metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """PDFファイルの内容とメタデータを抽出（sourceはファイルの内容またはパス）"""
+    try:
+        pdf_document = _open_pdf(source)
+        try:
+            page_count = len(pdf_document)
+            metadata['page_count'] = page_count
+            
+            # 上限までのページのテキストを抽出
+            stop = min(page_count, PDF_MAX_PAGES) if PDF_MAX_PAGES > 0 else page_count
+            text, pages = _collect_pdf_pages(pdf_document, 0, stop, PDF_MAX_TEXT_BYTES)
+            _set_pdf_page_metadata(metadata, pages, page_count)
+            metadata['character_count'] = len(text)
+            
+            # PDFのメタデータを取得
+            metadata.update(_pdf_document_metadata(pdf_document))
+        finally:
+            pdf_document.close()
         return text, metadata
         
     except Exception as e:
@@ -131,12 +343,185 @@ def _extract_pdf_content(file_content: bytes, metadata: Dict[str, Any]) -> Tuple
         return "", {"error": str(e)}
 
 
-def _extract_docx_content(file_content: bytes, metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
-    """Docxファイルの内容とメタデータを抽出"""
+def pdf_info(source: Union[bytes, str]) -> Tuple[str, Dict[str, Any]]:
+    """
+    PDFのページ数と文書のメタデータだけを取得（ページ並列抽出の準備用）
+    
+    Returns:
+    --------
+    Tuple[str, Dict[str, Any]]
+        ("", {"page_count": ページ数, "pdf_*": 文書のメタデータ})
+    """
+    try:
+        pdf_document = _open_pdf(source)
+        try:
+            return "", {"page_count": len(pdf_document), **_pdf_document_metadata(pdf_document)}
+        finally:
+            pdf_document.close()
+    except Exception as e:
+        print(f"PDF解析エラー: {str(e)}")
+        return "", {"error": str(e)}
+
+
+def extract_pdf_pages(source: Union[bytes, str], start: int, stop: int,
+                      max_bytes: int = 0) -> Tuple[str, Dict[str, Any]]:
+    """
+    PDFのページ範囲のテキストを抽出（ページ並列抽出の1タスク。文書はタスクごとに開く）
+    
+    Parameters:
+    -----------
+    source : Union[bytes, str]
+        ファイルの内容またはパス
+    start : int
+        開始ページ（0始まり）
+    stop : int
+        終了ページ（このページは含まない）
+    max_bytes : int
+        この範囲で抽出するテキスト（UTF-8）の上限。0で無制限
+    
+    Returns:
+    --------
+    Tuple[str, Dict[str, Any]]
+        (範囲のテキスト, ページごとの情報)。ページごとの情報はmerge_pdf_pagesで結合する
+    """
+    try:
+        pdf_document = _open_pdf(source)
+        try:
+            return _collect_pdf_pages(pdf_document, start, min(stop, len(pdf_document)), max_bytes)
+        finally:
+            pdf_document.close()
+    except Exception as e:
+        print(f"PDF解析エラー: {str(e)}")
+        return "", {"error": str(e)}
+
+
+def merge_pdf_pages(parts: List[Tuple[str, Dict[str, Any]]], info: Dict[str, Any],
+                    max_bytes: int = 0) -> Tuple[str, Dict[str, Any]]:
+    """
+    ページ順に並んだページ範囲の抽出結果を結合し、PDF全体のテキストとメタデータにする
+    
+    結合後のテキストが上限を超える場合は、上限に収まるページまでで打ち切る
+    
+    Parameters:
+    -----------
+    parts : List[Tuple[str, Dict[str, Any]]]
+        extract_pdf_pagesの結果（ページ順）
+    info : Dict[str, Any]
+        pdf_infoで取得したページ数と文書のメタデータ
+    max_bytes : int
+        PDF全体で抽出するテキスト（UTF-8）の上限。0で無制限
+    """
+    texts = []
+    pages = {"page_char_counts": [], "page_bytes": [], "empty_pages": [], "image_only_pages": [], "truncated": False}
+    used = 0
+    for text, part in parts:
+        keep = 0
+        keep_chars = 0
+        for chars, size in zip(part["page_char_counts"], part["page_bytes"]):
+            if max_bytes > 0 and used + size > max_bytes:
+                break
+            used += size
+            keep += 1
+            keep_chars += chars + 1
+        last_page = part["start"] + keep
+        texts.append(text if keep == len(part["page_char_counts"]) else text[:keep_chars])
+        pages["page_char_counts"].extend(part["page_char_counts"][:keep])
+        pages["page_bytes"].extend(part["page_bytes"][:keep])
+        pages["empty_pages"].extend(page for page in part["empty_pages"] if page <= last_page)
+        pages["image_only_pages"].extend(page for page in part["image_only_pages"] if page <= last_page)
+        if keep < len(part["page_char_counts"]) or part["truncated"]:
+            pages["truncated"] = True
+            break
+    
+    text = "".join(texts)
+    metadata = dict(info)
+    _set_pdf_page_metadata(metadata, pages, info["page_count"])
+    metadata['character_count'] = len(text)
+    return text, metadata
+
+
+def _open_pdf(source: Union[bytes, str]):
+    """PyMuPDFでPDFを開く（パスの場合は必要なページだけを読み込む）"""
+    if isinstance(source, str):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _iter_pdf_pages(pdf_document, start: int, stop: int) -> Iterator[Tuple[str, int]]:
+    """ページごとに (テキスト, 画像の数) を順に返す"""
+    for page_num in range(start, stop):
+        page = pdf_document[page_num]
+        yield page.get_text(), len(page.get_images())
+
+
+def _collect_pdf_pages(pdf_document, start: int, stop: int, max_bytes: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    ページ範囲のテキストを抽出して1回で結合し、ページごとの文字数・空ページ・画像のみのページを記録
+    
+    テキスト（UTF-8）がmax_bytesを超える手前のページで打ち切る（0で無制限）
+    """
+    texts = []
+    pages = {
+        "start": start,
+        "page_char_counts": [],
+        "page_bytes": [],
+        "empty_pages": [],
+        "image_only_pages": [],
+        "truncated": False
+    }
+    used = 0
+    for page_num, (page_text, image_count) in enumerate(_iter_pdf_pages(pdf_document, start, stop), start):
+        # ページの区切りの空白を含めたバイト数
+        size = len(page_text.encode('utf-8')) + 1
+        if max_bytes > 0 and used + size > max_bytes:
+            pages["truncated"] = True
+            break
+        used += size
+        texts.append(page_text)
+        pages["page_char_counts"].append(len(page_text))
+        pages["page_bytes"].append(size)
+        if not page_text.strip():
+            pages["empty_pages"].append(page_num + 1)
+            if image_count:
+                pages["image_only_pages"].append(page_num + 1)
+    
+    text = "".join(f"{page_text} " for page_text in texts)
+    return text, pages
+
+
+def _set_pdf_page_metadata(metadata: Dict[str, Any], pages: Dict[str, Any], page_count: int) -> None:
+    """
+    ページの集計と、上限で打ち切った場合はその理由をメタデータに設定
+    （ページごとのリストはDynamoDB・OpenSearchのドキュメントを大きくするため、件数と先頭のページ番号のみ記録）
+    """
+    extracted = len(pages["page_char_counts"])
+    metadata['extracted_pages'] = extracted
+    metadata['empty_page_count'] = len(pages["empty_pages"])
+    metadata['image_only_page_count'] = len(pages["image_only_pages"])
+    metadata['first_empty_pages'] = pages["empty_pages"][:PDF_PAGE_SAMPLE_SIZE]
+    metadata['first_image_only_pages'] = pages["image_only_pages"][:PDF_PAGE_SAMPLE_SIZE]
+    if extracted < page_count:
+        metadata['truncated'] = True
+        metadata['truncation_reason'] = "byte_limit" if pages["truncated"] else "page_limit"
+
+
+def _pdf_document_metadata(pdf_document) -> Dict[str, Any]:
+    """PDFの文書メタデータ（空でない値のみ、pdf_ を付けたキーで返す）"""
+    metadata = {}
+    pdf_metadata = pdf_document.metadata
+    if pdf_metadata:
+        for key, value in pdf_metadata.items():
+            if value:  # 空でない値のみ保存
+                clean_key = key.lower()
+                metadata[f'pdf_{clean_key}'] = str(value)
+    return metadata
+
+
+def _extract_docx_content(source: Union[bytes, str], metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Docxファイルの内容とメタデータを抽出（sourceはファイルの内容またはパス）"""
     try:
         # python-docxを使用してDocxファイルを開く
-        docx_file = io.BytesIO(file_content)
-        document = Document(docx_file)
+        document = Document(source if isinstance(source, str) else io.BytesIO(source))
         
         # 全段落のテキストを抽出
         text = ""
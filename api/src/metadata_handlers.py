@@ -5,6 +5,11 @@
 import os
 from typing import Dict, Any, Optional
 
+# 非同期取り込みの処理状態（processing_status属性。属性がない既存のドキュメントは処理済み）
+PROCESSING_STATUS_PROCESSING = "processing"
+PROCESSING_STATUS_READY = "ready"
+PROCESSING_STATUS_FAILED = "failed"
+
 
 def generate_auto_title(title: str, content_type: str, extracted_text: str, 
                        file_metadata: Dict[str, Any], file_name: str) -> str:
@@ -124,7 +129,9 @@ def create_metadata_for_ai(auto_title: str, description: str, file_extension: st
 def create_dynamodb_item(file_id: str, s3_key: str, file_name: str, file_extension: str,
                         uploaded_at: str, auto_title: str, description: str, 
                         content_type: str, file_metadata: Dict[str, Any], 
-                        formatted_text: str, user_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                        formatted_text: str, user_info: Optional[Dict[str, Any]] = None,
+                        language: Optional[str] = None, file_size: Optional[int] = None,
+                        content_sha256: Optional[str] = None) -> Dict[str, Any]:
     """
     DynamoDB用のアイテム辞書を作成する
     
@@ -152,6 +159,12 @@ def create_dynamodb_item(file_id: str, s3_key: str, file_name: str, file_extensi
         AI用に整形されたテキスト
     user_info : Optional[Dict[str, Any]]
         ユーザー情報（認証されている場合のみ）
+    language : Optional[str]
+        本文から判定した言語コード
+    file_size : Optional[int]
+        元ファイルのバイト数
+    content_sha256 : Optional[str]
+        元ファイルのSHA-256（16進数）
         
     Returns:
     --------
@@ -171,6 +184,11 @@ def create_dynamodb_item(file_id: str, s3_key: str, file_name: str, file_extensi
         "formatted_text": formatted_text
     }
     
+    if language:
+        item["language"] = language
+    
+    _set_content_info(item, file_size, content_sha256)
+    
     # ユーザー情報が提供されている場合は追加
     if user_info:
         item.update({
@@ -181,3 +199,47 @@ def create_dynamodb_item(file_id: str, s3_key: str, file_name: str, file_extensi
         item["is_authenticated"] = False
     
     return item
+
+
+def create_processing_item(file_id: str, s3_key: str, file_name: str, file_extension: str,
+                           uploaded_at: str, title: str, description: Optional[str],
+                           content_type: str, user_id: str, file_size: Optional[int] = None,
+                           content_sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    非同期取り込みの受付時に保存する処理中のDynamoDBアイテムを作成する
+    
+    本文・抽出メタデータは取り込みワーカーがcreate_dynamodb_itemで作成したアイテムで置き換える
+    
+    Returns:
+    --------
+    Dict[str, Any]
+        DynamoDB用のアイテム辞書（processing_statusはprocessing）
+    """
+    item = {
+        "id": file_id,
+        "s3_key": s3_key,
+        "file_name": file_name,
+        "file_type": file_extension,
+        "uploaded_at": uploaded_at,
+        "title": title,
+        "description": description or "",
+        "content_type": content_type,
+        "user_id": user_id,
+        "is_authenticated": True,
+        "processing_status": PROCESSING_STATUS_PROCESSING
+    }
+    _set_content_info(item, file_size, content_sha256)
+    return item
+
+
+def _set_content_info(item: Dict[str, Any], file_size: Optional[int], content_sha256: Optional[str]) -> None:
+    """元ファイルのサイズとチェックサムをアイテムに設定（不明な場合は設定しない）"""
+    if file_size is not None:
+        item["file_size"] = file_size
+    if content_sha256:
+        item["content_sha256"] = content_sha256
+
+
+def is_ready_item(item: Dict[str, Any]) -> bool:
+    """取り込みが完了したアイテムかどうか（検索インデックスへの登録対象）"""
+    return item.get("processing_status", PROCESSING_STATUS_READY) == PROCESSING_STATUS_READY
@@ -6,6 +6,17 @@ from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 
 
+class Passage(BaseModel):
+    """
+    本文を一定長に分けたパッセージ（passageモードの検索結果）
+    """
+    id: str  # {ドキュメントID}:{ordinal}
+    ordinal: int  # 本文中の順番
+    start: int  # 本文（CONTENTセクション）中の開始位置（文字数）
+    text: str
+    score: Optional[float] = None
+
+
 class Document(BaseModel):
     """
     DynamoDBに保存されるドキュメントを表現するモデル
@@ -19,6 +30,8 @@ class Document(BaseModel):
     title: str
     description: str
     extracted_metadata: Dict[str, Any]
+    language: Optional[str] = None  # アップロード時に判定した言語コード
+    passages: Optional[List[Passage]] = None  # passageモードの検索でのみ設定（formatted_textは空）
 
 
 class SearchRequest(BaseModel):
@@ -26,9 +39,13 @@ class SearchRequest(BaseModel):
     検索リクエスト用モデル
     """
     query: str
-    language: Optional[str] = "en"
+    language: Optional[str] = None  # 指定した場合、その言語のドキュメントのみを検索
     max_results: Optional[int] = 5
     user_only: Optional[bool] = False  # ユーザー固有のファイルのみを検索するかどうか
+    include_content: Optional[bool] = True  # Falseの場合、formatted_textは本文ではなくハイライト断片を返す
+    cursor: Optional[str] = None  # 前回レスポンスのnext_cursor（続きのページを取得する場合）
+    search_mode: Optional[str] = "document"  # "passage"の場合、本文の代わりにドキュメントごとの上位パッセージを返す
+    passages_per_document: Optional[int] = None  # passageモードで返すパッセージ数（省略時は既定値）
 
 
 class SearchResponse(BaseModel):
@@ -39,6 +56,55 @@ class SearchResponse(BaseModel):
     query: str
     total_results: int
     results: List[Document]
+    next_cursor: Optional[str] = None  # 続きのページがある場合のカーソル
+    query_tier: Optional[str] = None  # OpenSearchで応答した検索段（phrase_and / or / fuzzy）
+
+
+class BatchSearchRequest(BaseModel):
+    """
+    一括検索リクエスト用モデル
+    """
+    searches: List[SearchRequest]
+
+
+class BatchSearchResult(BaseModel):
+    """
+    一括検索の検索ごとの結果
+    """
+    success: bool
+    query: str
+    total_results: int = 0
+    results: List[Document] = []
+    next_cursor: Optional[str] = None
+    query_tier: Optional[str] = None
+    error: Optional[str] = None  # 失敗した場合のエラー内容
+
+
+class BatchSearchResponse(BaseModel):
+    """
+    一括検索レスポンス用モデル
+    """
+    success: bool
+    total_queries: int
+    failed_queries: int
+    responses: List[BatchSearchResult]
+
+
+class Suggestion(BaseModel):
+    """
+    入力補完の候補
+    """
+    id: str
+    title: str
+
+
+class SuggestResponse(BaseModel):
+    """
+    入力補完レスポンス用モデル
+    """
+    success: bool
+    query: str
+    suggestions: List[Suggestion]
 
 
 class UploadResponse(BaseModel):
@@ -5,8 +5,10 @@
 import uuid
 import boto3
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from ..config import AWS_REGION, DYNAMODB_TABLE_NAME
+from ..aws_services import BOTO_CONFIG
+from .metrics import metrics
 
 
 class AccessLoggerService:
@@ -14,7 +16,7 @@ class AccessLoggerService:
     
     def __init__(self):
         # DynamoDBクライアントの初期化
-        self.dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
+        self.dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION, config=BOTO_CONFIG)
         
         # テーブル名を動的に生成（環境に応じて）
         account_id = boto3.client('sts').get_caller_identity()['Account']
@@ -46,6 +48,27 @@ class AccessLoggerService:
         search_query : str
             検索クエリ
             
+        Returns:
+        --------
+        bool
+            記録の成功/失敗
+        """
+        return self.log_search_access_batch(accessing_user_id, [(search_query, accessed_documents)])
+    
+    @metrics.timed("access_log.write")
+    def log_search_access_batch(self,
+                                accessing_user_id: str,
+                                searches: List[Tuple[str, List[Dict]]]) -> bool:
+        """
+        複数の検索結果のアクセスをまとめて記録する（BatchWriteItemで一括書き込み）
+        
+        Parameters:
+        -----------
+        accessing_user_id : str
+            検索を実行したユーザーID
+        searches : List[Tuple[str, List[Dict]]]
+            (検索クエリ, アクセスされたドキュメントのリスト) のリスト
+            
         Returns:
         --------
         bool
@@ -58,36 +81,40 @@ class AccessLoggerService:
         try:
             current_time = datetime.utcnow().isoformat()
             
-            # 各ドキュメントのアクセスを記録
-            for rank, document in enumerate(accessed_documents, 1):
-                transaction_id = str(uuid.uuid4())
-                document_owner_id = document.get('user_id', 'unknown')
-                
-                # 自分のドキュメントへのアクセスは記録しない（インセンティブ対象外）
-                if document_owner_id == accessing_user_id:
-                    continue
-                
-                access_log_item = {
-                    'transaction_id': transaction_id,
-                    'timestamp': current_time,
-                    'accessed_document_id': document.get('id'),
-                    'accessing_user_id': accessing_user_id,
-                    'document_owner_id': document_owner_id,
-                    'search_query': search_query,
-                    'search_rank': rank,
-                    'access_type': 'search_result'
-                }
-                
-                # DynamoDBに非同期で記録
-                self.access_logs_table.put_item(Item=access_log_item)
+            access_log_items = []
+            for search_query, accessed_documents in searches:
+                # 各ドキュメントのアクセスを記録
+                for rank, document in enumerate(accessed_documents, 1):
+                    document_owner_id = document.get('user_id', 'unknown')
+                    
+                    # 自分のドキュメントへのアクセスは記録しない（インセンティブ対象外）
+                    if document_owner_id == accessing_user_id:
+                        continue
+                    
+                    access_log_items.append({
+                        'transaction_id': str(uuid.uuid4()),
+                        'timestamp': current_time,
+                        'accessed_document_id': document.get('id'),
+                        'accessing_user_id': accessing_user_id,
+                        'document_owner_id': document_owner_id,
+                        'search_query': search_query,
+                        'search_rank': rank,
+                        'access_type': 'search_result'
+                    })
+            
+            # 25件ずつのBatchWriteItemにまとめて書き込む（未処理分はbatch_writerが再送）
+            with self.access_logs_table.batch_writer() as writer:
+                for access_log_item in access_log_items:
+                    writer.put_item(Item=access_log_item)
                 
-            print(f"アクセス履歴記録完了: {len(accessed_documents)}件")
+            print(f"アクセス履歴記録完了: {len(access_log_items)}件（{len(searches)}検索）")
             return True
             
         except Exception as e:
             print(f"アクセス履歴記録エラー: {e}")
             return False
     
+    @metrics.timed("access_log.query_user")
     def get_user_access_logs(self, 
                            user_id: str, 
                            start_date: Optional[str] = None, 
@@ -133,6 +160,7 @@ class AccessLoggerService:
             print(f"アクセス履歴取得エラー: {e}")
             return []
     
+    @metrics.timed("access_log.document_stats")
     def get_document_access_stats(self, 
                                  document_id: str, 
                                  period_days: int = 30) -> Dict:
@@ -181,6 +209,7 @@ class AccessLoggerService:
             print(f"ドキュメント統計取得エラー: {e}")
             return {}
     
+    @metrics.timed("access_log.incentive")
     def calculate_incentive_points(self, 
                                   owner_user_id: str, 
                                   period_month: str) -> Dict:
@@ -259,6 +288,7 @@ class AccessLoggerService:
             print(f"インセンティブ計算エラー: {e}")
             return {}
     
+    @metrics.timed("access_log.save_incentive")
     def save_incentive_summary(self, incentive_data: Dict) -> bool:
         """
         インセンティブ集計結果を保存する
@@ -286,6 +316,7 @@ class AccessLoggerService:
             return False
 
 
+    @metrics.timed("access_log.weekly_activity")
     def get_weekly_user_activity(self, days: int = 7) -> Dict:
         """
         過去N日間の日別ユニークユーザー数を取得する
@@ -0,0 +1,166 @@
+"""
+非同期ストレージアダプターモジュール
+同期boto3によるDynamoDB（ドキュメント・アクセス履歴・インセンティブ集計テーブル）とS3の操作を
+専用スレッドプールで実行し、async def のエンドポイントからawaitできるようにする（イベントループを止めない）
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..aws_services import aws_services, AWSServices, DOCUMENT_RESPONSE_FIELDS
+from ..config import STORAGE_MAX_WORKERS
+from .access_logger_service import access_logger_service, AccessLoggerService
+from .metrics import metrics
+
+
+class AsyncTable:
+    """DynamoDBテーブル（boto3のTableリソース）の操作をawaitできるようにしたもの"""
+
+    def __init__(self, storage: "AsyncStorage", table, name: str):
+        self._storage = storage
+        self.table = table
+        self.name = name
+
+    async def put_item(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("put_item", kwargs)
+
+    async def get_item(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("get_item", kwargs)
+
+    async def update_item(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("update_item", kwargs)
+
+    async def delete_item(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("delete_item", kwargs)
+
+    async def query(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("query", kwargs)
+
+    async def scan(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("scan", kwargs)
+
+    async def _call(self, operation: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        with metrics.span(f"dynamodb.{self.name}.{operation}"):
+            return await self._storage.run(getattr(self.table, operation), **kwargs)
+
+
+class AsyncStorage:
+    """
+    ストレージ操作の非同期アダプター
+
+    boto3はスレッドセーフなクライアント（接続プールはBOTO_CONFIGで拡張済み）をスレッドプールから使う。
+    呼び出し元のコンテキストを引き継ぐため、スレッド内のスパンもリクエストのServer-Timingに含まれる
+    """
+
+    def __init__(self, aws: AWSServices = aws_services,
+                 access_logger: AccessLoggerService = access_logger_service,
+                 max_workers: int = STORAGE_MAX_WORKERS):
+        self.aws = aws
+        self.access_logger = access_logger
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+        self.documents = AsyncTable(self, aws.table, "documents")
+        self.access_logs = (
+            AsyncTable(self, access_logger.access_logs_table, "access_logs")
+            if access_logger.access_logs_table is not None else None
+        )
+        self.incentive_summary = (
+            AsyncTable(self, access_logger.incentive_summary_table, "incentive_summary")
+            if access_logger.incentive_summary_table is not None else None
+        )
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """同期関数をストレージ用スレッドプールで実行して結果を返す"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(context.run, func, *args, **kwargs)
+        )
+
+    # ==================== ドキュメントテーブル ====================
+
+    async def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return await self.run(self.aws.get_document, doc_id)
+
+    async def put_document(self, item: Dict[str, Any], require_existing: bool = False) -> bool:
+        return await self.run(self.aws.save_to_dynamodb, item, require_existing)
+
+    async def delete_document(self, doc_id: str) -> None:
+        await self.run(self.aws.delete_document, doc_id)
+
+    async def update_processing_status(self, doc_id: str, status: str, error: Optional[str] = None) -> None:
+        await self.run(self.aws.update_processing_status, doc_id, status, error)
+
+    async def batch_get_documents(self, doc_ids: List[str],
+                                  fields: Optional[List[str]] = DOCUMENT_RESPONSE_FIELDS) -> List[Dict]:
+        return await self.run(self.aws.batch_get_documents, doc_ids, fields)
+
+    async def list_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self.run(self.aws.list_user_documents, user_id)
+
+    async def parallel_scan_search(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self.run(self.aws.parallel_scan_search, **kwargs)
+
+    # ==================== S3 ====================
+
+    async def put_object(self, file_content: bytes, s3_key: str, content_type: str) -> None:
+        await self.run(self.aws.upload_file_to_s3, file_content, s3_key, content_type)
+
+    async def get_object(self, s3_key: str) -> bytes:
+        return await self.run(self.aws.download_file_from_s3, s3_key)
+
+    async def delete_object(self, s3_key: str) -> None:
+        await self.run(self.aws.delete_file_from_s3, s3_key)
+
+    async def download_to_path(self, s3_key: str, file_path: str) -> None:
+        await self.run(self.aws.download_file_to_path, s3_key, file_path)
+
+    async def create_multipart_upload(self, s3_key: str, content_type: str) -> str:
+        return await self.run(self.aws.create_multipart_upload, s3_key, content_type)
+
+    async def upload_part(self, s3_key: str, upload_id: str, part_number: int,
+                          body: bytes, content_md5: str) -> str:
+        return await self.run(self.aws.upload_part, s3_key, upload_id, part_number, body, content_md5)
+
+    async def complete_multipart_upload(self, s3_key: str, upload_id: str,
+                                        parts: List[Dict[str, Any]]) -> None:
+        await self.run(self.aws.complete_multipart_upload, s3_key, upload_id, parts)
+
+    async def abort_multipart_upload(self, s3_key: str, upload_id: str) -> None:
+        await self.run(self.aws.abort_multipart_upload, s3_key, upload_id)
+
+    # ==================== アクセス履歴・インセンティブ集計テーブル ====================
+
+    async def log_search_access(self, accessed_documents: List[Dict], accessing_user_id: str,
+                                search_query: str) -> bool:
+        return await self.run(
+            self.access_logger.log_search_access, accessed_documents, accessing_user_id, search_query
+        )
+
+    async def log_search_access_batch(self, accessing_user_id: str,
+                                      searches: List[Tuple[str, List[Dict]]]) -> bool:
+        return await self.run(self.access_logger.log_search_access_batch, accessing_user_id, searches)
+
+    async def get_user_access_logs(self, user_id: str, limit: int = 100) -> List[Dict]:
+        return await self.run(self.access_logger.get_user_access_logs, user_id=user_id, limit=limit)
+
+    async def get_document_access_stats(self, document_id: str, period_days: int = 30) -> Dict:
+        return await self.run(
+            self.access_logger.get_document_access_stats, document_id=document_id, period_days=period_days
+        )
+
+    async def get_weekly_user_activity(self, days: int = 7) -> Dict:
+        return await self.run(self.access_logger.get_weekly_user_activity, days=days)
+
+    async def calculate_incentive_points(self, owner_user_id: str, period_month: str) -> Optional[Dict]:
+        return await self.run(
+            self.access_logger.calculate_incentive_points,
+            owner_user_id=owner_user_id, period_month=period_month
+        )
+
+    async def save_incentive_summary(self, incentive_data: Dict) -> bool:
+        return await self.run(self.access_logger.save_incentive_summary, incentive_data)
+
+
+# シングルトンインスタンス
+storage = AsyncStorage()
@@ -0,0 +1,218 @@
+"""
+コンテンツインデックスモジュール
+アップロードされたファイルをSHA-256で識別し、同じ内容の再アップロードでは保存済みの原本を共有し、
+抽出結果（テキスト・メタデータ）のキャッシュを再利用する。原本は参照数が0になった時点で削除する
+"""
+import gzip
+import json
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from ..aws_services import aws_services
+from ..config import CONTENT_DEDUP_ENABLED, CONTENT_INDEX_TABLE_NAME, CONTENT_CACHE_PREFIX
+from ..file_extractors import EXTRACTOR_VERSION
+from .async_storage import storage
+
+
+class ContentIndex:
+    """
+    内容のハッシュ → 共有する原本（S3キー）と参照数の対応表（DynamoDB）と、抽出結果キャッシュ（S3）
+
+    参照数の増減はDynamoDBのアトミックなADDで行うため、同じ内容の同時アップロードでも原本は1つになる
+    """
+
+    def __init__(self, enabled: bool = CONTENT_DEDUP_ENABLED, table_name: str = CONTENT_INDEX_TABLE_NAME,
+                 cache_prefix: str = CONTENT_CACHE_PREFIX):
+        self.enabled = enabled
+        self.table = aws_services.dynamodb_client.Table(table_name)
+        self.cache_prefix = cache_prefix
+        self._lock = threading.Lock()
+        self._stats = {
+            "uploads": 0,
+            "duplicate_uploads": 0,
+            "storage_bytes_saved": 0,
+            "extraction_hits": 0,
+            "extraction_misses": 0,
+            "extraction_bytes_saved": 0
+        }
+
+    async def acquire(self, content_hash: str, s3_key: str, content_type: str, file_size: int) -> Optional[str]:
+        """
+        内容の参照を1つ増やし、共有する原本のS3キーを返す
+
+        初めての内容ならs3_key（今回アップロードした原本）が登録されてそのまま返る。
+        既に登録済みなら登録済みのキーが返るので、呼び出し元は今回の原本を破棄する。
+        無効化されている場合やインデックスが使えない場合は登録せずにNoneを返す（重複排除しない）
+
+        Parameters:
+        -----------
+        content_hash : str
+            内容のSHA-256（16進数）
+        s3_key : str
+            今回アップロードした原本のS3キー
+        content_type : str
+            ファイルのMIMEタイプ
+        file_size : int
+            ファイルのバイト数
+        """
+        if not self.enabled:
+            return None
+        try:
+            response = await storage.run(
+                self.table.update_item,
+                Key={"content_hash": content_hash},
+                UpdateExpression=(
+                    "SET s3_key = if_not_exists(s3_key, :s3_key), "
+                    "content_type = if_not_exists(content_type, :content_type), "
+                    "file_size = if_not_exists(file_size, :file_size), "
+                    "created_at = if_not_exists(created_at, :now) "
+                    "ADD ref_count :one"
+                ),
+                ExpressionAttributeValues={
+                    ":s3_key": s3_key,
+                    ":content_type": content_type,
+                    ":file_size": file_size,
+                    ":now": datetime.utcnow().isoformat(),
+                    ":one": 1
+                },
+                ReturnValues="ALL_NEW"
+            )
+        except Exception as e:
+            print(f"コンテンツインデックス登録エラー（重複排除なしで継続）: {e}")
+            return None
+
+        shared_key = response["Attributes"]["s3_key"]
+        with self._lock:
+            self._stats["uploads"] += 1
+            if shared_key != s3_key:
+                self._stats["duplicate_uploads"] += 1
+                self._stats["storage_bytes_saved"] += file_size
+        return shared_key
+
+    async def release(self, content_hash: str, s3_key: str) -> Optional[int]:
+        """
+        内容の参照を1つ減らし、残りの参照数を返す
+
+        s3_keyを原本として登録した内容でなければ（重複排除の導入前に保存したファイルなど）何もせずNoneを返す。
+        参照数が0になった場合は呼び出し元がpurgeで原本とキャッシュを削除する
+        """
+        try:
+            response = await storage.run(
+                self.table.update_item,
+                Key={"content_hash": content_hash},
+                UpdateExpression="ADD ref_count :minus_one",
+                ConditionExpression="s3_key = :s3_key",
+                ExpressionAttributeValues={":minus_one": -1, ":s3_key": s3_key},
+                ReturnValues="UPDATED_NEW"
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return None
+        return int(response["Attributes"]["ref_count"])
+
+    async def release_and_purge(self, content_hash: str, s3_key: str) -> Optional[bool]:
+        """
+        参照を1つ減らし、参照がなくなったら原本・抽出結果キャッシュも削除
+
+        Returns:
+        --------
+        Optional[bool]
+            原本を削除したらTrue、他に参照が残っていればFalse、登録されていない内容ならNone
+        """
+        remaining = await self.release(content_hash, s3_key)
+        if remaining is None:
+            return None
+        if remaining > 0:
+            return False
+        return await self.purge(content_hash, s3_key)
+
+    async def purge(self, content_hash: str, s3_key: str) -> bool:
+        """
+        参照がなくなった内容のインデックス・原本・抽出結果キャッシュを削除
+
+        削除までの間に同じ内容が再アップロードされて参照が増えていた場合は何もしない
+
+        Returns:
+        --------
+        bool
+            削除したかどうか
+        """
+        try:
+            await storage.run(
+                self.table.delete_item,
+                Key={"content_hash": content_hash},
+                ConditionExpression="ref_count <= :zero",
+                ExpressionAttributeValues={":zero": 0}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        await storage.delete_object(s3_key)
+        await storage.run(aws_services.delete_prefix, f"{self.cache_prefix}/{content_hash}/")
+        return True
+
+    async def get_extraction(self, content_hash: str, content_type: str,
+                             file_size: int = 0) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        抽出結果キャッシュを取得（現在の抽出バージョンで抽出した結果がなければNone）
+
+        Returns:
+        --------
+        Optional[Tuple[str, Dict[str, Any]]]
+            (抽出されたテキスト, メタデータ辞書)
+        """
+        if not self.enabled:
+            return None
+        try:
+            cached = await storage.run(self._load_extraction, self._extraction_key(content_hash, content_type))
+        except Exception as e:
+            print(f"抽出結果キャッシュ取得エラー: {e}")
+            cached = None
+        with self._lock:
+            if cached is None:
+                self._stats["extraction_misses"] += 1
+            else:
+                self._stats["extraction_hits"] += 1
+                self._stats["extraction_bytes_saved"] += file_size
+        return cached
+
+    async def put_extraction(self, content_hash: str, content_type: str,
+                             text: str, metadata: Dict[str, Any]) -> None:
+        """抽出結果をキャッシュ（失敗しても処理は継続する）"""
+        if not self.enabled:
+            return
+        try:
+            await storage.run(
+                self._save_extraction, self._extraction_key(content_hash, content_type), text, metadata
+            )
+        except Exception as e:
+            print(f"抽出結果キャッシュ保存エラー: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {"enabled": self.enabled, "extractor_version": EXTRACTOR_VERSION, **self._stats}
+        lookups = stats["extraction_hits"] + stats["extraction_misses"]
+        stats["extraction_hit_rate"] = round(stats["extraction_hits"] / lookups, 4) if lookups else None
+        stats["duplicate_rate"] = (
+            round(stats["duplicate_uploads"] / stats["uploads"], 4) if stats["uploads"] else None
+        )
+        return stats
+
+    def _extraction_key(self, content_hash: str, content_type: str) -> str:
+        # 同じ内容でもMIMEタイプによって抽出方法が変わるためキーに含める
+        return f"{self.cache_prefix}/{content_hash}/v{EXTRACTOR_VERSION}-{quote(content_type, safe='')}.json.gz"
+
+    def _load_extraction(self, s3_key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        body = aws_services.get_object_if_exists(s3_key)
+        if body is None:
+            return None
+        data = json.loads(gzip.decompress(body))
+        return data["text"], data["metadata"]
+
+    def _save_extraction(self, s3_key: str, text: str, metadata: Dict[str, Any]) -> None:
+        body = gzip.compress(json.dumps({"text": text, "metadata": metadata}, ensure_ascii=False).encode("utf-8"))
+        aws_services.upload_file_to_s3(body, s3_key, "application/gzip")
+
+
+# シングルトンインスタンス
+content_index = ContentIndex()
@@ -0,0 +1,347 @@
+"""
+テキスト抽出プロセスプールモジュール
+PDF・Docx・HTMLの解析（CPUバウンド）をイベントループの外の常駐ワーカープロセスで実行し、
+ジョブごとの実行時間・メモリ上限で暴走した解析を打ち切る。待ち行列が上限を超えたら受付を拒否する
+"""
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import (
+    EXTRACTION_POOL_ENABLED,
+    EXTRACTION_POOL_WORKERS,
+    EXTRACTION_TIMEOUT,
+    EXTRACTION_MEMORY_LIMIT_MB,
+    EXTRACTION_MAX_QUEUE,
+    EXTRACTION_MAX_TASKS_PER_WORKER,
+    PDF_MAX_PAGES,
+    PDF_MAX_TEXT_BYTES,
+    PDF_PARALLEL_MIN_PAGES,
+    PDF_PAGES_PER_TASK,
+)
+
+ExtractionResult = Tuple[str, Dict[str, Any]]
+
+
+class ExtractionPoolBusyError(Exception):
+    """抽出待ちのジョブが上限に達しているため受け付けられない"""
+
+
+def _task_function(task: str):
+    """ワーカーで実行できる抽出処理（タスク名 → file_extractorsの関数）"""
+    from .. import file_extractors
+    return {
+        "extract": file_extractors.extract_content_by_type,
+        "extract_file": file_extractors.extract_content_from_file,
+        "pdf_info": file_extractors.pdf_info,
+        "pdf_pages": file_extractors.extract_pdf_pages,
+    }[task]
+
+
+def _apply_memory_limit(memory_limit_mb: int) -> None:
+    """ワーカープロセスのアドレス空間の上限を設定（resourceモジュールがない環境では何もしない）"""
+    if memory_limit_mb <= 0:
+        return
+    try:
+        import resource
+    except ImportError:
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _worker_main(conn, memory_limit_mb: int) -> None:
+    """
+    ワーカープロセスの本体
+
+    起動時にfitz・docx・bs4を読み込んでおき、(タスク名, 引数) を受け取るたびに
+    抽出結果を (テキスト, メタデータ) で返す。Noneを受け取ったら終了する
+    """
+    _task_function("extract")
+
+    _apply_memory_limit(memory_limit_mb)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        except MemoryError:
+            # ファイル自体が上限を超えていて受け取れなかった
+            conn.send(("", {"error": f"テキスト抽出がメモリ上限（{memory_limit_mb}MB）を超えました"}))
+            continue
+        if job is None:
+            return
+        task, args = job
+        try:
+            result = _task_function(task)(*args)
+        except MemoryError:
+            result = ("", {"error": f"テキスト抽出がメモリ上限（{memory_limit_mb}MB）を超えました"})
+        except Exception as e:
+            result = ("", {"error": str(e)})
+        # 解析中のオブジェクトを先に解放してから結果を送る
+        job = args = None
+        conn.send(result)
+
+
+class _Worker:
+    """ワーカープロセスと通信用のパイプ"""
+
+    def __init__(self, context, memory_limit_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit_mb), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self) -> None:
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        except Exception as e:
+            print(f"抽出ワーカー停止エラー: {e}")
+        self.conn.close()
+
+    def close(self, timeout: float = 5.0) -> None:
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=timeout)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class ExtractionPool:
+    """
+    テキスト抽出用の常駐ワーカープロセスプール
+
+    1ワーカーが同時に処理するジョブは1件。実行時間の上限を超えたワーカーや異常終了したワーカーは
+    新しいプロセスに入れ替え、呼び出し元には通常の抽出失敗と同じ ("", {"error": ...}) を返す
+    """
+
+    def __init__(self, enabled: bool = EXTRACTION_POOL_ENABLED, workers: int = EXTRACTION_POOL_WORKERS,
+                 timeout: float = EXTRACTION_TIMEOUT, memory_limit_mb: int = EXTRACTION_MEMORY_LIMIT_MB,
+                 max_queue: int = EXTRACTION_MAX_QUEUE,
+                 max_tasks_per_worker: int = EXTRACTION_MAX_TASKS_PER_WORKER):
+        self.enabled = enabled and workers > 0
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_queue = max_queue
+        self.max_tasks_per_worker = max_tasks_per_worker
+        # 親プロセスのスレッド（イベントループ・boto3）を引き継がないようspawnで起動する
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._all_workers: List[_Worker] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._waiting = 0
+        self._busy = 0
+        self._stats = {
+            "completed": 0, "errors": 0, "timeouts": 0, "crashes": 0, "rejected": 0, "recycled": 0, "pdf_parallel": 0
+        }
+
+    def start(self) -> None:
+        """ワーカープロセスを起動（起動済みなら何もしない）"""
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        if self._idle is not None and self._loop is loop:
+            return
+        if self._idle is not None:
+            # 別のイベントループから使われた場合はキューを作り直す
+            self._close_workers()
+        self._loop = loop
+        self._idle = asyncio.Queue()
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extraction")
+        for _ in range(self.workers):
+            self._idle.put_nowait(self._spawn())
+        print(f"抽出ワーカー起動: {self.workers}プロセス (timeout={self.timeout}s, memory={self.memory_limit_mb}MB)")
+
+    async def extract(self, file_content: bytes, content_type: str) -> ExtractionResult:
+        """
+        ファイルの内容からテキストとメタデータを抽出（戻り値・例外はextract_fileと同じ）
+        """
+        return await self._submit("extract", (file_content, content_type))
+
+    async def extract_file(self, file_path: str, content_type: str) -> ExtractionResult:
+        """
+        ファイルパスからテキストとメタデータを抽出（ワーカーはファイルを直接開き、内容をプロセス間で送らない）
+
+        ページ数の多いPDFはページ範囲に分け、複数のワーカーがそれぞれ文書を開いて並列に抽出する
+
+        Parameters:
+        -----------
+        file_path : str
+            ファイルのパス
+        content_type : str
+            ファイルのMIMEタイプ
+
+        Returns:
+        --------
+        Tuple[str, Dict[str, Any]]
+            (抽出されたテキスト, メタデータ辞書)。失敗時は ("", {"error": ...})
+
+        Raises:
+        -------
+        ExtractionPoolBusyError
+            抽出待ちのジョブが上限に達している場合
+        """
+        if content_type == "application/pdf" and self.enabled and self.workers > 1:
+            return await self._extract_pdf_parallel(file_path)
+        return await self._submit("extract_file", (file_path, content_type))
+
+    async def _extract_pdf_parallel(self, file_path: str) -> ExtractionResult:
+        """PDFのページ範囲を空いているワーカーに割り振って抽出し、ページ順に結合する"""
+        from ..file_extractors import merge_pdf_pages
+
+        _, info = await self._submit("pdf_info", (file_path,))
+        if info.get("error"):
+            return "", info
+        page_count = info["page_count"]
+        stop = min(page_count, PDF_MAX_PAGES) if PDF_MAX_PAGES > 0 else page_count
+        if stop < PDF_PARALLEL_MIN_PAGES:
+            return await self._submit("extract_file", (file_path, "application/pdf"))
+
+        # 受付の判定は文書単位（pdf_info）で済ませ、ページ範囲のタスクは待ち行列の上限で拒否しない
+        parts = await asyncio.gather(*(
+            self._submit("pdf_pages", (file_path, start, min(start + PDF_PAGES_PER_TASK, stop), PDF_MAX_TEXT_BYTES),
+                         admit=False)
+            for start in range(0, stop, PDF_PAGES_PER_TASK)
+        ))
+        for _, part in parts:
+            if part.get("error"):
+                return "", part
+        self._stats["pdf_parallel"] += 1
+        return merge_pdf_pages(list(parts), info, PDF_MAX_TEXT_BYTES)
+
+    async def _submit(self, task: str, args: Tuple[Any, ...], admit: bool = True) -> ExtractionResult:
+        if not self.enabled:
+            return await asyncio.get_running_loop().run_in_executor(None, _task_function(task), *args)
+
+        self.start()
+        if admit and self._idle.empty() and self._waiting >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise ExtractionPoolBusyError(
+                f"テキスト抽出の待ちが上限（{self.max_queue}件）に達しています"
+            )
+
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        self._busy += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            self._threads, self._run_job, worker, task, args
+        )
+        # 呼び出し元がキャンセルされてもジョブの完了まではワーカーを空きに戻さない
+        future.add_done_callback(functools.partial(self._release, worker=worker))
+        result, _ = await asyncio.shield(future)
+
+        if result[1].get("error"):
+            self._stats["errors"] += 1
+        else:
+            self._stats["completed"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers if self._idle is not None else 0,
+            "busy": self._busy,
+            "queued": self._waiting,
+            "max_queue": self.max_queue,
+            "timeout_seconds": self.timeout,
+            "memory_limit_mb": self.memory_limit_mb,
+            **self._stats
+        }
+
+    async def shutdown(self) -> None:
+        """ワーカープロセスを終了"""
+        if self._idle is None:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self._close_workers)
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+            self._threads = None
+
+    def _release(self, future: asyncio.Future, worker: _Worker) -> None:
+        """ジョブが終わったワーカー（入れ替えた場合は新しいワーカー）を空きに戻す"""
+        self._busy -= 1
+        if future.cancelled() or future.exception() is not None:
+            worker = self._replace(worker)
+        else:
+            worker = future.result()[1]
+        if self._idle is not None:
+            self._idle.put_nowait(worker)
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.memory_limit_mb)
+        with self._lock:
+            self._all_workers.append(worker)
+        return worker
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        with self._lock:
+            if worker in self._all_workers:
+                self._all_workers.remove(worker)
+        return self._spawn()
+
+    def _close_workers(self) -> None:
+        with self._lock:
+            workers, self._all_workers = self._all_workers, []
+        for worker in workers:
+            worker.close()
+        self._idle = None
+        self._loop = None
+
+    def _run_job(self, worker: _Worker, task: str, args: Tuple[Any, ...]) -> Tuple[ExtractionResult, _Worker]:
+        """ワーカースレッドで1件の抽出を実行し、(結果, 次に使うワーカー) を返す"""
+        if not worker.process.is_alive():
+            worker = self._replace(worker)
+        try:
+            worker.conn.send((task, args))
+            if not worker.conn.poll(self.timeout):
+                print(f"テキスト抽出がタイムアウトしました（{self.timeout}秒）: {task}")
+                self._stats["timeouts"] += 1
+                return (
+                    ("", {"error": f"テキスト抽出がタイムアウトしました（{self.timeout}秒）"}),
+                    self._replace(worker)
+                )
+            result = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            # メモリ上限などでワーカーが異常終了した
+            exitcode = worker.process.exitcode
+            print(f"抽出ワーカーが異常終了しました (exitcode={exitcode}): {e}")
+            self._stats["crashes"] += 1
+            return (
+                ("", {"error": f"テキスト抽出中にワーカーが異常終了しました (exitcode={exitcode})"}),
+                self._replace(worker)
+            )
+
+        worker.tasks += 1
+        if self.max_tasks_per_worker > 0 and worker.tasks >= self.max_tasks_per_worker:
+            # 解析ライブラリのメモリ断片化が積み上がらないよう定期的に入れ替える
+            self._stats["recycled"] += 1
+            worker.close()
+            with self._lock:
+                if worker in self._all_workers:
+                    self._all_workers.remove(worker)
+            worker = self._spawn()
+        return result, worker
+
+
+# シングルトンインスタンス
+extraction_pool = ExtractionPool()
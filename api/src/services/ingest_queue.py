@@ -0,0 +1,283 @@
+"""
+取り込みキューモジュール
+アップロードされたファイルのテキスト抽出・整形・インデックス登録をリクエストの外で行うための
+永続キュー（本番はSQS、ローカルではファイルスプール）と、同時実行数を制限したワーカーを提供する
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import boto3
+
+from ..config import (
+    REGION_NAME,
+    INGEST_QUEUE_BACKEND,
+    INGEST_SQS_QUEUE_URL,
+    INGEST_LOCAL_QUEUE_DIR,
+    INGEST_WORKER_CONCURRENCY,
+    INGEST_MAX_ATTEMPTS,
+    INGEST_RETRY_BACKOFF,
+    INGEST_VISIBILITY_TIMEOUT,
+)
+from .metrics import metrics
+
+
+class IngestMessage:
+    """受信したメッセージ（本文・何回目の受信か・確認応答用のハンドル）"""
+
+    def __init__(self, body: Dict[str, Any], attempt: int, handle: Any):
+        self.body = body
+        self.attempt = attempt
+        self.handle = handle
+
+
+class LocalIngestQueue:
+    """
+    ファイルスプールによるローカルキュー（SQSの代替）
+
+    メッセージは1件1ファイルでpending/に置き、受信時にinflight/へ移す。
+    プロセスが処理中に停止しても、次の起動時にinflight/の分をpending/へ戻して再処理する
+    """
+
+    def __init__(self, directory: str = INGEST_LOCAL_QUEUE_DIR):
+        self.pending_dir = os.path.join(directory, "pending")
+        self.inflight_dir = os.path.join(directory, "inflight")
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.inflight_dir, exist_ok=True)
+        self._wakeup: Optional[asyncio.Event] = None
+        self.recover()
+
+    def recover(self) -> int:
+        """前回の実行で処理中のまま残ったメッセージを再処理対象に戻す"""
+        recovered = 0
+        for name in os.listdir(self.inflight_dir):
+            os.replace(os.path.join(self.inflight_dir, name), os.path.join(self.pending_dir, name))
+            recovered += 1
+        if recovered:
+            print(f"取り込みキュー: 処理中だった{recovered}件を再処理します")
+        return recovered
+
+    async def send(self, body: Dict[str, Any]) -> None:
+        self._write(body, attempt=0, not_before=0.0)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def receive(self, wait_seconds: float) -> List[IngestMessage]:
+        """受信可能なメッセージを1件受け取る（なければwait_secondsまで待つ）"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        message = self._claim_next()
+        if message is None:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait_seconds)
+            except asyncio.TimeoutError:
+                pass
+            message = self._claim_next()
+        return [message] if message else []
+
+    async def ack(self, message: IngestMessage) -> None:
+        try:
+            os.remove(message.handle)
+        except FileNotFoundError:
+            pass
+
+    async def retry_later(self, message: IngestMessage, delay: float) -> None:
+        """delay秒後に再受信できるように戻す"""
+        await self.ack(message)
+        self._write(message.body, attempt=message.attempt, not_before=time.time() + delay)
+
+    def depth(self) -> Dict[str, int]:
+        return {"pending": len(os.listdir(self.pending_dir)), "inflight": len(os.listdir(self.inflight_dir))}
+
+    def _write(self, body: Dict[str, Any], attempt: int, not_before: float) -> None:
+        # ファイル名の先頭を受信可能時刻にして、名前順に並べれば受信順になるようにする
+        name = f"{not_before:017.6f}-{uuid.uuid4().hex}.json"
+        tmp_path = os.path.join(self.pending_dir, f".{name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"body": body, "attempt": attempt}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.pending_dir, name))
+
+    def _claim_next(self) -> Optional[IngestMessage]:
+        now = time.time()
+        for name in sorted(os.listdir(self.pending_dir)):
+            if name.startswith("."):
+                continue
+            if float(name.split("-", 1)[0]) > now:
+                break
+            inflight_path = os.path.join(self.inflight_dir, name)
+            try:
+                # renameで取得したワーカーだけが処理する（他のワーカーとの取り合いを防ぐ）
+                os.replace(os.path.join(self.pending_dir, name), inflight_path)
+            except FileNotFoundError:
+                continue
+            with open(inflight_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return IngestMessage(data["body"], data["attempt"] + 1, inflight_path)
+        return None
+
+
+class SQSIngestQueue:
+    """Amazon SQSのキュー（受信回数はApproximateReceiveCountで数える）"""
+
+    def __init__(self, queue_url: str = INGEST_SQS_QUEUE_URL,
+                 visibility_timeout: int = INGEST_VISIBILITY_TIMEOUT):
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.client = boto3.client("sqs", region_name=REGION_NAME)
+
+    async def send(self, body: Dict[str, Any]) -> None:
+        await self._call(self.client.send_message, QueueUrl=self.queue_url,
+                         MessageBody=json.dumps(body, ensure_ascii=False))
+
+    async def receive(self, wait_seconds: float) -> List[IngestMessage]:
+        response = await self._call(
+            self.client.receive_message,
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=1,
+            WaitTimeSeconds=int(min(wait_seconds, 20)),
+            VisibilityTimeout=self.visibility_timeout,
+            AttributeNames=["ApproximateReceiveCount"]
+        )
+        return [
+            IngestMessage(
+                json.loads(message["Body"]),
+                int(message.get("Attributes", {}).get("ApproximateReceiveCount", 1)),
+                message["ReceiptHandle"]
+            )
+            for message in response.get("Messages", [])
+        ]
+
+    async def ack(self, message: IngestMessage) -> None:
+        await self._call(self.client.delete_message, QueueUrl=self.queue_url, ReceiptHandle=message.handle)
+
+    async def retry_later(self, message: IngestMessage, delay: float) -> None:
+        """可視性タイムアウトを短くして、delay秒後に再受信されるようにする"""
+        await self._call(self.client.change_message_visibility, QueueUrl=self.queue_url,
+                         ReceiptHandle=message.handle, VisibilityTimeout=int(delay))
+
+    def depth(self) -> Dict[str, int]:
+        attributes = self.client.get_queue_attributes(
+            QueueUrl=self.queue_url,
+            AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"]
+        )["Attributes"]
+        return {
+            "pending": int(attributes.get("ApproximateNumberOfMessages", 0)),
+            "inflight": int(attributes.get("ApproximateNumberOfMessagesNotVisible", 0))
+        }
+
+    async def _call(self, func: Callable, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: func(**kwargs))
+
+
+IngestHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+FailureHandler = Callable[[Dict[str, Any], str], Awaitable[None]]
+
+
+class IngestWorkerPool:
+    """キューからメッセージを受け取り、同時実行数を制限して処理するワーカー（失敗時は指数バックオフで再試行）"""
+
+    def __init__(self, queue, concurrency: int = INGEST_WORKER_CONCURRENCY,
+                 max_attempts: int = INGEST_MAX_ATTEMPTS, retry_backoff: float = INGEST_RETRY_BACKOFF,
+                 poll_wait: float = 10.0):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.poll_wait = poll_wait
+        self._handler: Optional[IngestHandler] = None
+        self._on_failure: Optional[FailureHandler] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stats = {"processed": 0, "retried": 0, "failed": 0}
+
+    def start(self, handler: IngestHandler, on_failure: Optional[FailureHandler] = None) -> None:
+        """
+        ワーカーを起動
+
+        Parameters:
+        -----------
+        handler : IngestHandler
+            メッセージ本文を処理するコルーチン関数（例外を送出すると再試行）
+        on_failure : Optional[FailureHandler]
+            最大試行回数を超えたときに (本文, エラー内容) で呼ばれるコルーチン関数
+        """
+        self._handler = handler
+        self._on_failure = on_failure
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker_loop(i)) for i in range(self.concurrency)]
+        print(f"取り込みワーカー起動: {self.concurrency}並列 ({type(self.queue).__name__})")
+
+    async def stop(self) -> None:
+        """ワーカーを停止（処理中のメッセージはキューに残り、再起動後に再処理される）"""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "backend": type(self.queue).__name__,
+            "workers": len(self._tasks),
+            **self._stats
+        }
+        try:
+            stats["queue"] = self.queue.depth()
+        except Exception as e:
+            stats["queue"] = None
+            print(f"取り込みキュー件数取得エラー: {e}")
+        return stats
+
+    async def _worker_loop(self, worker_id: int) -> None:
+        while True:
+            try:
+                messages = await self.queue.receive(self.poll_wait)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"取り込みキュー受信エラー (worker {worker_id}): {e}")
+                await asyncio.sleep(self.poll_wait)
+                continue
+            for message in messages:
+                await self._process(message)
+
+    async def _process(self, message: IngestMessage) -> None:
+        try:
+            with metrics.span("ingest.process"):
+                await self._handler(message.body)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if message.attempt < self.max_attempts:
+                delay = self.retry_backoff * (2 ** (message.attempt - 1))
+                print(f"取り込み失敗（{delay:.1f}秒後に再試行 {message.attempt}/{self.max_attempts}）: {e}")
+                self._stats["retried"] += 1
+                await self.queue.retry_later(message, delay)
+                return
+            print(f"取り込み失敗（再試行上限）: {e}")
+            self._stats["failed"] += 1
+            if self._on_failure is not None:
+                try:
+                    await self._on_failure(message.body, str(e))
+                except Exception as failure_error:
+                    print(f"取り込み失敗の記録エラー: {failure_error}")
+            await self.queue.ack(message)
+            return
+        self._stats["processed"] += 1
+        await self.queue.ack(message)
+
+
+def _create_queue():
+    """設定に応じて取り込みキューを作成"""
+    if INGEST_QUEUE_BACKEND == "sqs":
+        return SQSIngestQueue()
+    return LocalIngestQueue()
+
+
+# シングルトンインスタンス
+ingest_queue = _create_queue()
+ingest_workers = IngestWorkerPool(ingest_queue)
@@ -0,0 +1,432 @@
+"""
+バックグラウンドジョブモジュール
+データ移行やインセンティブ一括計算など時間のかかる管理処理をHTTPリクエストの外で実行する。
+ジョブの状態（進捗・再開用の状態）はDynamoDBに保存し、別のタスクからの参照や再起動後の再開に使う
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+from ..aws_services import BOTO_CONFIG
+from ..config import (
+    REGION_NAME,
+    JOBS_TABLE_NAME,
+    JOBS_MAX_CONCURRENT,
+    JOBS_MAX_WORKERS,
+    JOBS_HEARTBEAT_INTERVAL,
+    JOBS_HEARTBEAT_TIMEOUT,
+    JOBS_RETENTION_DAYS,
+)
+from .json_utils import json_default
+
+# ジョブの状態
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+# 実行していたタスクが停止した（ハートビートが途絶えた、またはシャットダウンで中断した）
+STATUS_INTERRUPTED = "interrupted"
+
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+# TTLで削除するまでの期限（エポック秒）を保存する属性
+TTL_ATTRIBUTE = "expires_at"
+RESUMABLE_STATUSES = (STATUS_FAILED, STATUS_CANCELLED, STATUS_INTERRUPTED)
+
+
+class JobNotFoundError(Exception):
+    """指定されたジョブが存在しない"""
+
+
+class JobConflictError(Exception):
+    """同じ種類のジョブが実行中、または再開できない状態"""
+
+
+class JobCancelledError(Exception):
+    """ジョブのキャンセルが要求された"""
+
+
+class JobContext:
+    """実行中のジョブに渡すコンテキスト（進捗の報告・再開用の状態の保存・キャンセル確認）"""
+
+    def __init__(self, runner: "JobRunner", job: Dict[str, Any]):
+        self._runner = runner
+        self._job = job
+
+    @property
+    def job_id(self) -> str:
+        return self._job["job_id"]
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return self._job["params"]
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        """再開用の状態（前回の実行で保存したもの。初回は空）"""
+        return self._job["state"]
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """再開用の状態を更新（次のハートビートでDynamoDBに保存される）"""
+        self._job["state"] = state
+
+    def set_total(self, total: Optional[int]) -> None:
+        """処理対象の総数を設定（不明ならNone）"""
+        self._job["progress"]["total"] = total
+
+    def update(self, processed: Optional[int] = None, failed: Optional[int] = None,
+               bytes_processed: Optional[int] = None) -> None:
+        """進捗を累計値で更新"""
+        progress = self._job["progress"]
+        if processed is not None:
+            progress["processed"] = processed
+        if failed is not None:
+            progress["failed"] = failed
+        if bytes_processed is not None:
+            progress["bytes"] = bytes_processed
+
+    def advance(self, processed: int = 0, failed: int = 0, bytes_processed: int = 0) -> None:
+        """進捗を増分で更新"""
+        progress = self._job["progress"]
+        progress["processed"] += processed
+        progress["failed"] += failed
+        progress["bytes"] += bytes_processed
+
+    def check_cancelled(self) -> None:
+        """キャンセルが要求されていればJobCancelledErrorを送出"""
+        if self._job["cancel_requested"]:
+            raise JobCancelledError(f"ジョブ {self.job_id} はキャンセルされました")
+
+    async def run_sync(self, func: Callable, *args: Any) -> Any:
+        """同期処理をジョブ用のスレッドプールで実行"""
+        return await asyncio.get_running_loop().run_in_executor(self._runner.executor, func, *args)
+
+
+JobFunction = Callable[[JobContext], Awaitable[Any]]
+
+
+class JobRunner:
+    """プロセス内のジョブ実行（同時実行数の上限・キャンセル・DynamoDBへの状態保存）"""
+
+    def __init__(self, table_name: str = JOBS_TABLE_NAME, max_concurrent: int = JOBS_MAX_CONCURRENT,
+                 max_workers: int = JOBS_MAX_WORKERS, heartbeat_interval: float = JOBS_HEARTBEAT_INTERVAL,
+                 heartbeat_timeout: float = JOBS_HEARTBEAT_TIMEOUT, retention_days: int = JOBS_RETENTION_DAYS):
+        self.table = boto3.resource('dynamodb', region_name=REGION_NAME, config=BOTO_CONFIG).Table(table_name)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self.max_concurrent = max_concurrent
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.retention_seconds = retention_days * 24 * 60 * 60
+        # このタスク（プロセス）の識別子。ハートビートとともに保存し、実行中のタスクを判別する
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._job_types: Dict[str, JobFunction] = {}
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._shutting_down = False
+
+    def register(self, job_type: str, func: JobFunction) -> None:
+        """ジョブの種類と実行関数を登録（再起動後の再開にも使う）"""
+        self._job_types[job_type] = func
+
+    async def submit(self, job_type: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        ジョブを登録して実行を開始し、すぐに返す
+
+        Parameters:
+        -----------
+        job_type : str
+            registerで登録したジョブの種類
+        params : Optional[Dict[str, Any]]
+            ジョブのパラメーター（JSONに変換できる値）
+
+        Returns:
+        --------
+        Dict[str, Any]
+            ジョブの状態（get_jobと同じ形式）
+
+        Raises:
+        -------
+        JobConflictError
+            同じ種類のジョブがこのタスクで実行中の場合
+        """
+        if job_type not in self._job_types:
+            raise ValueError(f"未登録のジョブです: {job_type}")
+        if any(job["job_type"] == job_type and job["status"] in ACTIVE_STATUSES for job in self._jobs.values()):
+            raise JobConflictError(f"{job_type} ジョブはすでに実行中です")
+
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "job_type": job_type,
+            "status": STATUS_QUEUED,
+            "params": params or {},
+            "state": {},
+            "progress": {"total": None, "processed": 0, "failed": 0, "bytes": 0},
+            "result": None,
+            "error": None,
+            "created_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "cancel_requested": False
+        }
+        await self._start(job)
+        return self.describe(job)
+
+    async def get_job(self, job_id: str) -> Dict[str, Any]:
+        """
+        ジョブの状態を取得（このタスクで実行していないジョブはDynamoDBから読む）
+
+        Raises:
+        -------
+        JobNotFoundError
+            ジョブが存在しない場合
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await self._load(job_id)
+        return self.describe(job)
+
+    async def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """ジョブの一覧を新しい順に取得"""
+        jobs: Dict[str, Dict[str, Any]] = {}
+        try:
+            for item in await self._in_executor(self._scan_jobs):
+                jobs[item["job_id"]] = item
+        except Exception as e:
+            print(f"ジョブ一覧取得エラー（このタスクのジョブのみ返します）: {e}")
+        jobs.update(self._jobs)
+        ordered = sorted(jobs.values(), key=lambda job: job["created_at"], reverse=True)
+        return [self.describe(job) for job in ordered[:limit]]
+
+    async def cancel(self, job_id: str) -> Dict[str, Any]:
+        """
+        ジョブのキャンセルを要求
+
+        待機中のジョブは即座に、実行中のジョブは次のキャンセル確認または待機箇所で停止する
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await self._load(job_id)
+            raise JobConflictError(f"ジョブ {job_id} はこのタスクで実行されていません（状態: {self.describe(job)['status']}）")
+        if job["status"] not in ACTIVE_STATUSES:
+            raise JobConflictError(f"ジョブ {job_id} は実行中ではありません（状態: {job['status']}）")
+        job["cancel_requested"] = True
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        return self.describe(job)
+
+    async def resume(self, job_id: str) -> Dict[str, Any]:
+        """
+        失敗・キャンセル・中断したジョブを保存済みの状態から再開
+
+        別のタスクで中断したジョブも、DynamoDB上で実行権を取得してこのタスクで再開する
+
+        Raises:
+        -------
+        JobConflictError
+            実行中のジョブ、完了済みのジョブ、または他のタスクが先に再開した場合
+        """
+        job = self._jobs.get(job_id) or await self._load(job_id)
+        status = self.describe(job)["status"]
+        if status not in RESUMABLE_STATUSES:
+            raise JobConflictError(f"ジョブ {job_id} は再開できません（状態: {status}）")
+        if job["job_type"] not in self._job_types:
+            raise JobConflictError(f"未登録のジョブです: {job['job_type']}")
+        if any(other["job_type"] == job["job_type"] and other["status"] in ACTIVE_STATUSES
+               for other in self._jobs.values()):
+            raise JobConflictError(f"{job['job_type']} ジョブはすでに実行中です")
+
+        if job_id not in self._jobs:
+            await self._claim(job)
+        job.update(status=STATUS_QUEUED, error=None, result=None, finished_at=None, cancel_requested=False)
+        await self._start(job)
+        return self.describe(job)
+
+    async def shutdown(self) -> None:
+        """実行中のジョブを中断として記録して停止（アプリケーション終了時）"""
+        self._shutting_down = True
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    def describe(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """ジョブの状態をレスポンス用に整形（スループットと残り時間の見積もりを含む）"""
+        status = job["status"]
+        heartbeat_at = job.get("heartbeat_at")
+        if (status in ACTIVE_STATUSES and job["job_id"] not in self._jobs
+                and (heartbeat_at is None or time.time() - heartbeat_at > self.heartbeat_timeout)):
+            # 実行していたタスクのハートビートが途絶えている
+            status = STATUS_INTERRUPTED
+
+        progress = dict(job["progress"])
+        throughput = None
+        eta_seconds = None
+        run_started_ts = job.get("run_started_ts")
+        if run_started_ts and status == STATUS_RUNNING:
+            elapsed = max(time.time() - run_started_ts, 1e-6)
+            done = progress["processed"] + progress["failed"]
+            throughput = round((done - job.get("run_start_done", 0)) / elapsed, 2)
+            if progress["total"] and throughput > 0:
+                eta_seconds = round(max(progress["total"] - done, 0) / throughput, 1)
+
+        return {
+            "job_id": job["job_id"],
+            "job_type": job["job_type"],
+            "status": status,
+            "params": job["params"],
+            "progress": progress,
+            "percent": round(100 * (progress["processed"] + progress["failed"]) / progress["total"], 1)
+            if progress["total"] else None,
+            "throughput_per_second": throughput,
+            "eta_seconds": eta_seconds,
+            "result": job["result"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "owner": job.get("owner"),
+            "cancel_requested": job["cancel_requested"]
+        }
+
+    # ==================== 実行 ====================
+
+    async def _start(self, job: Dict[str, Any]) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        job["owner"] = self.owner
+        self._jobs[job["job_id"]] = job
+        await self._persist(job)
+        self._tasks[job["job_id"]] = asyncio.create_task(self._run(job, self._job_types[job["job_type"]]))
+
+    async def _run(self, job: Dict[str, Any], func: JobFunction) -> None:
+        """同時実行数の枠を待ってからジョブを実行し、終了状態を保存"""
+        # 枠を待っている間もハートビートを送り、他のタスクから中断と判定されないようにする
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            async with self._slots:
+                job["status"] = STATUS_RUNNING
+                job["started_at"] = datetime.utcnow().isoformat()
+                job["run_started_ts"] = time.time()
+                job["run_start_done"] = job["progress"]["processed"] + job["progress"]["failed"]
+                await self._persist(job)
+                print(f"ジョブ開始: {job['job_type']} ({job['job_id']})")
+                job["result"] = await func(JobContext(self, job))
+            job["status"] = STATUS_SUCCEEDED
+        except (asyncio.CancelledError, JobCancelledError):
+            job["status"] = STATUS_INTERRUPTED if self._shutting_down and not job["cancel_requested"] \
+                else STATUS_CANCELLED
+        except Exception as e:
+            print(f"ジョブエラー: {job['job_type']} ({job['job_id']}) - {e}")
+            job["status"] = STATUS_FAILED
+            job["error"] = str(e)
+        finally:
+            heartbeat.cancel()
+            job["finished_at"] = datetime.utcnow().isoformat()
+            self._tasks.pop(job["job_id"], None)
+            await self._persist(job)
+            print(f"ジョブ終了: {job['job_type']} ({job['job_id']}) -> {job['status']}")
+
+    async def _heartbeat(self, job: Dict[str, Any]) -> None:
+        """実行中のジョブの進捗と再開用の状態を定期的に保存"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await self._persist(job)
+
+    # ==================== DynamoDBへの保存 ====================
+
+    async def _persist(self, job: Dict[str, Any]) -> None:
+        """ジョブの状態を保存（失敗してもジョブは継続し、このタスク内の状態で参照できる）"""
+        job["heartbeat_at"] = time.time()
+        item = _to_dynamodb(job)
+        # 実行中のジョブはハートビートごとに期限が延びるため、TTLで削除されるのは終了後だけ
+        item[TTL_ATTRIBUTE] = int(job["heartbeat_at"] + self.retention_seconds)
+        try:
+            await self._in_executor(self.table.put_item, Item=item)
+        except Exception as e:
+            print(f"ジョブ状態保存エラー（無視して処理継続）: {job['job_id']} - {e}")
+
+    async def _load(self, job_id: str) -> Dict[str, Any]:
+        try:
+            response = await self._in_executor(self.table.get_item, Key={"job_id": job_id})
+        except Exception as e:
+            print(f"ジョブ状態取得エラー: {job_id} - {e}")
+            raise JobNotFoundError(f"ジョブが見つかりません: {job_id}")
+        item = response.get("Item")
+        if item is None:
+            raise JobNotFoundError(f"ジョブが見つかりません: {job_id}")
+        return _from_dynamodb(item)
+
+    async def _claim(self, job: Dict[str, Any]) -> None:
+        """他のタスクのジョブの実行権を取得（同じジョブを複数のタスクが同時に再開しないように条件付きで更新）"""
+        stale_before = Decimal(str(time.time() - self.heartbeat_timeout))
+        condition = (
+            Attr("status").is_in(list(RESUMABLE_STATUSES))
+            | (Attr("status").is_in(list(ACTIVE_STATUSES)) & Attr("heartbeat_at").lt(stale_before))
+        ) & Attr("owner").eq(job.get("owner"))
+        try:
+            await self._in_executor(
+                self.table.update_item,
+                Key={"job_id": job["job_id"]},
+                UpdateExpression="SET #owner = :owner, #status = :status, heartbeat_at = :now",
+                ConditionExpression=condition,
+                ExpressionAttributeNames={"#owner": "owner", "#status": "status"},
+                ExpressionAttributeValues={
+                    ":owner": self.owner,
+                    ":status": STATUS_QUEUED,
+                    ":now": Decimal(str(time.time()))
+                }
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            raise JobConflictError(f"ジョブ {job['job_id']} は他のタスクが再開しました")
+
+    def _scan_jobs(self) -> List[Dict[str, Any]]:
+        items = []
+        scan_kwargs: Dict[str, Any] = {}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            items.extend(_from_dynamodb(item) for item in response.get("Items", []))
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                return items
+            scan_kwargs["ExclusiveStartKey"] = last_key
+
+    async def _in_executor(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: func(*args, **kwargs)
+        )
+
+
+def _to_dynamodb(job: Dict[str, Any]) -> Dict[str, Any]:
+    """ジョブをDynamoDBに保存できる形式に変換（floatはDecimalに、値のないNoneは除く）"""
+    item = json.loads(json.dumps(job, default=json_default), parse_float=Decimal)
+    return {key: value for key, value in item.items() if value is not None}
+
+
+def _from_dynamodb(item: Dict[str, Any]) -> Dict[str, Any]:
+    """DynamoDBのアイテムをジョブに変換（Decimalを数値に戻し、欠けている項目を補う）"""
+    job = json.loads(json.dumps(item, default=json_default))
+    for key in ("result", "error", "started_at", "finished_at", "owner", "heartbeat_at"):
+        job.setdefault(key, None)
+    job.setdefault("params", {})
+    job.setdefault("state", {})
+    job.setdefault("cancel_requested", False)
+    job["progress"].setdefault("total", None)
+    return job
+
+
+# シングルトンインスタンス
+job_runner = JobRunner()
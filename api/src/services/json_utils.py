@@ -0,0 +1,29 @@
+"""
+JSON変換の共通処理
+DynamoDBから取得した値（Decimal・セット）をjson.dumpsで扱えるようにする
+"""
+from decimal import Decimal
+from typing import Any
+
+
+def json_default(value: Any) -> Any:
+    """
+    json.dumpsのdefaultに渡す変換関数
+
+    DynamoDBのDecimalは整数値ならint、それ以外はfloatに、セットはリストに変換する
+
+    Parameters:
+    -----------
+    value : Any
+        JSONに変換できなかった値
+
+    Returns:
+    --------
+    Any
+        JSONに変換できる値
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,739 @@
+"""
+ローカル全文検索インデックスモジュール
+OpenSearch障害時の検索バックエンドとして、APIプロセス内に転置インデックスを保持する
+
+- トークナイズはOpenSearchのcjkアナライザーに合わせる（NFKC正規化・小文字化・CJK文字のbigram・英語ストップワード除去）
+- スコアはtitle/contentのフィールド別BM25を重み付きで合算
+- インデックス本体はディスク上の不変セグメント（mmapで読み込み）で、以降の登録・削除は
+  メモリ上の差分とジャーナルに記録し、一定件数ごとにセグメントへマージする
+"""
+import json
+import mmap
+import math
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..config import (
+    LOCAL_INDEX_ENABLED,
+    LOCAL_INDEX_DIR,
+    LOCAL_INDEX_FLUSH_THRESHOLD,
+)
+from .metrics import metrics
+from .json_utils import json_default
+
+# セグメントファイル形式（リトルエンディアン）
+# 文書キーは doc_id, 所有者, 言語 を区切り文字で連結したもの
+# ヘッダー | 文書表 | 語彙表（語彙順） | 語彙文字列 | ポスティング | 文書キー | 保存フィールド(JSON)
+SEGMENT_MAGIC = b"FXLI"
+SEGMENT_VERSION = 2
+_HEADER = struct.Struct("<4sIIIQQQQQQQQ")
+# title長, content長, 保存フィールド位置, 保存フィールド長, 文書キー位置, 文書キー長
+_DOC_ENTRY = struct.Struct("<IIQIQI")
+# 語彙文字列位置, 語彙文字列長, ポスティング位置, 文書頻度
+_TERM_ENTRY = struct.Struct("<QIQI")
+# 文書番号, titleでの出現数, contentでの出現数
+_POSTING = struct.Struct("<III")
+_KEY_SEPARATOR = "\x1f"
+
+# BM25パラメータとフィールド重み（OpenSearchの検索クエリと同じくtitleを優先）
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"title": 3.0, "content": 1.0}
+# クエリ語のうち一致が必要な割合（OpenSearchのminimum_should_match: 50%に合わせる）
+MINIMUM_SHOULD_MATCH = 0.5
+
+# cjkアナライザーの既定ストップワード（英語）
+_STOP_WORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it",
+    "no", "not", "of", "on", "or", "s", "such", "t", "that", "the", "their", "then", "there",
+    "these", "they", "this", "to", "was", "will", "with", "www"
+))
+_WORD_RE = re.compile(r"[^\W_]+")
+_CJK_RE = re.compile("([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)")
+# 保存フィールド（OpenSearchに登録するドキュメントと同じ項目）
+STORED_FIELDS = (
+    "title", "content", "user_id", "language", "file_type", "uploaded_at",
+    "s3_key", "file_name", "description", "extracted_metadata"
+)
+SNIPPET_LENGTH = 150
+
+
+def tokenize(text: str) -> List[str]:
+    """cjkアナライザー相当のトークン列を返す"""
+    if not text:
+        return []
+    normalized = unicodedata.normalize("NFKC", text).lower()
+    tokens: List[str] = []
+    for word in _WORD_RE.findall(normalized):
+        for i, run in enumerate(_CJK_RE.split(word)):
+            if not run:
+                continue
+            if i % 2 == 1:
+                # CJK文字列は隣接2文字ずつ（1文字のみの場合はそのまま）
+                if len(run) == 1:
+                    tokens.append(run)
+                else:
+                    tokens.extend(run[j:j + 2] for j in range(len(run) - 1))
+            elif run not in _STOP_WORDS:
+                tokens.append(run)
+    return tokens
+
+
+class _Segment:
+    """mmapで読み込んだ不変セグメント"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.doc_count, self.term_count, self.total_title_len, self.total_content_len,
+         self._docs_off, self._terms_off, self._term_blob_off, self._postings_off,
+         self._keys_off, self._stored_off) = _HEADER.unpack_from(self._mm, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            self.close()
+            raise ValueError(f"ローカルインデックスのセグメント形式が不正です: {path}")
+
+        # 文書キー（doc_id・所有者・言語）のみ起動時に展開し、本文などは検索結果の生成時に読む
+        self.doc_ids: List[str] = []
+        self.user_ids: List[str] = []
+        self.languages: List[str] = []
+        for ordinal in range(self.doc_count):
+            _, _, _, _, key_off, key_len = self._doc_entry(ordinal)
+            start = self._keys_off + key_off
+            doc_id, user_id, language = self._mm[start:start + key_len].decode("utf-8").split(_KEY_SEPARATOR, 2)
+            self.doc_ids.append(doc_id)
+            self.user_ids.append(user_id)
+            self.languages.append(language)
+        self.ordinals = {doc_id: ordinal for ordinal, doc_id in enumerate(self.doc_ids)}
+
+    def _doc_entry(self, ordinal: int) -> Tuple[int, int, int, int, int, int]:
+        return _DOC_ENTRY.unpack_from(self._mm, self._docs_off + ordinal * _DOC_ENTRY.size)
+
+    def _term_entry(self, index: int) -> Tuple[int, int, int, int]:
+        return _TERM_ENTRY.unpack_from(self._mm, self._terms_off + index * _TERM_ENTRY.size)
+
+    def _term_at(self, index: int) -> bytes:
+        term_off, term_len, _, _ = self._term_entry(index)
+        start = self._term_blob_off + term_off
+        return self._mm[start:start + term_len]
+
+    def field_lengths(self, ordinal: int) -> Tuple[int, int]:
+        title_len, content_len, _, _, _, _ = self._doc_entry(ordinal)
+        return title_len, content_len
+
+    def stored(self, ordinal: int) -> Dict[str, Any]:
+        _, _, stored_off, stored_len, _, _ = self._doc_entry(ordinal)
+        start = self._stored_off + stored_off
+        return json.loads(self._mm[start:start + stored_len])
+
+    def postings(self, term: str) -> List[Tuple[int, int, int]]:
+        """語彙表を二分探索してポスティングを返す"""
+        target = term.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            mid = (low + high) // 2
+            if self._term_at(mid) < target:
+                low = mid + 1
+            else:
+                high = mid
+        if low >= self.term_count or self._term_at(low) != target:
+            return []
+        _, _, postings_off, df = self._term_entry(low)
+        start = self._postings_off + postings_off
+        return [_POSTING.unpack_from(self._mm, start + i * _POSTING.size) for i in range(df)]
+
+    def iter_terms(self) -> Iterable[Tuple[str, List[Tuple[int, int, int]]]]:
+        """全語彙とポスティングを語彙順に返す（マージ用）"""
+        for index in range(self.term_count):
+            term = self._term_at(index).decode("utf-8")
+            yield term, self.postings(term)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+def _write_segment(path: str, docs: List[Dict[str, Any]],
+                   postings: Dict[str, List[Tuple[int, int, int]]]) -> None:
+    """
+    セグメントファイルを書き出す（一時ファイルに書いてから置き換える）
+
+    docs: 文書番号順の {"id", "title_len", "content_len", "stored"} のリスト
+    postings: 語彙 -> [(文書番号, titleでの出現数, contentでの出現数)]
+    """
+    doc_table = bytearray()
+    keys_blob = bytearray()
+    stored_blob = bytearray()
+    for doc in docs:
+        key = _KEY_SEPARATOR.join(
+            (doc["id"], doc["stored"].get("user_id") or "", doc["stored"].get("language") or "")
+        ).encode("utf-8")
+        stored = json.dumps(doc["stored"], ensure_ascii=False, default=json_default).encode("utf-8")
+        doc_table += _DOC_ENTRY.pack(doc["title_len"], doc["content_len"],
+                                     len(stored_blob), len(stored), len(keys_blob), len(key))
+        keys_blob += key
+        stored_blob += stored
+
+    term_table = bytearray()
+    term_blob = bytearray()
+    postings_blob = bytearray()
+    # 語彙はUTF-8バイト列の順に並べる（検索時の二分探索と同じ順序）
+    for term in sorted(postings, key=lambda t: t.encode("utf-8")):
+        encoded = term.encode("utf-8")
+        entries = sorted(postings[term])
+        term_table += _TERM_ENTRY.pack(len(term_blob), len(encoded), len(postings_blob), len(entries))
+        term_blob += encoded
+        for entry in entries:
+            postings_blob += _POSTING.pack(*entry)
+
+    docs_off = _HEADER.size
+    terms_off = docs_off + len(doc_table)
+    term_blob_off = terms_off + len(term_table)
+    postings_off = term_blob_off + len(term_blob)
+    keys_off = postings_off + len(postings_blob)
+    stored_off = keys_off + len(keys_blob)
+    header = _HEADER.pack(
+        SEGMENT_MAGIC, SEGMENT_VERSION, len(docs), len(postings),
+        sum(doc["title_len"] for doc in docs), sum(doc["content_len"] for doc in docs),
+        docs_off, terms_off, term_blob_off, postings_off, keys_off, stored_off
+    )
+
+    # 一時ファイル名は書き出しごとに一意にする（同時に書き出しても互いの一時ファイルを壊さない）
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for part in (header, doc_table, term_table, term_blob, postings_blob, keys_blob, stored_blob):
+                f.write(part)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class LocalSearchIndex:
+    """
+    プロセス内の全文検索インデックス
+
+    OpenSearchへ登録するドキュメントと同じ内容を受け取り、OpenSearchが使えない間も
+    BM25でランク付けした検索結果を返す
+
+    ディレクトリの書き込みは1プロセスのみを前提とする（ジャーナルの追記とセグメントの置き換えを
+    プロセス間で排他しない）。per_processの場合はプロセスごとのサブディレクトリ（worker-<pid>）を使い、
+    uvicornの複数ワーカーが互いのセグメントを上書きしないようにする
+    """
+
+    def __init__(self, directory: str, flush_threshold: int = 200, enabled: bool = True,
+                 per_process: bool = False):
+        self.base_directory = directory
+        self.per_process = per_process
+        self._set_directory()
+        self.flush_threshold = flush_threshold
+        self.enabled = enabled
+
+        self._lock = threading.RLock()
+        self._segment: Optional[_Segment] = None
+        # セグメント以降の差分（doc_id -> 文書）と削除済みdoc_id
+        self._delta: Dict[str, Dict[str, Any]] = {}
+        self._delta_postings: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self._deleted: set = set()
+        self._pending_ops = 0
+        # フラッシュ・再構築の実行中フラグ（セグメントを書き出すのは同時に1つだけ）
+        self._flushing = False
+        self._flush_done = threading.Condition(self._lock)
+        self._journal = None
+        self.ready = False
+        self.last_flush_at: Optional[float] = None
+        self.last_rebuild_at: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # 読み込み・永続化
+    # ------------------------------------------------------------------
+    def load(self) -> bool:
+        """
+        セグメントとジャーナルを読み込む
+
+        Returns:
+        --------
+        bool
+            既存のインデックスを読み込めた場合True（Falseなら再構築が必要）
+        """
+        if not self.enabled:
+            return False
+        # 生成後にforkされた場合もプロセスごとのディレクトリを使う
+        self._set_directory()
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            loaded = False
+            if os.path.exists(self.segment_path):
+                try:
+                    self._segment = _Segment(self.segment_path)
+                    loaded = True
+                except Exception as e:
+                    print(f"ローカルインデックス読み込みエラー（再構築します）: {e}")
+                    self._segment = None
+            if os.path.exists(self.journal_path):
+                self._replay_journal()
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self.ready = loaded
+            print(f"ローカルインデックス読み込み: {self.document_count()}件 (ready={self.ready})")
+            return loaded
+
+    def _set_directory(self) -> None:
+        """インデックスを保存するディレクトリとファイルのパスを決める"""
+        self.directory = (
+            os.path.join(self.base_directory, f"worker-{os.getpid()}") if self.per_process else self.base_directory
+        )
+        self.segment_path = os.path.join(self.directory, "segment.bin")
+        self.journal_path = os.path.join(self.directory, "journal.jsonl")
+
+    def _replay_journal(self) -> None:
+        """前回のフラッシュ以降の登録・削除を差分に再適用"""
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で停止した末尾行は無視
+                    continue
+                if entry.get("op") == "add":
+                    self._apply_add(entry["id"], entry["doc"])
+                elif entry.get("op") == "delete":
+                    self._apply_delete(entry["id"])
+
+    def _append_journal(self, entry: Dict[str, Any]) -> None:
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(entry, ensure_ascii=False, default=json_default) + "\n")
+        self._journal.flush()
+
+    def flush(self) -> None:
+        """差分をセグメントへマージし、ジャーナルを空にする（構築完了前は何もしない）"""
+        if not self.enabled or not self.ready:
+            return
+        with self._lock:
+            if self._flushing:
+                return
+            self._flushing = True
+        try:
+            with self._lock:
+                started = time.monotonic()
+                docs, postings = self._merged_contents()
+                _write_segment(self.segment_path, docs, postings)
+                self._swap_segment()
+                self._delta.clear()
+                self._delta_postings.clear()
+                self._deleted.clear()
+                self._pending_ops = 0
+                self._reset_journal()
+                self.last_flush_at = time.time()
+                print(f"ローカルインデックスをフラッシュ: {len(docs)}件 / "
+                      f"{round((time.monotonic() - started) * 1000, 1)}ms")
+        finally:
+            with self._lock:
+                self._flushing = False
+                self._flush_done.notify_all()
+
+    def rebuild(self, items: Iterable[Dict[str, Any]]) -> int:
+        """
+        文書の集合からセグメントを作り直す（起動時に既存インデックスがない場合など）
+
+        再構築中はフラッシュを止め、置き換えた後にジャーナルを再適用する
+        （itemsの読み出し中に受け付けた登録・削除は新しいセグメントの上の差分として残る）
+
+        Parameters:
+        -----------
+        items : Iterable[Dict[str, Any]]
+            (doc_id, OpenSearch登録用ドキュメント) のタプル
+
+        Returns:
+        --------
+        int
+            登録した文書数
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            while self._flushing:
+                self._flush_done.wait()
+            self._flushing = True
+        try:
+            started = time.monotonic()
+            docs: List[Dict[str, Any]] = []
+            postings: Dict[str, List[Tuple[int, int, int]]] = {}
+            for doc_id, doc in items:
+                entry = self._analyze(doc_id, doc)
+                ordinal = len(docs)
+                docs.append(entry)
+                for term, (title_tf, content_tf) in entry["terms"].items():
+                    postings.setdefault(term, []).append((ordinal, title_tf, content_tf))
+
+            os.makedirs(self.directory, exist_ok=True)
+            _write_segment(self.segment_path, docs, postings)
+            with self._lock:
+                self._swap_segment()
+                # 差分は古いセグメントを基準にしているため、新しいセグメントの上にジャーナルから作り直す
+                self._delta.clear()
+                self._delta_postings.clear()
+                self._deleted.clear()
+                if os.path.exists(self.journal_path):
+                    self._replay_journal()
+                self.ready = True
+                self.last_rebuild_at = time.time()
+        finally:
+            with self._lock:
+                self._flushing = False
+                self._flush_done.notify_all()
+        print(f"ローカルインデックスを再構築: {len(docs)}件 / {round(time.monotonic() - started, 2)}秒")
+        self._maybe_flush()
+        return len(docs)
+
+    def close(self) -> None:
+        """差分をフラッシュしてファイルを閉じる（構築が完了していない場合はジャーナルのまま残す）"""
+        if not self.enabled:
+            return
+        if self.ready and self._pending_ops:
+            self.flush()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+
+    def _swap_segment(self) -> None:
+        """書き出したセグメントを開き直す（ロック取得済みで呼ぶこと）"""
+        old = self._segment
+        self._segment = _Segment(self.segment_path)
+        if old is not None:
+            old.close()
+
+    def _reset_journal(self) -> None:
+        """ジャーナルを空にする（ロック取得済みで呼ぶこと）"""
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+
+    def _merged_contents(self) -> Tuple[List[Dict[str, Any]], Dict[str, List[Tuple[int, int, int]]]]:
+        """セグメントの有効な文書と差分を1つの文書表・ポスティングにまとめる（ロック取得済みで呼ぶこと）"""
+        docs: List[Dict[str, Any]] = []
+        postings: Dict[str, List[Tuple[int, int, int]]] = {}
+        remap: Dict[int, int] = {}
+
+        segment = self._segment
+        if segment is not None:
+            for ordinal, doc_id in enumerate(segment.doc_ids):
+                if not self._segment_doc_alive(doc_id):
+                    continue
+                title_len, content_len = segment.field_lengths(ordinal)
+                remap[ordinal] = len(docs)
+                docs.append({
+                    "id": doc_id,
+                    "title_len": title_len,
+                    "content_len": content_len,
+                    "stored": segment.stored(ordinal)
+                })
+            for term, entries in segment.iter_terms():
+                kept = [(remap[o], t, c) for o, t, c in entries if o in remap]
+                if kept:
+                    postings[term] = kept
+
+        for doc_id, entry in self._delta.items():
+            ordinal = len(docs)
+            docs.append(entry)
+            for term, (title_tf, content_tf) in entry["terms"].items():
+                postings.setdefault(term, []).append((ordinal, title_tf, content_tf))
+        return docs, postings
+
+    # ------------------------------------------------------------------
+    # 登録・削除
+    # ------------------------------------------------------------------
+    def add_document(self, doc_id: str, doc: Dict[str, Any]) -> None:
+        """
+        文書を登録（同じdoc_idの文書は置き換える）
+
+        Parameters:
+        -----------
+        doc_id : str
+            ドキュメントID
+        doc : Dict[str, Any]
+            OpenSearchに登録するドキュメント（title, content, user_id など）
+        """
+        if not self.enabled:
+            return
+        stored = {field: doc.get(field) for field in STORED_FIELDS}
+        with self._lock:
+            self._apply_add(doc_id, stored)
+            self._append_journal({"op": "add", "id": doc_id, "doc": stored})
+            self._pending_ops += 1
+        self._maybe_flush()
+
+    def delete_document(self, doc_id: str) -> None:
+        """文書を削除"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._apply_delete(doc_id)
+            self._append_journal({"op": "delete", "id": doc_id})
+            self._pending_ops += 1
+        self._maybe_flush()
+
+    def _apply_add(self, doc_id: str, stored: Dict[str, Any]) -> None:
+        self._apply_delete(doc_id)
+        self._deleted.discard(doc_id)
+        entry = self._analyze(doc_id, stored)
+        self._delta[doc_id] = entry
+        for term, tfs in entry["terms"].items():
+            self._delta_postings.setdefault(term, {})[doc_id] = tfs
+
+    def _apply_delete(self, doc_id: str) -> None:
+        entry = self._delta.pop(doc_id, None)
+        if entry is not None:
+            for term in entry["terms"]:
+                term_postings = self._delta_postings.get(term)
+                if term_postings is not None:
+                    term_postings.pop(doc_id, None)
+                    if not term_postings:
+                        del self._delta_postings[term]
+        if self._segment is not None and doc_id in self._segment.ordinals:
+            self._deleted.add(doc_id)
+
+    def _analyze(self, doc_id: str, stored: Dict[str, Any]) -> Dict[str, Any]:
+        """文書をトークナイズし、語彙ごとのtitle/content出現数を集計"""
+        title_tokens = tokenize(stored.get("title") or "")
+        content_tokens = tokenize(stored.get("content") or "")
+        title_counts = Counter(title_tokens)
+        content_counts = Counter(content_tokens)
+        terms = {
+            term: (title_counts.get(term, 0), content_counts.get(term, 0))
+            for term in set(title_counts) | set(content_counts)
+        }
+        return {
+            "id": doc_id,
+            "title_len": len(title_tokens),
+            "content_len": len(content_tokens),
+            "stored": stored,
+            "terms": terms
+        }
+
+    def _maybe_flush(self) -> None:
+        """差分が閾値を超えたらバックグラウンドでフラッシュ（構築完了前はフラッシュしない）"""
+        if not self.ready or self._pending_ops < self.flush_threshold or self._flushing:
+            return
+        threading.Thread(target=self.flush, name="local-index-flush", daemon=True).start()
+
+    def _segment_doc_alive(self, doc_id: str) -> bool:
+        """セグメント内の文書が削除・置き換えされていないか"""
+        return doc_id not in self._deleted and doc_id not in self._delta
+
+    # ------------------------------------------------------------------
+    # 検索
+    # ------------------------------------------------------------------
+    @metrics.timed("local_index.search")
+    def search(self, query: str, user_id: Optional[str] = None, size: int = 10,
+               offset: int = 0, include_content: bool = True,
+               language: Optional[str] = None) -> Dict[str, Any]:
+        """
+        BM25で検索
+
+        Parameters:
+        -----------
+        query : str
+            検索クエリ
+        user_id : Optional[str]
+            指定した場合、そのユーザーの文書のみを検索
+        size : int
+            返す最大件数
+        offset : int
+            スキップする件数（ページング用）
+        include_content : bool
+            Falseの場合、本文の代わりにクエリ周辺のスニペットを返す
+        language : Optional[str]
+            指定した場合、その言語の文書のみを検索
+
+        Returns:
+        --------
+        Dict[str, Any]
+            results: レスポンス用レコードのリスト（スコア順）、total: 一致件数、took_ms: 検索時間
+        """
+        started = time.monotonic()
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return {"results": [], "total": 0, "took_ms": 0.0}
+
+        with self._lock:
+            doc_count, avg_title_len, avg_content_len = self._collection_stats()
+            scores: Dict[Tuple[str, Any], float] = {}
+            matched_terms: Counter = Counter()
+            segment = self._segment
+
+            for term in query_terms:
+                segment_postings = segment.postings(term) if segment is not None else []
+                delta_postings = self._delta_postings.get(term, {})
+                df = len(segment_postings) + len(delta_postings)
+                if df == 0:
+                    continue
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+                for ordinal, title_tf, content_tf in segment_postings:
+                    doc_id = segment.doc_ids[ordinal]
+                    if not self._segment_doc_alive(doc_id):
+                        continue
+                    if user_id and segment.user_ids[ordinal] != user_id:
+                        continue
+                    if language and segment.languages[ordinal] != language:
+                        continue
+                    title_len, content_len = segment.field_lengths(ordinal)
+                    key = ("segment", ordinal)
+                    scores[key] = scores.get(key, 0.0) + idf * self._field_score(
+                        title_tf, title_len, avg_title_len, content_tf, content_len, avg_content_len)
+                    matched_terms[key] += 1
+
+                for doc_id, (title_tf, content_tf) in delta_postings.items():
+                    entry = self._delta[doc_id]
+                    if user_id and entry["stored"].get("user_id") != user_id:
+                        continue
+                    if language and entry["stored"].get("language") != language:
+                        continue
+                    key = ("delta", doc_id)
+                    scores[key] = scores.get(key, 0.0) + idf * self._field_score(
+                        title_tf, entry["title_len"], avg_title_len,
+                        content_tf, entry["content_len"], avg_content_len)
+                    matched_terms[key] += 1
+
+            required = max(1, math.ceil(len(query_terms) * MINIMUM_SHOULD_MATCH))
+            ranked = sorted(
+                (key for key in scores if matched_terms[key] >= required),
+                key=lambda key: (-scores[key], self._doc_id_for(key))
+            )
+            page = ranked[offset:offset + size]
+            results = [
+                self._record_for(key, scores[key], query_terms, include_content)
+                for key in page
+            ]
+
+        return {
+            "results": results,
+            "total": len(ranked),
+            "took_ms": round((time.monotonic() - started) * 1000, 2)
+        }
+
+    def _collection_stats(self) -> Tuple[int, float, float]:
+        """文書数と平均フィールド長（ロック取得済みで呼ぶこと）"""
+        doc_count = len(self._delta)
+        total_title = sum(entry["title_len"] for entry in self._delta.values())
+        total_content = sum(entry["content_len"] for entry in self._delta.values())
+        if self._segment is not None:
+            # 削除・置き換え分はマージまで平均長に残る（スコアへの影響は小さい）
+            doc_count += self._segment.doc_count - self._segment_dead_count()
+            total_title += self._segment.total_title_len
+            total_content += self._segment.total_content_len
+        doc_count = max(doc_count, 1)
+        return doc_count, max(total_title / doc_count, 1.0), max(total_content / doc_count, 1.0)
+
+    def _segment_dead_count(self) -> int:
+        ordinals = self._segment.ordinals
+        return len(self._deleted) + sum(1 for doc_id in self._delta if doc_id in ordinals and doc_id not in self._deleted)
+
+    @staticmethod
+    def _field_score(title_tf: int, title_len: int, avg_title_len: float,
+                     content_tf: int, content_len: int, avg_content_len: float) -> float:
+        """フィールド別BM25の重み付き和（idfを除く）"""
+        score = 0.0
+        for tf, length, avg_length, weight in (
+                (title_tf, title_len, avg_title_len, FIELD_WEIGHTS["title"]),
+                (content_tf, content_len, avg_content_len, FIELD_WEIGHTS["content"])):
+            if tf:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                score += weight * tf * (BM25_K1 + 1) / (tf + norm)
+        return score
+
+    def _doc_id_for(self, key: Tuple[str, Any]) -> str:
+        source, ref = key
+        return self._segment.doc_ids[ref] if source == "segment" else ref
+
+    def _record_for(self, key: Tuple[str, Any], score: float, query_terms: List[str],
+                    include_content: bool) -> Dict[str, Any]:
+        """レスポンス用レコードを作成（OpenSearchの_sourceから作るレコードと同じ形）"""
+        source, ref = key
+        if source == "segment":
+            doc_id, stored = self._segment.doc_ids[ref], self._segment.stored(ref)
+        else:
+            doc_id, stored = ref, self._delta[ref]["stored"]
+        content = stored.get("content") or ""
+        return {
+            "id": doc_id,
+            "s3_key": stored.get("s3_key") or "",
+            "file_name": stored.get("file_name") or "",
+            "file_type": stored.get("file_type") or "unknown",
+            "formatted_text": content if include_content else _snippet(content, query_terms),
+            "uploaded_at": stored.get("uploaded_at") or "",
+            "title": stored.get("title") or "",
+            "description": stored.get("description") or "",
+            "extracted_metadata": stored.get("extracted_metadata") or {},
+            "user_id": stored.get("user_id") or "unknown",
+            "language": stored.get("language"),
+            "score": round(score, 4)
+        }
+
+    # ------------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------------
+    def document_count(self) -> int:
+        with self._lock:
+            count = len(self._delta)
+            if self._segment is not None:
+                count += self._segment.doc_count - self._segment_dead_count()
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        """インデックスの状態を返す（ステータスAPI用）"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "ready": self.ready,
+                "directory": self.directory,
+                "documents": self.document_count(),
+                "segment_documents": self._segment.doc_count if self._segment is not None else 0,
+                "segment_terms": self._segment.term_count if self._segment is not None else 0,
+                "segment_bytes": os.path.getsize(self.segment_path) if self._segment is not None else 0,
+                "delta_documents": len(self._delta),
+                "deleted_documents": len(self._deleted),
+                "pending_operations": self._pending_ops,
+                "last_flush_at": self.last_flush_at,
+                "last_rebuild_at": self.last_rebuild_at
+            }
+
+
+def _snippet(content: str, query_terms: List[str]) -> str:
+    """最初にクエリ語が現れる位置の周辺を切り出す"""
+    if not content:
+        return ""
+    normalized = unicodedata.normalize("NFKC", content).lower()
+    positions = [normalized.find(term) for term in query_terms]
+    positions = [position for position in positions if position >= 0]
+    start = max(0, min(positions) - SNIPPET_LENGTH // 3) if positions else 0
+    snippet = content[start:start + SNIPPET_LENGTH]
+    return ("..." if start > 0 else "") + snippet + ("..." if start + SNIPPET_LENGTH < len(content) else "")
+
+
+# シングルトンインスタンス
+local_search_index = LocalSearchIndex(
+    LOCAL_INDEX_DIR,
+    flush_threshold=LOCAL_INDEX_FLUSH_THRESHOLD,
+    enabled=LOCAL_INDEX_ENABLED,
+    per_process=True
+)
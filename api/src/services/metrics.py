@@ -0,0 +1,221 @@
+"""
+計測モジュール
+処理段階ごとの所要時間（スパン）を計測し、リクエスト単位ではServer-Timingヘッダーとして、
+プロセス全体ではPrometheus形式のヒストグラム・カウンターとして/metricsで公開する
+"""
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..config import METRICS_ENABLED, SERVER_TIMING_ENABLED
+
+# レイテンシーヒストグラムのバケット境界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 処理中のリクエストで記録したスパン（ミドルウェアがリクエストごとに空のリストを設定する）
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "factify_request_spans", default=None
+)
+
+LabelValues = Tuple[str, ...]
+
+
+class Counter:
+    """ラベルごとの累積カウンター"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, labels: LabelValues, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """ラベルごとのレイテンシーヒストグラム（累積バケット・合計・件数）"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [バケットごとの件数..., 合計, 件数]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, labels: LabelValues, value: float) -> None:
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, series):
+                bucket_labels = _format_labels(self.label_names + ("le",), labels + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {_format_value(count)}")
+            inf_labels = _format_labels(self.label_names + ("le",), labels + ("+Inf",))
+            lines.append(f"{self.name}_bucket{inf_labels} {_format_value(series[-1])}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{label_text} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """スパン計測とメトリクスの集計（スレッドセーフ）"""
+
+    def __init__(self, enabled: bool = True, server_timing: bool = True):
+        self.enabled = enabled
+        self.server_timing_enabled = enabled and server_timing
+        self._lock = threading.Lock()
+        self.stage_duration = Histogram(
+            "factify_stage_duration_seconds",
+            "Latency of named processing stages and backend calls.",
+            ("stage",)
+        )
+        self.stage_errors = Counter(
+            "factify_stage_errors_total",
+            "Number of stages that raised an exception.",
+            ("stage",)
+        )
+        self.request_duration = Histogram(
+            "factify_http_request_duration_seconds",
+            "Latency of HTTP requests by route.",
+            ("method", "route")
+        )
+        self.requests = Counter(
+            "factify_http_requests_total",
+            "Number of HTTP requests by route and status code.",
+            ("method", "route", "status")
+        )
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """
+        処理段階の所要時間を計測
+
+        ヒストグラムに記録し、リクエスト処理中であればServer-Timing用にも記録する
+
+        Parameters:
+        -----------
+        name : str
+            段階名（"opensearch.search"、"dynamodb.batch_get" など）
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stage_duration.observe((name,), elapsed)
+                if failed:
+                    self.stage_errors.inc((name,))
+            spans = _request_spans.get()
+            if spans is not None:
+                spans.append((name, elapsed))
+
+    def timed(self, name: str) -> Callable:
+        """関数（同期・非同期）の呼び出しをスパンとして計測するデコレーター"""
+        def decorator(func: Callable) -> Callable:
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def start_request(self) -> Tuple[List[Tuple[str, float]], contextvars.Token]:
+        """リクエストのスパン記録を開始（戻り値のトークンでend_requestを呼ぶ）"""
+        spans: List[Tuple[str, float]] = []
+        return spans, _request_spans.set(spans)
+
+    def end_request(self, token: contextvars.Token, method: str, route: str,
+                    status_code: int, elapsed: float) -> None:
+        """リクエストのスパン記録を終了し、ルート単位のレイテンシーと件数を記録"""
+        _request_spans.reset(token)
+        if not self.enabled:
+            return
+        with self._lock:
+            self.request_duration.observe((method, route), elapsed)
+            self.requests.inc((method, route, str(status_code)))
+
+    def server_timing(self, spans: List[Tuple[str, float]], total: float) -> str:
+        """
+        スパンからServer-Timingヘッダーの値を作成
+
+        同じ段階が複数回あった場合は合計時間にまとめ、回数をdescに含める
+        """
+        totals: Dict[str, List[float]] = {}
+        for name, elapsed in list(spans):
+            entry = totals.setdefault(name, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += 1
+        metrics = []
+        for name, (elapsed, count) in totals.items():
+            metric = f"{name};dur={elapsed * 1000:.1f}"
+            if count > 1:
+                metric += f';desc="x{count}"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def render_prometheus(self) -> str:
+        """Prometheusのテキスト形式で全メトリクスを出力"""
+        with self._lock:
+            lines = (
+                self.requests.render()
+                + self.request_duration.render()
+                + self.stage_duration.render()
+                + self.stage_errors.render()
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+# シングルトンインスタンス
+metrics = MetricsRegistry(enabled=METRICS_ENABLED, server_timing=SERVER_TIMING_ENABLED)
@@ -0,0 +1,181 @@
+"""
+OpenSearchヘルス状態管理モジュール
+バックグラウンドのヘルスプローブと実リクエストの成否から共有のヘルス状態を更新し、
+サーキットブレーカーとして検索リクエストの振り分けを判断する
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+class OpenSearchHealthState:
+    """
+    OpenSearchのヘルス状態とサーキットブレーカー
+
+    - closed: 正常。全リクエストをOpenSearchへ送る
+    - open: 障害中。リクエストは送らずDynamoDBフォールバックへ回す
+    - half_open: 回復確認中。限られた数の試行リクエストのみ通す
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open_since: Optional[float] = None
+        self._half_open_in_flight = 0
+
+        # 統計情報
+        self._total_successes = 0
+        self._total_failures = 0
+        self._rejected_requests = 0
+        self._last_success_at: Optional[float] = None
+        self._last_failure_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._last_probe_at: Optional[float] = None
+        self._last_probe_ok: Optional[bool] = None
+
+    @property
+    def state(self) -> str:
+        """現在のブレーカー状態"""
+        with self._lock:
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        OpenSearchへリクエストを送ってよいかを判定する
+
+        Returns:
+        --------
+        bool
+            Trueならリクエスト送信可、FalseならDynamoDBフォールバックへ回す
+        """
+        with self._lock:
+            now = time.monotonic()
+
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.OPEN:
+                if self._opened_at is not None and now - self._opened_at >= self.reset_timeout:
+                    self._enter_half_open(now)
+                else:
+                    self._rejected_requests += 1
+                    return False
+
+            # half_open: 試行枠が残っていれば通す（結果が返らない試行は一定時間で枠を回収）
+            if (self._half_open_in_flight >= self.half_open_max_calls
+                    and self._half_open_since is not None
+                    and now - self._half_open_since >= self.reset_timeout):
+                self._half_open_in_flight = 0
+                self._half_open_since = now
+
+            if self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+
+            self._rejected_requests += 1
+            return False
+
+    def record_success(self) -> None:
+        """実リクエストの成功を記録する"""
+        with self._lock:
+            self._total_successes += 1
+            self._last_success_at = time.time()
+            self._consecutive_failures = 0
+            if self._state != self.CLOSED:
+                print(f"OpenSearchサーキットブレーカー: {self._state} -> {self.CLOSED}")
+            self._state = self.CLOSED
+            self._opened_at = None
+            self._half_open_since = None
+            self._half_open_in_flight = 0
+
+    def record_failure(self, error: Optional[str] = None) -> None:
+        """実リクエストの失敗を記録する"""
+        with self._lock:
+            self._total_failures += 1
+            self._last_failure_at = time.time()
+            self._last_error = error
+            self._consecutive_failures += 1
+
+            if self._state == self.HALF_OPEN:
+                # 試行リクエストが失敗したら再び遮断
+                self._trip(time.monotonic())
+            elif self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._trip(time.monotonic())
+
+    def record_probe(self, healthy: bool, error: Optional[str] = None) -> None:
+        """
+        バックグラウンドのヘルスプローブ結果を記録する
+
+        プローブ成功は回復の兆候として扱い、遮断中ならhalf_openへ移行させる
+        （closedへの復帰は実リクエストの成功で判断する）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._last_probe_at = time.time()
+            self._last_probe_ok = healthy
+
+            if healthy:
+                if self._state == self.OPEN:
+                    self._enter_half_open(now)
+                return
+
+            self._last_failure_at = time.time()
+            self._last_error = error or "health probe failed"
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or (
+                    self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self._trip(now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """現在の状態を辞書で返す（ステータスAPI用）"""
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_seconds": self.reset_timeout,
+                "half_open_max_calls": self.half_open_max_calls,
+                "total_successes": self._total_successes,
+                "total_failures": self._total_failures,
+                "rejected_requests": self._rejected_requests,
+                "last_success_at": _isoformat(self._last_success_at),
+                "last_failure_at": _isoformat(self._last_failure_at),
+                "last_error": self._last_error,
+                "last_probe_at": _isoformat(self._last_probe_at),
+                "last_probe_ok": self._last_probe_ok
+            }
+
+    def _trip(self, now: float) -> None:
+        """ブレーカーを遮断状態にする（ロック取得済みで呼ぶこと）"""
+        if self._state != self.OPEN:
+            print(f"OpenSearchサーキットブレーカー: {self._state} -> {self.OPEN}")
+        self._state = self.OPEN
+        self._opened_at = now
+        self._half_open_since = None
+        self._half_open_in_flight = 0
+
+    def _enter_half_open(self, now: float) -> None:
+        """ブレーカーを回復確認状態にする（ロック取得済みで呼ぶこと）"""
+        print(f"OpenSearchサーキットブレーカー: {self._state} -> {self.HALF_OPEN}")
+        self._state = self.HALF_OPEN
+        self._half_open_since = now
+        self._half_open_in_flight = 0
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    """UNIXタイムスタンプをISO 8601文字列に変換"""
+    if timestamp is None:
+        return None
+    return datetime.utcfromtimestamp(timestamp).isoformat()
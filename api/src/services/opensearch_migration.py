@@ -0,0 +1,369 @@
+"""
+OpenSearchデータ移行モジュール
+DynamoDBを並列セグメントスキャンでページ単位に読み、サイズ上限付きの_bulkリクエストを並行送信して
+再インデックスする。ページごとにチェックポイントを保存し、中断した移行を続きから再開できる
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..aws_services import aws_services
+from ..config import (
+    MIGRATE_TOTAL_SEGMENTS,
+    MIGRATE_MAX_CONCURRENT_BULKS,
+    MIGRATE_BULK_MAX_BYTES,
+    MIGRATE_BULK_MAX_DOCS,
+    MIGRATE_MAX_RETRIES,
+    MIGRATE_RETRY_BACKOFF,
+    MIGRATE_CHECKPOINT_PATH,
+    MIGRATE_DISABLE_REFRESH,
+)
+from ..metadata_handlers import is_ready_item
+from ..text_processors import detect_language, extract_content_section
+from .job_runner import job_runner
+from .opensearch_service import opensearch_service
+from .text_store import text_store
+
+CHECKPOINT_VERSION = 1
+
+# 再試行する_bulkの項目ステータス（0は通信エラー、それ以外の4xxはドキュメント自体の問題として再試行しない）
+RETRYABLE_STATUSES = {0, 429, 500, 502, 503, 504}
+
+# 結果に含める失敗ドキュメントIDの上限
+MAX_REPORTED_FAILURES = 100
+
+# 進捗ログの出力間隔（秒）
+PROGRESS_LOG_INTERVAL = 5.0
+
+
+class MigrationInProgressError(Exception):
+    """移行がすでに実行中"""
+
+
+class FileCheckpointStore:
+    """チェックポイントをローカルファイルに保存"""
+
+    def __init__(self, path: str = MIGRATE_CHECKPOINT_PATH):
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """チェックポイントを読み込む（存在しない・壊れている場合はNone）"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"チェックポイント読み込みエラー（最初から移行します）: {e}")
+            return None
+
+    def save(self, checkpoint: Dict[str, Any]) -> None:
+        """一時ファイル経由で置き換え保存（書き込み途中のクラッシュで壊れないように）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, default=str)
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class JobStateCheckpointStore:
+    """チェックポイントをバックグラウンドジョブの状態に保存（ジョブのハートビートでDynamoDBに永続化される）"""
+
+    def __init__(self, context):
+        self.context = context
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        return self.context.state.get("checkpoint")
+
+    def save(self, checkpoint: Dict[str, Any]) -> None:
+        # 移行中に書き換わらないよう複製して保存する
+        snapshot = json.loads(json.dumps(checkpoint, default=str))
+        self.context.save_state({**self.context.state, "checkpoint": snapshot})
+
+    def remove(self) -> None:
+        self.context.save_state({key: value for key, value in self.context.state.items() if key != "checkpoint"})
+
+
+class OpenSearchMigrator:
+    """DynamoDBからOpenSearchへの一括・並列・再開可能なデータ移行"""
+
+    def __init__(self, opensearch=opensearch_service, aws=aws_services,
+                 total_segments: int = MIGRATE_TOTAL_SEGMENTS,
+                 max_concurrent_bulks: int = MIGRATE_MAX_CONCURRENT_BULKS,
+                 bulk_max_bytes: int = MIGRATE_BULK_MAX_BYTES,
+                 bulk_max_docs: int = MIGRATE_BULK_MAX_DOCS,
+                 max_retries: int = MIGRATE_MAX_RETRIES,
+                 retry_backoff: float = MIGRATE_RETRY_BACKOFF,
+                 checkpoint_store=None,
+                 disable_refresh: bool = MIGRATE_DISABLE_REFRESH,
+                 executor: Optional[Executor] = None):
+        self.opensearch = opensearch
+        self.aws = aws
+        self.total_segments = total_segments
+        self.max_concurrent_bulks = max_concurrent_bulks
+        self.bulk_max_bytes = bulk_max_bytes
+        self.bulk_max_docs = bulk_max_docs
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.checkpoint_store = checkpoint_store or FileCheckpointStore()
+        self.disable_refresh = disable_refresh
+        # DynamoDBのスキャンとドキュメント作成はジョブ用の上限付きスレッドプールで実行する
+        self.executor = executor or job_runner.executor
+        self.running = False
+        # 実行中（または直前）の移行の統計
+        self._stats: Optional[Dict[str, Any]] = None
+        self._last_progress_log = 0.0
+        self._on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    async def run(self, resume: bool = True, checkpoint_store=None,
+                  on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        移行を実行
+
+        Parameters:
+        -----------
+        resume : bool
+            チェックポイントがあれば続きから再開する（Falseなら最初からやり直す）
+        checkpoint_store : optional
+            load / save / remove を持つチェックポイントの保存先（省略時はローカルファイル）
+        on_progress : Optional[Callable[[Dict[str, Any]], None]]
+            ページを処理するたびに統計（progressと同じ形式）を受け取るコールバック
+
+        Returns:
+        --------
+        Dict[str, Any]
+            件数（累計）・再試行数・スループット・失敗したドキュメントIDなどの統計
+
+        Raises:
+        -------
+        MigrationInProgressError
+            別の移行が実行中の場合
+        """
+        if self.running:
+            raise MigrationInProgressError("データ移行はすでに実行中です")
+        self.running = True
+        store = checkpoint_store or self.checkpoint_store
+        self._on_progress = on_progress
+        try:
+            checkpoint = store.load() if resume else None
+            if checkpoint is not None and checkpoint.get("version") != CHECKPOINT_VERSION:
+                checkpoint = None
+            resumed = checkpoint is not None
+            if checkpoint is None:
+                checkpoint = self._new_checkpoint()
+            self._stats = self._new_stats(checkpoint, resumed)
+            print(f"データ移行開始: {self.total_segments}セグメント"
+                  f"{'（チェックポイントから再開）' if resumed else ''}")
+
+            previous_refresh = None
+            if self.disable_refresh:
+                # 一括登録中はリフレッシュを止め、セグメントのマージ負荷を下げる
+                previous_refresh = await self.opensearch.get_refresh_interval_async()
+                await self.opensearch.set_refresh_interval_async("-1")
+            try:
+                semaphore = asyncio.Semaphore(self.max_concurrent_bulks)
+                outcomes = await asyncio.gather(
+                    *(self._migrate_segment(segment, checkpoint, semaphore, store)
+                      for segment in range(checkpoint["total_segments"])),
+                    return_exceptions=True
+                )
+            finally:
+                if self.disable_refresh:
+                    # 復元の失敗で移行自体のエラーを隠さない（失敗した場合はログから手動で戻す）
+                    try:
+                        await self.opensearch.set_refresh_interval_async(previous_refresh)
+                        await self.opensearch.refresh_async()
+                    except Exception as e:
+                        print(f"refresh_intervalの復元エラー（{previous_refresh or '既定値'}に戻してください）: {e}")
+
+            # 失敗したセグメントがあってもチェックポイントは残るので、再実行で続きから再開できる
+            errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+            if errors:
+                raise errors[0]
+
+            store.remove()
+            stats = self.progress()
+            print(f"データ移行完了: 成功{stats['successful_migrations']}件 / 失敗{stats['failed_migrations']}件 / "
+                  f"{stats['docs_per_second']}件/秒 / {stats['bytes_per_second']}バイト/秒")
+            return stats
+        finally:
+            self.running = False
+            self._on_progress = None
+
+    def progress(self) -> Optional[Dict[str, Any]]:
+        """実行中（または直前）の移行の統計を返す"""
+        stats = self._stats
+        if stats is None:
+            return None
+        elapsed = max(time.monotonic() - stats["started"], 1e-6)
+        return {
+            "running": self.running,
+            "resumed": stats["resumed"],
+            "total_items": stats["indexed_total"] + stats["failed_total"],
+            "successful_migrations": stats["indexed_total"],
+            "failed_migrations": stats["failed_total"],
+            "indexed_this_run": stats["indexed"],
+            "retries": stats["retries"],
+            "bulk_requests": stats["bulk_requests"],
+            "pages": stats["pages"],
+            "segments_done": stats["segments_done"],
+            "total_segments": stats["total_segments"],
+            "bytes_sent": stats["bytes_sent"],
+            "elapsed_seconds": round(elapsed, 1),
+            "docs_per_second": round(stats["indexed"] / elapsed, 1),
+            "bytes_per_second": round(stats["bytes_sent"] / elapsed, 1),
+            "failed_ids": list(stats["failed_ids"])
+        }
+
+    async def _migrate_segment(self, segment: int, checkpoint: Dict[str, Any],
+                               semaphore: asyncio.Semaphore, store) -> None:
+        """1セグメントをページ単位に移行し、ページごとにチェックポイントを保存"""
+        loop = asyncio.get_running_loop()
+        state = checkpoint["segments"][segment]
+        while not state["done"]:
+            page = await loop.run_in_executor(
+                self.executor, self.aws.scan_segment_page, segment, checkpoint["total_segments"], state["k"]
+            )
+            docs = await loop.run_in_executor(self.executor, self._prepare_documents, page["items"])
+            await asyncio.gather(*(
+                self._send_batch(batch, semaphore) for batch in self._make_batches(docs)
+            ))
+
+            # ページ内の全ドキュメントの処理（成功または再試行しない失敗）が終わってから位置を進める
+            state["k"] = page["last_key"]
+            state["done"] = page["last_key"] is None
+            checkpoint["indexed"] = self._stats["indexed_total"]
+            checkpoint["failed"] = self._stats["failed_total"]
+            self._stats["pages"] += 1
+            if state["done"]:
+                self._stats["segments_done"] += 1
+            store.save(checkpoint)
+            if self._on_progress:
+                self._on_progress(self.progress())
+            self._log_progress()
+
+    def _prepare_documents(self, items: List[Dict[str, Any]]) -> List[Tuple[str, Dict, int]]:
+        """
+        DynamoDBアイテムから登録用ドキュメントを作成（ワーカースレッドで実行）
+
+        言語判定導入前のドキュメントは本文から判定してDynamoDBにも保存する。S3に保存した本文はここで読み込む。
+        取り込み中・取り込みに失敗したドキュメントは含めない
+
+        Returns:
+        --------
+        List[Tuple[str, Dict, int]]
+            (ドキュメントID, 登録用ドキュメント, シリアライズ後の推定バイト数) のリスト
+        """
+        docs = []
+        for item in items:
+            # 取り込みが完了していないドキュメントは取り込みワーカーが登録する
+            if not is_ready_item(item):
+                continue
+            # S3に保存した本文を読み込む（全件を順に読むのでキャッシュは使わない）
+            item = text_store.with_text(item, use_cache=False)
+            if not item.get("language"):
+                item["language"] = detect_language(extract_content_section(item.get("formatted_text", "")))
+                try:
+                    self.aws.update_document_language(item["id"], item["language"])
+                except Exception as e:
+                    print(f"言語コード保存エラー（無視して処理継続）: {item['id']} - {e}")
+            doc = self.opensearch._build_document_from_item(item)
+            size = len(json.dumps(doc, ensure_ascii=False, default=str).encode("utf-8"))
+            docs.append((item["id"], doc, size))
+        return docs
+
+    def _make_batches(self, docs: List[Tuple[str, Dict, int]]) -> List[List[Tuple[str, Dict, int]]]:
+        """ドキュメントをバイト数と件数の上限で_bulkリクエスト単位に分割"""
+        batches: List[List[Tuple[str, Dict, int]]] = []
+        batch: List[Tuple[str, Dict, int]] = []
+        batch_bytes = 0
+        for doc in docs:
+            if batch and (batch_bytes + doc[2] > self.bulk_max_bytes or len(batch) >= self.bulk_max_docs):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(doc)
+            batch_bytes += doc[2]
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _send_batch(self, batch: List[Tuple[str, Dict, int]], semaphore: asyncio.Semaphore) -> None:
+        """_bulkで送信し、一時的なエラーの項目だけを指数バックオフで再送"""
+        stats = self._stats
+        pending = batch
+        attempt = 0
+        while pending:
+            async with semaphore:
+                results = await self.opensearch.bulk_index_async([(doc_id, doc) for doc_id, doc, _ in pending])
+            stats["bulk_requests"] += 1
+            stats["bytes_sent"] += sum(size for _, _, size in pending)
+
+            retry = []
+            for doc, result in zip(pending, results):
+                if result["error"] is None:
+                    stats["indexed"] += 1
+                    stats["indexed_total"] += 1
+                elif result["status"] in RETRYABLE_STATUSES and attempt < self.max_retries:
+                    retry.append(doc)
+                else:
+                    stats["failed_total"] += 1
+                    if len(stats["failed_ids"]) < MAX_REPORTED_FAILURES:
+                        stats["failed_ids"].append(doc[0])
+                    print(f"移行失敗: {doc[0]} - {result['error']}")
+
+            if retry:
+                attempt += 1
+                stats["retries"] += len(retry)
+                await asyncio.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+            pending = retry
+
+    def _log_progress(self) -> None:
+        """一定間隔で進捗とスループットを出力"""
+        now = time.monotonic()
+        if now - self._last_progress_log < PROGRESS_LOG_INTERVAL:
+            return
+        self._last_progress_log = now
+        stats = self.progress()
+        print(f"データ移行進捗: {stats['successful_migrations']}件 / "
+              f"セグメント{stats['segments_done']}/{stats['total_segments']} / "
+              f"{stats['docs_per_second']}件/秒 / {stats['bytes_per_second']}バイト/秒")
+
+    def _new_checkpoint(self) -> Dict[str, Any]:
+        return {
+            "version": CHECKPOINT_VERSION,
+            "total_segments": self.total_segments,
+            "segments": [{"k": None, "done": False} for _ in range(self.total_segments)],
+            "indexed": 0,
+            "failed": 0
+        }
+
+    def _new_stats(self, checkpoint: Dict[str, Any], resumed: bool) -> Dict[str, Any]:
+        return {
+            "started": time.monotonic(),
+            "resumed": resumed,
+            "indexed": 0,
+            "indexed_total": checkpoint["indexed"],
+            "failed_total": checkpoint["failed"],
+            "retries": 0,
+            "bulk_requests": 0,
+            "pages": 0,
+            "segments_done": sum(1 for state in checkpoint["segments"] if state["done"]),
+            "total_segments": checkpoint["total_segments"],
+            "bytes_sent": 0,
+            "failed_ids": []
+        }
+
+
+# シングルトンインスタンス
+opensearch_migrator = OpenSearchMigrator()
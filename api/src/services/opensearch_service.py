@@ -1,28 +1,266 @@
 """
 OpenSearch最小構成検索サービス
 AWS OpenSearchサービス対応版（認証付き）
+
+FastAPIのエンドポイントからは非同期クライアント（httpx）を、スクリプトからは
+同期クライアント（requests）を使用する。どちらもkeep-aliveのコネクションプールを
+保持し、リクエストごとのTLSハンドシェイクを避ける。
+実リクエストの成否とバックグラウンドのヘルスプローブは共有のヘルス状態
+（サーキットブレーカー）に反映される。
 """
-import requests
+import asyncio
 import json
-from typing import Dict, List, Optional
+import httpx
+import requests
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from ..config import OPENSEARCH_ENDPOINT, OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD
+from ..config import (
+    OPENSEARCH_ENDPOINT,
+    OPENSEARCH_USERNAME,
+    OPENSEARCH_PASSWORD,
+    OPENSEARCH_POOL_SIZE,
+    OPENSEARCH_TIMEOUT,
+    OPENSEARCH_CONNECT_TIMEOUT,
+    OPENSEARCH_HEALTH_TIMEOUT,
+    OPENSEARCH_KEEPALIVE_EXPIRY,
+    OPENSEARCH_HEALTH_PROBE_INTERVAL,
+    OPENSEARCH_BREAKER_FAILURE_THRESHOLD,
+    OPENSEARCH_BREAKER_RESET_TIMEOUT,
+    OPENSEARCH_BREAKER_HALF_OPEN_MAX_CALLS,
+    SEARCH_TIERED_QUERY,
+    SEARCH_TIER_MIN_HITS,
+    PASSAGE_INDEX_ENABLED,
+    PASSAGE_INDEX_NAME,
+    PASSAGE_CHARS,
+    PASSAGE_OVERLAP,
+    PASSAGE_MAX_PER_DOCUMENT,
+)
+from ..metadata_handlers import is_ready_item
+from ..text_processors import extract_content_section, split_passages
+from .opensearch_health import OpenSearchHealthState
+from .local_search_index import local_search_index
+from .json_utils import json_default
+from .metrics import metrics
+
+# 段階的検索の各段（安い句から順に実行し、ヒットがSEARCH_TIER_MIN_HITSに満たない場合のみ次の段へ広げる）
+# 各段はそれまでの句を含み、最後の段は全4句の従来クエリと同じになる
+TIER_PHRASE_AND = "phrase_and"  # 完全一致 + 部分一致（AND）
+TIER_OR = "or"                  # + 単語レベル一致（OR）
+TIER_FUZZY = "fuzzy"            # + typo許容
+QUERY_TIERS = (TIER_PHRASE_AND, TIER_OR, TIER_FUZZY)
+# 各段で使うshould句の数
+_TIER_CLAUSE_COUNTS = {TIER_PHRASE_AND: 2, TIER_OR: 3, TIER_FUZZY: 4}
+
+# パッセージを_bulkで登録する際の1リクエストあたりの件数
+PASSAGE_BULK_DOCS = 500
 
 
 class MinimalOpenSearchService:
     """AWS OpenSearch検索サービス（認証対応版）"""
-    
-    def __init__(self):
+
+    def __init__(self, pool_size: int = OPENSEARCH_POOL_SIZE, timeout: float = OPENSEARCH_TIMEOUT):
         # HTTPS エンドポイント（認証付き）
         self.endpoint = OPENSEARCH_ENDPOINT
         self.index_name = "factify-docs"
+        # 本文を一定長に分けたパッセージ（親ドキュメントIDを持つ子ドキュメント）のインデックス
+        self.passage_index_name = PASSAGE_INDEX_NAME
+        self.passages_enabled = PASSAGE_INDEX_ENABLED
+        # 検索結果の同順位解決（search_afterによるページング）に使うフィールド。
+        # マッピング更新時に既存インデックスの定義を見て決める（doc_idが動的にtextで登録済みならdoc_id.keyword）
+        self.sort_tiebreak_field: Optional[str] = "doc_id"
         self.auth = HTTPBasicAuth(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD)
         # SSL証明書の検証を有効化
         self.verify_ssl = True
-        
-    def create_index(self) -> Dict:
-        """超シンプルなインデックス作成"""
-        mapping = {
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        # 同期クライアント（スクリプト用）: keep-aliveセッションを使い回す
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.auth = self.auth
+        self.session.verify = self.verify_ssl
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        # 非同期クライアント（FastAPI用）: イベントループ上で初回使用時に生成する
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+        # 共有ヘルス状態（サーキットブレーカー）とバックグラウンドプローブ
+        self.health = OpenSearchHealthState(
+            failure_threshold=OPENSEARCH_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=OPENSEARCH_BREAKER_RESET_TIMEOUT,
+            half_open_max_calls=OPENSEARCH_BREAKER_HALF_OPEN_MAX_CALLS
+        )
+        self._health_monitor_task: Optional[asyncio.Task] = None
+
+        # 段階的検索（安い句で足りない場合のみOR・typo許容の句へ広げる）と、どの段で応答したかの集計
+        self.tiered_query = SEARCH_TIERED_QUERY
+        self.tier_min_hits = SEARCH_TIER_MIN_HITS
+        self._tier_counts = {tier: 0 for tier in QUERY_TIERS}
+
+        # OpenSearch障害時の検索用に、APIプロセスでの登録・削除をローカルインデックスにも反映する
+        self.local_index = local_search_index
+
+    # ==================== HTTPクライアント ====================
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """コネクションプール付き非同期クライアントを取得（遅延生成）"""
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                auth=httpx.BasicAuth(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD),
+                verify=self.verify_ssl,
+                headers={"Content-Type": "application/json"},
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                    keepalive_expiry=OPENSEARCH_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=OPENSEARCH_CONNECT_TIMEOUT)
+            )
+        return self._async_client
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None,
+                 timeout: Optional[float] = None, track_health: bool = True) -> requests.Response:
+        """同期リクエストを送信"""
+        try:
+            with metrics.span(_span_name(path)):
+                response = self.session.request(
+                    method,
+                    f"{self.endpoint}{path}",
+                    json=body,
+                    timeout=(OPENSEARCH_CONNECT_TIMEOUT, timeout or self.timeout)
+                )
+        except Exception as e:
+            if track_health:
+                self.health.record_failure(f"{type(e).__name__}: {e}")
+            raise
+        if track_health:
+            self._record_response(response.status_code)
+        return response
+
+    async def _request_async(self, method: str, path: str, body: Optional[Dict] = None,
+                             timeout: Optional[float] = None, track_health: bool = True,
+                             ndjson: Optional[List[Dict]] = None) -> httpx.Response:
+        """非同期リクエストを送信（ndjson指定時は各行をNDJSONとして送信）"""
+        client = self._get_async_client()
+        request_kwargs: Dict[str, Any] = {"json": body}
+        if ndjson is not None:
+            request_kwargs = {
+                "content": _to_ndjson(ndjson),
+                "headers": {"Content-Type": "application/x-ndjson"}
+            }
+        try:
+            with metrics.span(_span_name(path)):
+                response = await client.request(
+                    method,
+                    f"{self.endpoint}{path}",
+                    timeout=httpx.Timeout(timeout or self.timeout, connect=OPENSEARCH_CONNECT_TIMEOUT),
+                    **request_kwargs
+                )
+        except Exception as e:
+            if track_health:
+                self.health.record_failure(f"{type(e).__name__}: {e}")
+            raise
+        if track_health:
+            self._record_response(response.status_code)
+        return response
+
+    def _record_response(self, status_code: int) -> None:
+        """レスポンスのステータスをヘルス状態に反映（5xxと429はクラスター側の障害とみなす）"""
+        if status_code >= 500 or status_code == 429:
+            self.health.record_failure(f"HTTP {status_code}")
+        else:
+            self.health.record_success()
+
+    def close(self) -> None:
+        """同期セッションを閉じる"""
+        self.session.close()
+
+    async def close_async(self) -> None:
+        """非同期クライアントを閉じる（アプリケーション終了時）"""
+        await self.stop_health_monitor()
+        if self._async_client is not None and not self._async_client.is_closed:
+            await self._async_client.aclose()
+        self._async_client = None
+
+    # ==================== バックグラウンドヘルスプローブ ====================
+
+    def start_health_monitor(self, interval: float = OPENSEARCH_HEALTH_PROBE_INTERVAL) -> None:
+        """ヘルスプローブを定期実行するバックグラウンドタスクを開始"""
+        if self._health_monitor_task is None or self._health_monitor_task.done():
+            self._health_monitor_task = asyncio.create_task(self._health_monitor_loop(interval))
+
+    async def stop_health_monitor(self) -> None:
+        """バックグラウンドのヘルスプローブを停止"""
+        task = self._health_monitor_task
+        self._health_monitor_task = None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    @metrics.timed("opensearch.health_probe")
+    async def probe_health_async(self) -> bool:
+        """_cluster/healthを1回確認し、結果を共有ヘルス状態に記録する"""
+        healthy = await self.health_check_async()
+        self.health.record_probe(healthy)
+        return healthy
+
+    async def _health_monitor_loop(self, interval: float) -> None:
+        """ヘルスプローブのループ"""
+        while True:
+            try:
+                await self.probe_health_async()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"OpenSearchヘルスプローブエラー: {e}")
+            await asyncio.sleep(interval)
+
+    # ==================== リクエストボディ生成 ====================
+
+    def _build_index_properties(self) -> Dict:
+        """
+        フィールド定義
+        検索レスポンス（Documentモデル）に必要な項目をすべて_sourceに保持し、
+        検索時にDynamoDBを参照しなくて済むようにする
+        """
+        return {
+            "title": {
+                "type": "text",
+                "analyzer": "japanese_text",
+                "fields": {
+                    "keyword": {"type": "keyword"},
+                    # 入力補完（/search/suggest）用のプレフィックス検索サブフィールド
+                    "suggest": {"type": "search_as_you_type", "analyzer": "japanese_text"}
+                }
+            },
+            "content": {
+                "type": "text",
+                "analyzer": "japanese_text"
+            },
+            "user_id": {"type": "keyword"},
+            "file_type": {"type": "keyword"},
+            # アップロード時に判定した言語（termフィルター用）
+            "language": {"type": "keyword"},
+            "uploaded_at": {"type": "date"},
+            # ページング（search_after）の安定した同順位解決用
+            "doc_id": {"type": "keyword"},
+            # 以下はレスポンス生成用（検索対象外）
+            "s3_key": {"type": "keyword", "index": False},
+            "file_name": {"type": "keyword"},
+            "description": {"type": "text", "index": False},
+            "extracted_metadata": {"type": "object", "enabled": False}
+        }
+
+    def _build_index_mapping(self) -> Dict:
+        """インデックスのマッピング定義"""
+        return {
             "settings": {
                 "analysis": {
                     "analyzer": {
@@ -33,45 +271,67 @@ class MinimalOpenSearchService:
                 }
             },
             "mappings": {
-                "properties": {
-                    "title": {
-                        "type": "text",
-                        "analyzer": "japanese_text",
-                        "fields": {
-                            "keyword": {"type": "keyword"}
-                        }
-                    },
-                    "content": {
-                        "type": "text", 
-                        "analyzer": "japanese_text"
-                    },
-                    "user_id": {"type": "keyword"},
-                    "file_type": {"type": "keyword"},
-                    "uploaded_at": {"type": "date"}
-                }
+                "properties": self._build_index_properties()
             }
         }
-        
-        try:
-            response = requests.put(
-                f"{self.endpoint}/{self.index_name}",
-                json=mapping,
-                headers={"Content-Type": "application/json"},
-                auth=self.auth,
-                verify=self.verify_ssl,
-                timeout=10
-            )
-            print(f"インデックス作成結果: {response.status_code}")
-            return response.json()
-        except Exception as e:
-            print(f"インデックス作成エラー: {e}")
-            return {"error": str(e)}
 
-    def index_document(self, doc_id: str, title: str, content: str, 
-                      user_id: str, file_type: str = "unknown", uploaded_at: str = None) -> Dict:
-        """ドキュメント登録"""
-        from datetime import datetime
-        
+    def _build_passage_properties(self) -> Dict:
+        """
+        パッセージのフィールド定義
+        検索対象はパッセージ本文とタイトルのみ。ドキュメント単位の結果を作るための項目を親ドキュメントから複製して持つ
+        """
+        return {
+            "text": {"type": "text", "analyzer": "japanese_text"},
+            "title": {"type": "text", "analyzer": "japanese_text"},
+            "parent_id": {"type": "keyword"},
+            "ordinal": {"type": "integer"},
+            "user_id": {"type": "keyword"},
+            "file_type": {"type": "keyword"},
+            "language": {"type": "keyword"},
+            "uploaded_at": {"type": "date"},
+            # 以下はレスポンス生成用（検索対象外）
+            "start": {"type": "integer", "index": False},
+            "s3_key": {"type": "keyword", "index": False},
+            "file_name": {"type": "keyword", "index": False}
+        }
+
+    def _build_passage_mapping(self) -> Dict:
+        """パッセージインデックスのマッピング定義（アナライザーはドキュメントのインデックスと同じ）"""
+        mapping = self._build_index_mapping()
+        mapping["mappings"] = {"properties": self._build_passage_properties()}
+        return mapping
+
+    def _build_passage_documents(self, item: Dict[str, Any]) -> List[Tuple[str, Dict]]:
+        """
+        DynamoDBアイテムの本文からパッセージの登録用ドキュメントを作成
+
+        パッセージIDは「{ドキュメントID}:{連番}」（同じ本文なら再登録しても同じIDになる）。
+        取り込み中・取り込みに失敗したドキュメントはパッセージを持たない
+        """
+        if not is_ready_item(item):
+            return []
+        content = extract_content_section(item.get("formatted_text", ""))
+        parent = {
+            "parent_id": item["id"],
+            "title": item.get("title", ""),
+            "user_id": item.get("user_id", "anonymous"),
+            "file_type": item.get("file_type", "unknown"),
+            "language": item.get("language"),
+            "uploaded_at": item.get("uploaded_at") or datetime.utcnow().isoformat(),
+            "s3_key": item.get("s3_key"),
+            "file_name": item.get("file_name")
+        }
+        parent = {key: value for key, value in parent.items() if value is not None}
+        return [
+            (f"{item['id']}:{passage['ordinal']}", {**parent, **passage})
+            for passage in split_passages(content, PASSAGE_CHARS, PASSAGE_OVERLAP, PASSAGE_MAX_PER_DOCUMENT)
+        ]
+
+    def _build_document(self, title: str, content: str, user_id: str,
+                        file_type: str = "unknown", uploaded_at: str = None,
+                        s3_key: str = None, file_name: str = None, description: str = None,
+                        extracted_metadata: Dict[str, Any] = None, language: str = None) -> Dict:
+        """登録用ドキュメントを作成"""
         doc = {
             "title": title,
             "content": content,
@@ -79,24 +339,38 @@ class MinimalOpenSearchService:
             "file_type": file_type,
             "uploaded_at": uploaded_at or datetime.utcnow().isoformat()
         }
-        
-        try:
-            response = requests.put(
-                f"{self.endpoint}/{self.index_name}/_doc/{doc_id}",
-                json=doc,
-                headers={"Content-Type": "application/json"},
-                auth=self.auth,
-                verify=self.verify_ssl,
-                timeout=10
-            )
-            print(f"ドキュメント登録: {doc_id} -> {response.status_code}")
-            return response.json()
-        except Exception as e:
-            print(f"ドキュメント登録エラー: {e}")
-            return {"error": str(e)}
 
-    def search_documents(self, query: str, user_id: str = None, size: int = 10) -> Dict:
-        """シンプル検索"""
+        # レスポンス生成用フィールド（指定されたもののみ保持）
+        optional_fields = {
+            "s3_key": s3_key,
+            "file_name": file_name,
+            "description": description,
+            "extracted_metadata": extracted_metadata,
+            "language": language
+        }
+        doc.update({key: value for key, value in optional_fields.items() if value is not None})
+        return doc
+
+    def _build_document_from_item(self, item: Dict[str, Any]) -> Dict:
+        """DynamoDBアイテムから登録用ドキュメントを作成"""
+        return self._build_document(
+            title=item.get("title", ""),
+            content=item.get("formatted_text", ""),
+            user_id=item.get("user_id", "anonymous"),
+            file_type=item.get("file_type", "unknown"),
+            uploaded_at=item.get("uploaded_at"),
+            s3_key=item.get("s3_key"),
+            file_name=item.get("file_name"),
+            description=item.get("description", ""),
+            extracted_metadata=item.get("extracted_metadata", {}),
+            language=item.get("language")
+        )
+
+    def _build_search_body(self, query: str, user_id: str = None, size: int = 10,
+                           include_content: bool = True, search_after: List[Any] = None,
+                           pit_id: str = None, keep_alive: str = "5m", language: str = None,
+                           tier: str = TIER_FUZZY) -> Dict:
+        """検索クエリを作成（tierで使うshould句を選ぶ。既定は全4句）"""
         search_body = {
             "query": {
                 "bool": {
@@ -150,61 +424,855 @@ class MinimalOpenSearchService:
                 }
             },
             "min_score": 0.2,  # 最小スコア閾値（typo許容のため少し下げる）
+            # スコア順＋doc_idで同順位を解決し、search_afterによるページングを安定させる
+            "sort": [
+                {"_score": {"order": "desc"}}
+            ],
             "size": size
         }
-        
-        # ユーザーフィルター追加
+        if self.sort_tiebreak_field:
+            # doc_idのマッピングがまだないインデックスでもエラーにしない
+            search_body["sort"].append({
+                self.sort_tiebreak_field: {"order": "asc", "missing": "_last", "unmapped_type": "keyword"}
+            })
+
+        should = search_body["query"]["bool"]["should"]
+        search_body["query"]["bool"]["should"] = should[:_TIER_CLAUSE_COUNTS[tier]]
+
+        # 前ページの最後のソート値から続きを取得
+        if search_after:
+            search_body["search_after"] = search_after
+
+        # Point-in-Time指定時はインデックス名ではなくPITで検索対象を固定
+        if pit_id:
+            search_body["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+
+        # 本文が不要な場合は_sourceから除外してレスポンスを軽くする（ハイライトは本文から生成される）
+        if not include_content:
+            search_body["_source"] = {"excludes": ["content"]}
+
+        # ユーザー・言語フィルター追加（スコアに影響しないfilter句でエンジン側で絞り込む）
+        filters = []
         if user_id:
-            search_body["query"]["bool"]["filter"] = [
+            filters.append({"term": {"user_id": user_id}})
+        if language:
+            filters.append({"term": {"language": language}})
+        if filters:
+            search_body["query"]["bool"]["filter"] = filters
+
+        return search_body
+
+    def _build_passage_search_body(self, query: str, user_id: str = None, size: int = 10,
+                                   passages_per_document: int = 3, offset: int = 0,
+                                   language: str = None) -> Dict:
+        """
+        パッセージ検索クエリを作成
+
+        親ドキュメントIDでcollapseし、ドキュメントごとに上位パッセージをinner_hitsで返す。
+        レスポンスに含まれる本文はパッセージ分だけなので、大きさはドキュメントの長さによらない
+        """
+        search_body = {
+            "query": {
+                "bool": {
+                    "should": [
+                        # 完全一致（高スコア）
+                        {
+                            "multi_match": {
+                                "query": query,
+                                "fields": ["text^2", "title"],
+                                "type": "phrase",
+                                "boost": 3.0
+                            }
+                        },
+                        # 部分一致（中スコア）
+                        {
+                            "multi_match": {
+                                "query": query,
+                                "fields": ["text", "title"],
+                                "operator": "and",
+                                "minimum_should_match": "75%"
+                            }
+                        },
+                        # 単語レベル一致（低スコア）
+                        {
+                            "multi_match": {
+                                "query": query,
+                                "fields": ["text", "title"],
+                                "operator": "or",
+                                "minimum_should_match": "50%",
+                                "boost": 0.5
+                            }
+                        }
+                    ],
+                    "minimum_should_match": 1
+                }
+            },
+            "collapse": {
+                "field": "parent_id",
+                "inner_hits": {
+                    "name": "passages",
+                    "size": passages_per_document,
+                    "_source": ["ordinal", "start", "text"]
+                }
+            },
+            # ドキュメント単位の項目だけを返す（パッセージ本文はinner_hitsで返す）
+            "_source": {"excludes": ["text"]},
+            "min_score": 0.2,
+            "track_total_hits": False,
+            "from": offset,
+            "size": size
+        }
+
+        filters = []
+        if user_id:
+            filters.append({"term": {"user_id": user_id}})
+        if language:
+            filters.append({"term": {"language": language}})
+        if filters:
+            search_body["query"]["bool"]["filter"] = filters
+
+        return search_body
+
+    # ==================== 同期API（スクリプト用） ====================
+
+    def _build_suggest_body(self, prefix: str, user_id: str = None, size: int = 5) -> Dict:
+        """入力補完クエリを作成（titleのsearch_as_you_typeサブフィールドのみを対象とし、IDとタイトルだけを返す）"""
+        suggest_body = {
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "multi_match": {
+                                "query": prefix,
+                                "type": "bool_prefix",
+                                "fields": ["title.suggest", "title.suggest._2gram", "title.suggest._3gram"]
+                            }
+                        }
+                    ]
+                }
+            },
+            "_source": ["title", "user_id"],
+            "track_total_hits": False,
+            "size": size
+        }
+
+        if user_id:
+            suggest_body["query"]["bool"]["filter"] = [
                 {"term": {"user_id": user_id}}
             ]
-        
+
+        return suggest_body
+
+    def create_index(self, timeout: Optional[float] = None) -> Dict:
+        """超シンプルなインデックス作成"""
         try:
-            response = requests.post(
-                f"{self.endpoint}/{self.index_name}/_search",
-                json=search_body,
-                headers={"Content-Type": "application/json"},
-                auth=self.auth,
-                verify=self.verify_ssl,
-                timeout=10
-            )
+            response = self._request("PUT", f"/{self.index_name}", self._build_index_mapping(), timeout)
+            print(f"インデックス作成結果: {response.status_code}")
+            return response.json()
+        except Exception as e:
+            print(f"インデックス作成エラー: {e}")
+            return {"error": str(e)}
+
+    def update_mapping(self, timeout: Optional[float] = None) -> Dict:
+        """既存インデックスに不足しているフィールド定義を追加（既存の定義と衝突するフィールドは変更しない）"""
+        try:
+            current = self._request("GET", f"/{self.index_name}/_mapping", timeout=timeout)
+            if current.status_code != 200:
+                return current.json()
+            properties = self._plan_mapping_update(current.json())
+            if not properties:
+                return {"acknowledged": True}
+            response = self._request("PUT", f"/{self.index_name}/_mapping", {"properties": properties}, timeout)
+            print(f"マッピング更新結果: {response.status_code}")
+            return response.json()
+        except Exception as e:
+            print(f"マッピング更新エラー: {e}")
+            return {"error": str(e)}
+
+    def _plan_mapping_update(self, current_mapping: Dict[str, Any]) -> Dict:
+        """
+        既存のマッピングに追加するフィールド定義を選び、同順位解決に使うフィールドを決める
+
+        動的マッピングで別の型として登録済みのフィールドは型を変更できない（put-mapping全体が失敗する）ため、
+        衝突するフィールドは除いてログに残す
+
+        Parameters:
+        -----------
+        current_mapping : Dict[str, Any]
+            GET /{index}/_mappingのレスポンス
+
+        Returns:
+        --------
+        Dict
+            put-mappingで送るフィールド定義（追加・更新するものがなければ空）
+        """
+        mappings = next(iter(current_mapping.values()), {}).get("mappings", {})
+        existing = mappings.get("properties", {})
+        properties = {}
+        for name, definition in self._build_index_properties().items():
+            if name in existing and _mapping_conflicts(existing[name], definition):
+                print(f"マッピング更新: {name} は既存の定義と異なるため変更しません（{existing[name]}）")
+                continue
+            properties[name] = definition
+        self.sort_tiebreak_field = _sort_tiebreak_field(existing.get("doc_id"))
+        if self.sort_tiebreak_field is None:
+            print("doc_idがソートできない型で登録済みのため、検索結果の同順位はスコアのみで並べます")
+        return properties
+
+    def index_document(self, doc_id: str, title: str, content: str,
+                      user_id: str, file_type: str = "unknown", uploaded_at: str = None,
+                      s3_key: str = None, file_name: str = None, description: str = None,
+                      extracted_metadata: Dict[str, Any] = None, language: str = None,
+                      timeout: Optional[float] = None) -> Dict:
+        """ドキュメント登録"""
+        doc = self._build_document(title, content, user_id, file_type, uploaded_at,
+                                   s3_key, file_name, description, extracted_metadata, language)
+        return self._put_document(doc_id, doc, timeout)
+
+    def index_item(self, item: Dict[str, Any], timeout: Optional[float] = None) -> Dict:
+        """DynamoDBアイテムをそのままドキュメント登録（レスポンス生成用フィールド込み）"""
+        return self._put_document(item["id"], self._build_document_from_item(item), timeout)
+
+    def _put_document(self, doc_id: str, doc: Dict, timeout: Optional[float] = None) -> Dict:
+        """ドキュメントを登録（上書き）"""
+        try:
+            response = self._request("PUT", f"/{self.index_name}/_doc/{doc_id}", {**doc, "doc_id": doc_id}, timeout)
+            print(f"ドキュメント登録: {doc_id} -> {response.status_code}")
+            return response.json()
+        except Exception as e:
+            print(f"ドキュメント登録エラー: {e}")
+            return {"error": str(e)}
+
+    def search_documents(self, query: str, user_id: str = None, size: int = 10,
+                         timeout: Optional[float] = None, include_content: bool = True,
+                         language: str = None) -> Dict:
+        """シンプル検索"""
+        search_body = self._build_search_body(query, user_id, size, include_content, language=language)
+
+        try:
+            response = self._request("POST", f"/{self.index_name}/_search", search_body, timeout)
             print(f"検索実行: '{query}' -> {response.status_code}")
             return response.json()
         except Exception as e:
             print(f"検索エラー: {e}")
             return {"error": str(e)}
 
-    def search(self, query: str, user_id: str = None, size: int = 10) -> Dict:
+    def search(self, query: str, user_id: str = None, size: int = 10,
+               timeout: Optional[float] = None, include_content: bool = True,
+               language: str = None) -> Dict:
         """search_documentsのエイリアス（互換性のため）"""
-        return self.search_documents(query, user_id, size)
+        return self.search_documents(query, user_id, size, timeout, include_content, language)
+
+    def search_raw(self, search_body: Dict[str, Any], timeout: Optional[float] = None) -> Dict:
+        """任意の検索ボディで検索（デバッグ用）"""
+        try:
+            response = self._request("POST", f"/{self.index_name}/_search", search_body, timeout)
+            return response.json()
+        except Exception as e:
+            print(f"検索エラー: {e}")
+            return {"error": str(e)}
 
-    def delete_document(self, doc_id: str) -> Dict:
+    def delete_document(self, doc_id: str, timeout: Optional[float] = None) -> Dict:
         """ドキュメント削除"""
         try:
-            response = requests.delete(
-                f"{self.endpoint}/{self.index_name}/_doc/{doc_id}",
-                auth=self.auth,
-                verify=self.verify_ssl,
-                timeout=10
-            )
+            response = self._request("DELETE", f"/{self.index_name}/_doc/{doc_id}", timeout=timeout)
             return response.json()
         except Exception as e:
             print(f"ドキュメント削除エラー: {e}")
             return {"error": str(e)}
 
-    def health_check(self) -> bool:
+    def health_check(self, timeout: Optional[float] = None) -> bool:
         """ヘルスチェック"""
         try:
-            response = requests.get(
-                f"{self.endpoint}/_cluster/health", 
-                auth=self.auth,
-                verify=self.verify_ssl,
-                timeout=5
+            response = self._request("GET", "/_cluster/health", timeout=timeout or OPENSEARCH_HEALTH_TIMEOUT,
+                                     track_health=False)
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    # ==================== 非同期API（FastAPI用） ====================
+
+    async def create_index_async(self, timeout: Optional[float] = None) -> Dict:
+        """インデックス作成（非同期版）"""
+        try:
+            response = await self._request_async("PUT", f"/{self.index_name}", self._build_index_mapping(), timeout)
+            print(f"インデックス作成結果: {response.status_code}")
+            return response.json()
+        except Exception as e:
+            print(f"インデックス作成エラー: {e}")
+            return {"error": str(e)}
+
+    async def update_mapping_async(self, timeout: Optional[float] = None) -> Dict:
+        """既存インデックスに不足しているフィールド定義を追加（非同期版）"""
+        try:
+            current = await self._request_async("GET", f"/{self.index_name}/_mapping", timeout=timeout)
+            if current.status_code != 200:
+                return current.json()
+            properties = self._plan_mapping_update(current.json())
+            if not properties:
+                return {"acknowledged": True}
+            response = await self._request_async("PUT", f"/{self.index_name}/_mapping",
+                                                 {"properties": properties}, timeout)
+            print(f"マッピング更新結果: {response.status_code}")
+            return response.json()
+        except Exception as e:
+            print(f"マッピング更新エラー: {e}")
+            return {"error": str(e)}
+
+    async def index_document_async(self, doc_id: str, title: str, content: str,
+                                   user_id: str, file_type: str = "unknown", uploaded_at: str = None,
+                                   s3_key: str = None, file_name: str = None, description: str = None,
+                                   extracted_metadata: Dict[str, Any] = None, language: str = None,
+                                   timeout: Optional[float] = None) -> Dict:
+        """ドキュメント登録（非同期版）"""
+        doc = self._build_document(title, content, user_id, file_type, uploaded_at,
+                                   s3_key, file_name, description, extracted_metadata, language)
+        return await self._put_document_async(doc_id, doc, timeout)
+
+    async def index_item_async(self, item: Dict[str, Any], timeout: Optional[float] = None,
+                               refresh: Optional[str] = None) -> Dict:
+        """
+        DynamoDBアイテムをそのままドキュメント登録（非同期版）
+
+        refresh="wait_for"を指定すると、登録内容が検索できるようになるまで待ってから返す
+        """
+        return await self._put_document_async(item["id"], self._build_document_from_item(item), timeout, refresh)
+
+    async def _put_document_async(self, doc_id: str, doc: Dict, timeout: Optional[float] = None,
+                                  refresh: Optional[str] = None) -> Dict:
+        """ドキュメントを登録（上書き・非同期版）"""
+        # OpenSearchへの登録が失敗してもローカルインデックスには反映する
+        self._mirror_to_local_index(doc_id, doc)
+        try:
+            response = await self._request_async("PUT", _with_refresh(f"/{self.index_name}/_doc/{doc_id}", refresh),
+                                                 {**doc, "doc_id": doc_id}, timeout)
+            print(f"ドキュメント登録: {doc_id} -> {response.status_code}")
+            return response.json()
+        except Exception as e:
+            print(f"ドキュメント登録エラー: {e}")
+            return {"error": str(e)}
+
+    async def bulk_index_async(self, docs: List[Tuple[str, Dict]],
+                               timeout: Optional[float] = None,
+                               index_name: Optional[str] = None,
+                               refresh: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        複数ドキュメントを_bulkの1リクエストで登録（非同期版・データ移行用）
+
+        Parameters:
+        -----------
+        docs : List[Tuple[str, Dict]]
+            (ドキュメントID, 登録用ドキュメント) のリスト
+        index_name : Optional[str]
+            登録先のインデックス（省略時はドキュメントのインデックス。ローカルインデックスにはこの場合のみ反映する）
+        refresh : Optional[str]
+            "wait_for"を指定すると、登録内容が検索できるようになるまで待ってから返す
+
+        Returns:
+        --------
+        List[Dict[str, Any]]
+            ドキュメントごとの結果 {"id", "status", "error"}（入力と同じ順序、成功時のerrorはNone）。
+            リクエスト自体が失敗した場合は全件がstatus 0のエラーになる
+        """
+        index_name = index_name or self.index_name
+        lines: List[Dict] = []
+        for doc_id, doc in docs:
+            lines.append({"index": {"_index": index_name, "_id": doc_id}})
+            lines.append({**doc, "doc_id": doc_id})
+
+        try:
+            response = await self._request_async("POST", _with_refresh("/_bulk", refresh), timeout=timeout, ndjson=lines)
+            print(f"一括登録実行: {len(docs)}件 -> {response.status_code}")
+            if response.status_code >= 400:
+                raise ValueError(f"HTTP {response.status_code}: {response.text[:200]}")
+            items = response.json().get("items", [])
+            if len(items) != len(docs):
+                raise ValueError(f"_bulkの応答件数が一致しません: {len(items)} / {len(docs)}")
+        except Exception as e:
+            print(f"一括登録エラー: {e}")
+            return [{"id": doc_id, "status": 0, "error": str(e)} for doc_id, _ in docs]
+
+        results = []
+        for (doc_id, doc), item in zip(docs, items):
+            result = next(iter(item.values()), {})
+            status = result.get("status", 0)
+            error = result.get("error") or (f"HTTP {status}" if status >= 300 else None)
+            if error is None and index_name == self.index_name:
+                self._mirror_to_local_index(doc_id, doc)
+            results.append({"id": doc_id, "status": status, "error": error})
+        return results
+
+    async def create_passage_index_async(self, timeout: Optional[float] = None) -> Dict:
+        """パッセージインデックス作成（既存の場合は不足しているフィールド定義のみ追加）"""
+        try:
+            response = await self._request_async("PUT", f"/{self.passage_index_name}",
+                                                 self._build_passage_mapping(), timeout)
+            result = response.json()
+            error = result.get("error")
+            if isinstance(error, dict) and error.get("type") == "resource_already_exists_exception":
+                response = await self._request_async("PUT", f"/{self.passage_index_name}/_mapping",
+                                                     {"properties": self._build_passage_properties()}, timeout)
+                result = response.json()
+            print(f"パッセージインデックス作成結果: {response.status_code}")
+            return result
+        except Exception as e:
+            print(f"パッセージインデックス作成エラー: {e}")
+            return {"error": str(e)}
+
+    async def index_passages_async(self, items: List[Dict[str, Any]],
+                                   timeout: Optional[float] = None,
+                                   refresh: Optional[str] = None) -> Dict[str, Any]:
+        """
+        ドキュメントの本文をパッセージに分けて登録（非同期版）
+
+        同じIDのパッセージは上書きし、本文が短くなって不要になった後ろのパッセージは
+        全ドキュメント分をまとめて1回の_delete_by_queryで削除する
+
+        Parameters:
+        -----------
+        items : List[Dict[str, Any]]
+            本文（formatted_text）を含むDynamoDBアイテムのリスト
+        refresh : Optional[str]
+            "wait_for"を指定すると、登録したパッセージが検索できるようになるまで待ってから返す
+
+        Returns:
+        --------
+        Dict[str, Any]
+            {"documents": 対象ドキュメント数, "passages": 登録したパッセージ数, "failed": 失敗したパッセージ数}
+        """
+        stats = {"documents": len(items), "passages": 0, "failed": 0}
+        if not self.passages_enabled or not items:
+            return stats
+
+        docs: List[Tuple[str, Dict]] = []
+        counts: Dict[str, int] = {}
+        for item in items:
+            passages = self._build_passage_documents(item)
+            counts[item["id"]] = len(passages)
+            docs.extend(passages)
+
+        for start in range(0, len(docs), PASSAGE_BULK_DOCS):
+            results = await self.bulk_index_async(docs[start:start + PASSAGE_BULK_DOCS], timeout,
+                                                  index_name=self.passage_index_name, refresh=refresh)
+            for result in results:
+                if result["error"] is None:
+                    stats["passages"] += 1
+                else:
+                    stats["failed"] += 1
+
+        stale_query = {
+            "bool": {
+                "should": [
+                    {"bool": {"filter": [
+                        {"term": {"parent_id": doc_id}},
+                        {"range": {"ordinal": {"gte": count}}}
+                    ]}}
+                    for doc_id, count in counts.items()
+                ],
+                "minimum_should_match": 1
+            }
+        }
+        await self._delete_passages_by_query_async(stale_query, timeout, refresh=bool(refresh))
+        return stats
+
+    async def delete_passages_async(self, doc_id: str, timeout: Optional[float] = None,
+                                    refresh: bool = False) -> Dict:
+        """ドキュメントのパッセージをすべて削除（非同期版。refreshなら削除後にリフレッシュして検索に反映する）"""
+        if not self.passages_enabled:
+            return {}
+        return await self._delete_passages_by_query_async({"term": {"parent_id": doc_id}}, timeout, refresh)
+
+    async def _delete_passages_by_query_async(self, query: Dict, timeout: Optional[float] = None,
+                                              refresh: bool = False) -> Dict:
+        """条件に一致するパッセージを_delete_by_queryで削除"""
+        try:
+            response = await self._request_async(
+                "POST", f"/{self.passage_index_name}/_delete_by_query?conflicts=proceed"
+                        f"{'&refresh=true' if refresh else ''}",
+                {"query": query}, timeout
+            )
+            return response.json()
+        except Exception as e:
+            print(f"パッセージ削除エラー: {e}")
+            return {"error": str(e)}
+
+    async def get_refresh_interval_async(self, timeout: Optional[float] = None) -> Optional[str]:
+        """インデックスのrefresh_intervalを取得（未設定ならNone）"""
+        response = await self._request_async(
+            "GET", f"/{self.index_name}/_settings/index.refresh_interval", timeout=timeout
+        )
+        settings = response.json().get(self.index_name, {}).get("settings", {})
+        return settings.get("index", {}).get("refresh_interval")
+
+    async def set_refresh_interval_async(self, interval: Optional[str],
+                                         timeout: Optional[float] = None) -> Dict:
+        """インデックスのrefresh_intervalを変更（Noneで既定値に戻す）"""
+        response = await self._request_async(
+            "PUT", f"/{self.index_name}/_settings", {"index": {"refresh_interval": interval}}, timeout
+        )
+        print(f"refresh_interval変更: {interval} -> {response.status_code}")
+        return response.json()
+
+    async def refresh_async(self, timeout: Optional[float] = None, index_name: Optional[str] = None) -> Dict:
+        """インデックスをリフレッシュ（登録内容を検索可能にする。index_name省略時はドキュメントのインデックス）"""
+        response = await self._request_async("POST", f"/{index_name or self.index_name}/_refresh", timeout=timeout)
+        return response.json()
+
+    async def search_documents_async(self, query: str, user_id: str = None, size: int = 10,
+                                     timeout: Optional[float] = None, include_content: bool = True,
+                                     search_after: List[Any] = None, pit_id: str = None,
+                                     keep_alive: str = "5m", language: str = None,
+                                     tier: str = None) -> Dict:
+        """
+        シンプル検索（非同期版）
+
+        search_afterに前ページ最後のヒットのsortを渡すと続きのページを取得する。
+        pit_idを指定するとPoint-in-Timeのスナップショットに対して検索する。
+        languageを指定するとその言語のドキュメントのみを検索する。
+        tierを省略すると段階的に検索し、応答した段をレスポンスのquery_tierに記録する
+        """
+        search = {
+            "query": query, "user_id": user_id, "size": size, "include_content": include_content,
+            "search_after": search_after, "pit_id": pit_id, "keep_alive": keep_alive,
+            "language": language, "tier": tier
+        }
+        stage, fixed = self._plan_tier(search)
+        # PIT検索はインデックス名を付けずに実行する
+        path = "/_search" if pit_id else f"/{self.index_name}/_search"
+
+        while True:
+            search_body = self._build_search_body(**{**search, "tier": QUERY_TIERS[stage]})
+            try:
+                response = await self._request_async("POST", path, search_body, timeout)
+                print(f"検索実行: '{query}' [{QUERY_TIERS[stage]}] -> {response.status_code}")
+                result = response.json()
+            except Exception as e:
+                print(f"検索エラー: {e}")
+                return {"error": str(e)}
+
+            if self._should_escalate(result, stage, fixed):
+                stage += 1
+                continue
+            return self._record_tier(result, stage)
+
+    async def search_async(self, query: str, user_id: str = None, size: int = 10,
+                           timeout: Optional[float] = None, include_content: bool = True,
+                           search_after: List[Any] = None, pit_id: str = None,
+                           keep_alive: str = "5m", language: str = None, tier: str = None) -> Dict:
+        """search_documents_asyncのエイリアス（互換性のため）"""
+        return await self.search_documents_async(query, user_id, size, timeout, include_content,
+                                                 search_after, pit_id, keep_alive, language, tier)
+
+    async def msearch_async(self, searches: List[Dict[str, Any]],
+                            timeout: Optional[float] = None) -> List[Dict]:
+        """
+        複数の検索を_msearchでまとめて実行（非同期版）
+
+        段階的検索では、ヒットが足りなかった検索だけを次の段で再度_msearchにまとめる
+
+        Parameters:
+        -----------
+        searches : List[Dict[str, Any]]
+            search_documents_asyncと同じ引数（query, user_id, size, include_content,
+            search_after, pit_id, keep_alive, language, tier）の辞書のリスト
+
+        Returns:
+        --------
+        List[Dict]
+            検索ごとのレスポンス（入力と同じ順序）。失敗した検索は{"error": ...}
+        """
+        results: List[Optional[Dict]] = [None] * len(searches)
+        plans = [self._plan_tier(search) for search in searches]
+        stages = [stage for stage, _ in plans]
+        pending = list(range(len(searches)))
+
+        while pending:
+            responses = await self._msearch_once(
+                [{**searches[i], "tier": QUERY_TIERS[stages[i]]} for i in pending], timeout
+            )
+            next_pending = []
+            for i, result in zip(pending, responses):
+                if self._should_escalate(result, stages[i], plans[i][1]):
+                    stages[i] += 1
+                    next_pending.append(i)
+                else:
+                    results[i] = self._record_tier(result, stages[i])
+            pending = next_pending
+
+        return results
+
+    async def _msearch_once(self, searches: List[Dict[str, Any]],
+                            timeout: Optional[float] = None) -> List[Dict]:
+        """_msearchの1リクエストを送信"""
+        lines: List[Dict] = []
+        for search in searches:
+            # PIT検索はヘッダーでインデックスを指定しない
+            lines.append({} if search.get("pit_id") else {"index": self.index_name})
+            lines.append(self._build_search_body(**search))
+
+        try:
+            response = await self._request_async("POST", "/_msearch", timeout=timeout, ndjson=lines)
+            print(f"一括検索実行: {len(searches)}件 -> {response.status_code}")
+            responses = response.json().get("responses")
+            if responses is None or len(responses) != len(searches):
+                raise ValueError(f"_msearchの応答が不正です: {response.text[:200]}")
+            return responses
+        except Exception as e:
+            print(f"一括検索エラー: {e}")
+            return [{"error": str(e)} for _ in searches]
+
+    def _plan_tier(self, search: Dict[str, Any]) -> Tuple[int, bool]:
+        """
+        検索を開始する段と、段を固定するかどうかを決める
+
+        カーソルの続きは前ページと同じ段で検索する（段が変わるとスコアが変わりページがずれるため）。
+        段の記録がない続きのページや、段階的検索が無効な場合は全4句で検索する
+        """
+        tier = search.get("tier")
+        if tier in QUERY_TIERS:
+            return QUERY_TIERS.index(tier), True
+        if not self.tiered_query or search.get("search_after"):
+            return QUERY_TIERS.index(TIER_FUZZY), True
+        return 0, False
+
+    def _should_escalate(self, result: Dict, stage: int, fixed: bool) -> bool:
+        """
+        min_scoreを超えたヒットがtier_min_hitsに満たず、次の段があれば広げる
+
+        ページサイズは見ない（完全一致が数件しかない正確な検索語は、そのヒットだけを返す）
+        """
+        if fixed or stage >= len(QUERY_TIERS) - 1:
+            return False
+        if "error" in result or "hits" not in result:
+            return False
+        return len(result["hits"]["hits"]) < self.tier_min_hits
+
+    def _record_tier(self, result: Dict, stage: int) -> Dict:
+        """応答した段をレスポンスに記録して集計する"""
+        if "error" not in result and "hits" in result:
+            tier = QUERY_TIERS[stage]
+            result["query_tier"] = tier
+            self._tier_counts[tier] += 1
+        return result
+
+    def query_tier_stats(self) -> Dict[str, Any]:
+        """どの段で応答したかの集計を返す"""
+        total = sum(self._tier_counts.values())
+        return {
+            "enabled": self.tiered_query,
+            "answered_by_tier": dict(self._tier_counts),
+            "first_tier_ratio": round(self._tier_counts[TIER_PHRASE_AND] / total, 4) if total else 0.0
+        }
+
+    async def search_passages_async(self, query: str, user_id: str = None, size: int = 10,
+                                    passages_per_document: int = 3, offset: int = 0,
+                                    language: str = None, timeout: Optional[float] = None) -> Dict:
+        """
+        パッセージ検索（非同期版）
+
+        ドキュメントごとにまとめたヒット（inner_hitsに上位パッセージ）を返す。offsetでドキュメント単位のページを指定する
+        """
+        search_body = self._build_passage_search_body(query, user_id, size, passages_per_document, offset, language)
+        try:
+            response = await self._request_async("POST", f"/{self.passage_index_name}/_search", search_body, timeout)
+            print(f"パッセージ検索実行: '{query}' -> {response.status_code}")
+            return response.json()
+        except Exception as e:
+            print(f"パッセージ検索エラー: {e}")
+            return {"error": str(e)}
+
+    async def suggest_async(self, prefix: str, user_id: str = None, size: int = 5,
+                            timeout: Optional[float] = None) -> Dict:
+        """タイトルの入力補完（非同期版）"""
+        suggest_body = self._build_suggest_body(prefix, user_id, size)
+
+        try:
+            response = await self._request_async("POST", f"/{self.index_name}/_search", suggest_body, timeout)
+            return response.json()
+        except Exception as e:
+            print(f"入力補完エラー: {e}")
+            return {"error": str(e)}
+
+    async def open_point_in_time_async(self, keep_alive: str = "5m",
+                                       timeout: Optional[float] = None) -> Optional[str]:
+        """Point-in-Timeを作成してIDを返す（失敗時はNone）"""
+        try:
+            response = await self._request_async(
+                "POST", f"/{self.index_name}/_search/point_in_time?keep_alive={keep_alive}", timeout=timeout
             )
+            return response.json().get("pit_id")
+        except Exception as e:
+            print(f"Point-in-Time作成エラー: {e}")
+            return None
+
+    async def close_point_in_time_async(self, pit_id: str, timeout: Optional[float] = None) -> bool:
+        """Point-in-Timeを削除（最後のページを返した後・検索に失敗した場合。失敗してもkeep_aliveで期限切れになる）"""
+        try:
+            response = await self._request_async("DELETE", "/_search/point_in_time", {"pit_id": [pit_id]}, timeout)
             return response.status_code == 200
-        except:
+        except Exception as e:
+            print(f"Point-in-Time削除エラー: {e}")
             return False
 
+    async def search_raw_async(self, search_body: Dict[str, Any], timeout: Optional[float] = None) -> Dict:
+        """任意の検索ボディで検索（非同期版・デバッグ用）"""
+        try:
+            response = await self._request_async("POST", f"/{self.index_name}/_search", search_body, timeout)
+            return response.json()
+        except Exception as e:
+            print(f"検索エラー: {e}")
+            return {"error": str(e)}
+
+    async def delete_document_async(self, doc_id: str, timeout: Optional[float] = None,
+                                    refresh: Optional[str] = None) -> Dict:
+        """ドキュメント削除（非同期版。refresh="wait_for"なら削除が検索に反映されるまで待つ）"""
+        self._mirror_to_local_index(doc_id, None)
+        try:
+            response = await self._request_async("DELETE", _with_refresh(f"/{self.index_name}/_doc/{doc_id}", refresh),
+                                                 timeout=timeout)
+            return response.json()
+        except Exception as e:
+            print(f"ドキュメント削除エラー: {e}")
+            return {"error": str(e)}
+
+    def _mirror_to_local_index(self, doc_id: str, doc: Optional[Dict]) -> None:
+        """ローカルインデックスへ登録・削除を反映（docがNoneなら削除、エラーは無視）"""
+        try:
+            if doc is None:
+                self.local_index.delete_document(doc_id)
+            else:
+                self.local_index.add_document(doc_id, doc)
+        except Exception as e:
+            print(f"ローカルインデックス更新エラー（無視して処理継続）: {e}")
+
+    def rebuild_local_index(self, items: Iterable[Dict[str, Any]]) -> int:
+        """DynamoDBアイテムからローカルインデックスを再構築（OpenSearchと同じドキュメントを登録、取り込み中のものは除く）"""
+        return self.local_index.rebuild(
+            (item["id"], self._build_document_from_item(item)) for item in items if is_ready_item(item)
+        )
+
+    async def health_check_async(self, timeout: Optional[float] = None) -> bool:
+        """ヘルスチェック（非同期版）"""
+        try:
+            response = await self._request_async("GET", "/_cluster/health", timeout=timeout or OPENSEARCH_HEALTH_TIMEOUT,
+                                                 track_health=False)
+            return response.status_code == 200
+        except Exception:
+            return False
+
+
+    # ==================== 検索結果の変換 ====================
+
+    def record_from_hit(self, hit: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        検索ヒットの_sourceからレスポンス用レコードを作成する
+
+        拡張マッピング導入前に登録されたドキュメント（s3_key等を持たない）の場合は
+        Noneを返すので、呼び出し側でDynamoDBから補完すること
+        """
+        source = hit.get("_source", {})
+        if "s3_key" not in source or "file_name" not in source:
+            return None
+
+        if "content" in source:
+            formatted_text = source["content"]
+        else:
+            # 本文を除外した検索ではハイライト断片をスニペットとして返す
+            formatted_text = self.snippet_from_hit(hit)
+
+        return {
+            "id": hit["_id"],
+            "s3_key": source["s3_key"],
+            "file_name": source["file_name"],
+            "file_type": source.get("file_type", "unknown"),
+            "formatted_text": formatted_text,
+            "uploaded_at": source.get("uploaded_at", ""),
+            "title": source.get("title", ""),
+            "description": source.get("description", ""),
+            "extracted_metadata": source.get("extracted_metadata", {}),
+            "user_id": source.get("user_id", "unknown"),
+            "language": source.get("language")
+        }
+
+    def record_from_passage_hit(self, hit: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        パッセージ検索のヒット（親ドキュメントでまとめたもの）からレスポンス用レコードを作成する
+
+        本文（formatted_text）と抽出メタデータは返さず、上位パッセージをpassagesに入れる
+        """
+        source = hit.get("_source", {})
+        inner_hits = hit.get("inner_hits", {}).get("passages", {}).get("hits", {}).get("hits", [])
+        passages = [
+            {
+                "id": inner_hit["_id"],
+                "ordinal": inner_hit.get("_source", {}).get("ordinal", 0),
+                "start": inner_hit.get("_source", {}).get("start", 0),
+                "text": inner_hit.get("_source", {}).get("text", ""),
+                "score": inner_hit.get("_score")
+            }
+            for inner_hit in inner_hits
+        ]
+        return {
+            "id": source.get("parent_id") or hit["_id"].rsplit(":", 1)[0],
+            "s3_key": source.get("s3_key", ""),
+            "file_name": source.get("file_name", ""),
+            "file_type": source.get("file_type", "unknown"),
+            "formatted_text": "",
+            "uploaded_at": source.get("uploaded_at", ""),
+            "title": source.get("title", ""),
+            "description": "",
+            "extracted_metadata": {},
+            "user_id": source.get("user_id", "unknown"),
+            "language": source.get("language"),
+            "passages": passages
+        }
+
+    def snippet_from_hit(self, hit: Dict[str, Any]) -> str:
+        """ハイライト断片を連結したスニペットを返す"""
+        fragments = hit.get("highlight", {}).get("content", [])
+        return " ... ".join(fragments)
+
+
+def _span_name(path: str) -> str:
+    """リクエストパスから計測用の段階名を作成（/{index}/_search -> opensearch.search）"""
+    if "point_in_time" in path:
+        return "opensearch.pit"
+    for segment in path.split("?")[0].split("/"):
+        if segment.startswith("_"):
+            return f"opensearch.{segment[1:]}"
+    return "opensearch.index"
+
+
+def _with_refresh(path: str, refresh: Optional[str]) -> str:
+    """refreshを指定した場合はリクエストパスにクエリパラメータとして付ける"""
+    return f"{path}?refresh={refresh}" if refresh else path
+
+
+def _to_ndjson(lines: List[Dict]) -> bytes:
+    """辞書のリストをNDJSON（末尾改行付き）に変換"""
+    return "".join(
+        json.dumps(line, ensure_ascii=False, default=json_default) + "\n" for line in lines
+    ).encode("utf-8")
+
+
+def _mapping_conflicts(existing: Dict[str, Any], definition: Dict[str, Any]) -> bool:
+    """既存のフィールド定義が、put-mappingで変更できない点で新しい定義と異なるか"""
+    if existing.get("type", "object") != definition.get("type", "object"):
+        return True
+    if definition.get("type", "object") == "object":
+        return existing.get("enabled", True) != definition.get("enabled", True)
+    return (existing.get("analyzer") != definition.get("analyzer")
+            or existing.get("index", True) != definition.get("index", True))
+
+
+def _sort_tiebreak_field(doc_id_mapping: Optional[Dict[str, Any]]) -> Optional[str]:
+    """同順位解決に使うkeywordフィールド（doc_idが未登録・keywordならdoc_id、textならkeywordサブフィールド）"""
+    if doc_id_mapping is None or doc_id_mapping.get("type") == "keyword":
+        return "doc_id"
+    if doc_id_mapping.get("fields", {}).get("keyword", {}).get("type") == "keyword":
+        return "doc_id.keyword"
+    return None
+
 
 # シングルトンインスタンス
 opensearch_service = MinimalOpenSearchService()
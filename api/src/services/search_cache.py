@@ -0,0 +1,304 @@
+"""
+検索結果キャッシュモジュール
+/searchの結果をTTL付きLRUでキャッシュし、アップロード・削除・再インデックス時に
+所有者単位・ドキュメント単位で無効化する
+"""
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from ..config import (
+    SEARCH_CACHE_ENABLED,
+    SEARCH_CACHE_BACKEND,
+    SEARCH_CACHE_TTL,
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_CACHE_REDIS_URL,
+    SUGGEST_CACHE_TTL,
+    SUGGEST_CACHE_MAX_ENTRIES,
+)
+from .json_utils import json_default
+
+
+class InMemorySearchCacheBackend:
+    """プロセス内キャッシュ（サイズ上限付きLRU + TTL）"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (有効期限, 値, タグ)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # タグ -> キー集合（無効化用の逆引き）
+        self._tag_index: Dict[str, Set[str]] = {}
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, tags: Iterable[str], ttl: float) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            tag_set = frozenset(tags)
+            self._entries[key] = (time.monotonic() + ttl, value, tag_set)
+            for tag in tag_set:
+                self._tag_index.setdefault(tag, set()).add(key)
+            # 上限を超えたら最も古く使われたエントリから追い出す
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tag_index.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tag_index.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        """エントリとタグの逆引きを削除（ロック取得済みで呼ぶこと）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+
+class RedisSearchCacheBackend:
+    """
+    共有キャッシュ（複数のuvicornワーカー間でエントリを共有）
+
+    LRUによる追い出しはRedis側のmaxmemory-policy（allkeys-lru）に任せ、
+    ここではTTLとタグによる無効化のみを扱う
+    """
+
+    def __init__(self, url: str, prefix: str = "factify:search:"):
+        import redis  # 共有バックエンド使用時のみ必要
+
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._redis.get(self.prefix + key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any, tags: Iterable[str], ttl: float) -> None:
+        ttl_seconds = max(1, int(ttl))
+        pipe = self._redis.pipeline()
+        pipe.setex(self.prefix + key, ttl_seconds, json.dumps(value, default=json_default))
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            pipe.sadd(tag_key, key)
+            pipe.expire(tag_key, ttl_seconds)
+        pipe.execute()
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            keys = self._redis.smembers(tag_key)
+            if keys:
+                removed += self._redis.delete(*[self.prefix + key.decode() for key in keys])
+            self._redis.delete(tag_key)
+        return removed
+
+    def clear(self) -> None:
+        for key in self._redis.scan_iter(match=self.prefix + "*"):
+            self._redis.delete(key)
+
+    def size(self) -> int:
+        return sum(
+            1 for key in self._redis.scan_iter(match=self.prefix + "*")
+            if not key.decode().startswith(self.prefix + "tag:")
+        )
+
+
+class SearchResultCache:
+    """検索結果キャッシュ（ヒット率の計測と無効化APIを提供）"""
+
+    def __init__(self, backend, ttl: float = 60.0, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """クエリを正規化（全角半角の統一・小文字化・空白の圧縮）"""
+        normalized = unicodedata.normalize("NFKC", query).lower()
+        return " ".join(normalized.split())
+
+    def make_key(self, query: str, user_only: bool, user_id: Optional[str],
+                 language: Optional[str], max_results: int, **options: Any) -> str:
+        """
+        キャッシュキーを作成
+
+        Parameters:
+        -----------
+        query : str
+            検索クエリ（正規化してからキーに含める）
+        user_only : bool
+            ユーザー固有検索かどうか
+        user_id : Optional[str]
+            呼び出し元のユーザーID
+        language : Optional[str]
+            言語コード
+        max_results : int
+            最大結果数
+        options : Any
+            レスポンス内容を変えるその他のオプション
+        """
+        key_parts = {
+            "q": self.normalize_query(query),
+            "user_only": bool(user_only),
+            "user_id": user_id or "",
+            "language": language or "",
+            "max_results": max_results,
+            **options
+        }
+        return json.dumps(key_parts, sort_keys=True, ensure_ascii=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みの検索結果を取得（なければNone）"""
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"検索キャッシュ取得エラー（無視して処理継続）: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], scope_user_id: Optional[str] = None) -> None:
+        """
+        検索結果をキャッシュに保存
+
+        value["results"]に含まれるドキュメントID・所有者IDと、検索範囲（ユーザー固有検索なら
+        そのユーザー）をタグとして付与し、無効化に使う
+        """
+        if not self.enabled:
+            return
+        results = value.get("results", [])
+        tags = {f"doc:{result.get('id')}" for result in results}
+        tags.update(f"owner:{result.get('user_id')}" for result in results if result.get("user_id"))
+        if scope_user_id:
+            tags.add(f"scope:{scope_user_id}")
+        try:
+            self.backend.set(key, value, tags, self.ttl)
+        except Exception as e:
+            print(f"検索キャッシュ保存エラー（無視して処理継続）: {e}")
+
+    def invalidate_owner(self, owner_id: str) -> int:
+        """
+        所有者のドキュメントを含む結果と、その所有者のユーザー固有検索の結果を無効化
+
+        全体検索に新規ドキュメントが現れるのはTTL経過後になる
+        """
+        return self._invalidate([f"owner:{owner_id}", f"scope:{owner_id}"])
+
+    def invalidate_document(self, doc_id: str, owner_id: Optional[str] = None) -> int:
+        """ドキュメントを含む結果を無効化（所有者指定時はその所有者分も無効化）"""
+        tags = [f"doc:{doc_id}"]
+        if owner_id:
+            tags.extend([f"owner:{owner_id}", f"scope:{owner_id}"])
+        return self._invalidate(tags)
+
+    def clear(self) -> None:
+        """全エントリを削除"""
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュ統計を返す"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "enabled": self.enabled,
+                "backend": type(self.backend).__name__,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": getattr(self.backend, "evictions", 0)
+            }
+        try:
+            stats["entries"] = self.backend.size()
+        except Exception as e:
+            stats["entries"] = None
+            print(f"検索キャッシュサイズ取得エラー: {e}")
+        return stats
+
+    def _invalidate(self, tags: List[str]) -> int:
+        if not self.enabled:
+            return 0
+        try:
+            removed = self.backend.invalidate_tags(tags)
+        except Exception as e:
+            print(f"検索キャッシュ無効化エラー: {e}")
+            return 0
+        with self._lock:
+            self.invalidations += removed
+        return removed
+
+
+def _create_backend():
+    """設定に応じてキャッシュバックエンドを作成（redisが使えない環境ではプロセス内キャッシュにする）"""
+    if SEARCH_CACHE_BACKEND == "redis":
+        try:
+            return RedisSearchCacheBackend(SEARCH_CACHE_REDIS_URL)
+        except ImportError:
+            print("redisがインストールされていないため、検索キャッシュはワーカーごとのプロセス内キャッシュを使用します")
+    return InMemorySearchCacheBackend(max_entries=SEARCH_CACHE_MAX_ENTRIES)
+
+
+# シングルトンインスタンス
+search_cache = SearchResultCache(
+    _create_backend(),
+    ttl=SEARCH_CACHE_TTL,
+    enabled=SEARCH_CACHE_ENABLED
+)
+
+# 入力補完用のプレフィックスキャッシュ（キーストロークごとの呼び出しをプロセス内で完結させる）
+suggest_cache = SearchResultCache(
+    InMemorySearchCacheBackend(max_entries=SUGGEST_CACHE_MAX_ENTRIES),
+    ttl=SUGGEST_CACHE_TTL,
+    enabled=SEARCH_CACHE_ENABLED
+)
@@ -0,0 +1,78 @@
+"""
+検索カーソルモジュール
+/searchのページングに使う不透明なカーソル文字列のエンコード・デコードを担当
+
+カーソルには続きを取得するバックエンド（OpenSearchのsearch_after値とPIT、ローカルインデックスの
+オフセット、またはDynamoDBの各セグメントのExclusiveStartKey）と、検索条件のフィンガープリントを保持する
+"""
+import base64
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from .search_cache import SearchResultCache
+
+CURSOR_VERSION = 1
+BACKEND_OPENSEARCH = "opensearch"
+BACKEND_DYNAMODB = "dynamodb"
+BACKEND_LOCAL = "local"
+
+
+class InvalidCursorError(ValueError):
+    """カーソルが壊れている、または別の検索条件で発行されたもの"""
+
+
+def query_fingerprint(query: str, user_id: Optional[str], language: Optional[str],
+                      search_mode: Optional[str] = None) -> str:
+    """検索条件のフィンガープリント（別の検索へのカーソル流用を検出する。検索モードは指定時のみ含める）"""
+    condition = {
+        "q": SearchResultCache.normalize_query(query),
+        "user_id": user_id or "",
+        "language": language or ""
+    }
+    if search_mode:
+        condition["mode"] = search_mode
+    raw = json.dumps(condition, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(backend: str, fingerprint: str, **state: Any) -> str:
+    """
+    カーソルをエンコード
+
+    Parameters:
+    -----------
+    backend : str
+        続きを取得するバックエンド（"opensearch" / "local" / "dynamodb"）
+    fingerprint : str
+        検索条件のフィンガープリント
+    state : Any
+        バックエンド固有の位置情報（search_after, pit_id, オフセット, exclusive_start_key など）
+    """
+    payload = {"v": CURSOR_VERSION, "b": backend, "fp": fingerprint, **state}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Dict[str, Any]:
+    """
+    カーソルをデコードして検証
+
+    Raises:
+    -------
+    InvalidCursorError
+        形式が不正、または検索条件が一致しない場合
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise InvalidCursorError("カーソルの形式が不正です")
+
+    if not isinstance(payload, dict) or payload.get("v") != CURSOR_VERSION:
+        raise InvalidCursorError("カーソルのバージョンが不正です")
+    if payload.get("b") not in (BACKEND_OPENSEARCH, BACKEND_DYNAMODB, BACKEND_LOCAL):
+        raise InvalidCursorError("カーソルのバックエンドが不正です")
+    if payload.get("fp") != fingerprint:
+        raise InvalidCursorError("カーソルが現在の検索条件と一致しません")
+    return payload
@@ -0,0 +1,271 @@
+"""
+整形済みテキスト保存モジュール
+大きな整形済みテキストはDynamoDBのアイテムに入れず圧縮してS3に保存し、アイテムには保存先・サイズ・先頭部分だけを残す
+（アイテムサイズの上限とスキャンの読み込み容量を抑える）。本文は必要になったときだけ読み込み、LRUキャッシュに保持する
+"""
+import asyncio
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from ..aws_services import aws_services, TEXT_POINTER_FIELDS
+from ..config import (
+    TEXT_OFFLOAD_ENABLED,
+    TEXT_OFFLOAD_MIN_BYTES,
+    TEXT_OFFLOAD_PREFIX,
+    TEXT_OFFLOAD_COMPRESSION,
+    TEXT_PREVIEW_CHARS,
+    TEXT_CACHE_MAX_BYTES,
+)
+from .async_storage import storage
+
+ENCODING_GZIP = "gzip"
+ENCODING_ZSTD = "zstd"
+
+_EXTENSIONS = {ENCODING_GZIP: "gz", ENCODING_ZSTD: "zst"}
+
+
+def _zstd():
+    """zstandardモジュール（インストールされていなければImportError）"""
+    import zstandard
+    return zstandard
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == ENCODING_ZSTD:
+        return _zstd().ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == ENCODING_ZSTD:
+        return _zstd().ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _resolve_encoding(encoding: str) -> str:
+    """設定された圧縮形式を確認（zstdが使えない環境ではgzipにする）"""
+    if encoding == ENCODING_ZSTD:
+        try:
+            _zstd()
+            return ENCODING_ZSTD
+        except ImportError:
+            print("zstandardがインストールされていないため、整形済みテキストはgzipで圧縮します")
+    return ENCODING_GZIP
+
+
+class TextStore:
+    """
+    整形済みテキストのS3への退避と遅延読み込み
+
+    S3に保存したアイテムは formatted_text を持たず、代わりに text_s3_key（保存先）・text_encoding（圧縮形式）・
+    text_preview（先頭部分）・text_size（UTF-8のバイト数）・text_length（文字数）を持つ
+    """
+
+    def __init__(self, enabled: bool = TEXT_OFFLOAD_ENABLED, min_bytes: int = TEXT_OFFLOAD_MIN_BYTES,
+                 prefix: str = TEXT_OFFLOAD_PREFIX, compression: str = TEXT_OFFLOAD_COMPRESSION,
+                 preview_chars: int = TEXT_PREVIEW_CHARS, cache_max_bytes: int = TEXT_CACHE_MAX_BYTES):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.prefix = prefix
+        self.encoding = _resolve_encoding(compression) if enabled else ENCODING_GZIP
+        self.preview_chars = preview_chars
+        self.cache_max_bytes = cache_max_bytes
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_sizes: Dict[str, int] = {}
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "offloaded": 0,
+            "bytes_raw": 0,
+            "bytes_compressed": 0,
+            "loads": 0,
+            "cache_hits": 0,
+            "cache_evictions": 0
+        }
+
+    def offload(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        保存用のアイテムを作成（本文が大きければS3に保存して参照に置き換える。同期処理）
+
+        Parameters:
+        -----------
+        item : Dict[str, Any]
+            formatted_textを含むアイテム（変更しない）
+
+        Returns:
+        --------
+        Dict[str, Any]
+            DynamoDBに保存するアイテム
+        """
+        text = item.get("formatted_text")
+        if text is None:
+            return item
+        attributes = self._store_text(item["id"], text)
+        if attributes is None:
+            return item
+        stored = {key: value for key, value in item.items() if key != "formatted_text"}
+        stored.update(attributes)
+        return stored
+
+    def offload_existing(self, item: Dict[str, Any]) -> Optional[int]:
+        """
+        保存済みのアイテムの本文をS3に移す（バックフィル用。同期処理）
+
+        Returns:
+        --------
+        Optional[int]
+            移した本文のバイト数（対象外・他の更新と競合した場合はNone）
+        """
+        text = item.get("formatted_text")
+        if text is None:
+            return None
+        attributes = self._store_text(item["id"], text)
+        if attributes is None:
+            return None
+        if not aws_services.replace_document_text(item["id"], attributes):
+            # 移す間に削除・置き換えされていた
+            aws_services.delete_file_from_s3(attributes["text_s3_key"])
+            return None
+        return attributes["text_size"]
+
+    def load(self, item: Dict[str, Any], use_cache: bool = True) -> str:
+        """
+        アイテムの整形済みテキストを取得（S3に保存した本文は読み込んで展開する。同期処理）
+
+        Parameters:
+        -----------
+        item : Dict[str, Any]
+            DynamoDBのアイテム
+        use_cache : bool
+            LRUキャッシュを使うか（全件を順に読むバックフィル・移行ではキャッシュを汚さないようFalse）
+        """
+        s3_key = item.get("text_s3_key")
+        if not s3_key:
+            return item.get("formatted_text") or ""
+        if use_cache:
+            with self._lock:
+                text = self._cache.get(s3_key)
+                if text is not None:
+                    self._cache.move_to_end(s3_key)
+                    self._stats["cache_hits"] += 1
+                    return text
+        body = aws_services.download_file_from_s3(s3_key)
+        text = _decompress(body, item.get("text_encoding", ENCODING_GZIP)).decode("utf-8")
+        with self._lock:
+            self._stats["loads"] += 1
+        if use_cache:
+            self._remember(s3_key, text, int(item.get("text_size") or len(text.encode("utf-8"))))
+        return text
+
+    def with_text(self, item: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+        """本文を読み込んだアイテム（参照の属性は除く）を返す。同期処理"""
+        if not item.get("text_s3_key"):
+            return item
+        text = self.load(item, use_cache=use_cache)
+        hydrated = self.strip(item)
+        hydrated["formatted_text"] = text
+        return hydrated
+
+    def iter_with_text(self, items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """アイテムを順に本文付きにして返す（キャッシュは使わない）"""
+        for item in items:
+            yield self.with_text(item, use_cache=False)
+
+    async def hydrate(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        レスポンスで本文が必要なアイテムに整形済みテキストを補完（S3からの読み込みは並列に行う）
+
+        S3に保存した本文を読み込めなかったアイテムは先頭部分を本文の代わりに返す
+        """
+        async def hydrate_one(item: Dict[str, Any]) -> Dict[str, Any]:
+            if not item.get("text_s3_key"):
+                return item
+            try:
+                return await storage.run(self.with_text, item)
+            except Exception as e:
+                print(f"整形済みテキスト読み込みエラー（先頭部分で代替）: {item.get('id')} - {e}")
+                return {**self.strip(item), "formatted_text": item.get("text_preview", "")}
+
+        return list(await asyncio.gather(*(hydrate_one(item) for item in items)))
+
+    def strip(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """参照の属性を除いたアイテム（レスポンス用）"""
+        return {key: value for key, value in item.items() if key not in TEXT_POINTER_FIELDS}
+
+    def text_length(self, item: Dict[str, Any]) -> int:
+        """本文の文字数（S3に保存した本文は読み込まずに保存時の値を返す）"""
+        if "text_length" in item:
+            return int(item["text_length"])
+        return len(item.get("formatted_text") or "")
+
+    def delete(self, item: Dict[str, Any]) -> None:
+        """アイテムの本文をS3から削除（S3に保存していなければ何もしない。同期処理）"""
+        s3_key = item.get("text_s3_key")
+        if not s3_key:
+            return
+        aws_services.delete_file_from_s3(s3_key)
+        with self._lock:
+            if s3_key in self._cache:
+                del self._cache[s3_key]
+                self._cache_bytes -= self._cache_sizes.pop(s3_key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {
+                "enabled": self.enabled,
+                "min_bytes": self.min_bytes,
+                "encoding": self.encoding,
+                "cache_entries": len(self._cache),
+                "cache_bytes": self._cache_bytes,
+                "cache_max_bytes": self.cache_max_bytes,
+                **self._stats
+            }
+        lookups = stats["loads"] + stats["cache_hits"]
+        stats["cache_hit_rate"] = round(stats["cache_hits"] / lookups, 4) if lookups else None
+        stats["compression_ratio"] = (
+            round(stats["bytes_compressed"] / stats["bytes_raw"], 4) if stats["bytes_raw"] else None
+        )
+        return stats
+
+    def _store_text(self, doc_id: str, text: str) -> Optional[Dict[str, Any]]:
+        """本文が大きければ圧縮してS3に保存し、アイテムに設定する属性を返す（小さければNone）"""
+        if not self.enabled:
+            return None
+        raw = text.encode("utf-8")
+        if len(raw) < self.min_bytes:
+            return None
+        body = _compress(raw, self.encoding)
+        s3_key = f"{self.prefix}/{doc_id}.txt.{_EXTENSIONS[self.encoding]}"
+        aws_services.upload_file_to_s3(body, s3_key, "application/octet-stream")
+        with self._lock:
+            self._stats["offloaded"] += 1
+            self._stats["bytes_raw"] += len(raw)
+            self._stats["bytes_compressed"] += len(body)
+        return {
+            "text_s3_key": s3_key,
+            "text_encoding": self.encoding,
+            "text_preview": text[:self.preview_chars],
+            "text_size": len(raw),
+            "text_length": len(text)
+        }
+
+    def _remember(self, s3_key: str, text: str, size: int) -> None:
+        """LRUキャッシュに追加し、上限を超えた分を古い順に捨てる"""
+        if size > self.cache_max_bytes:
+            return
+        with self._lock:
+            if s3_key in self._cache:
+                return
+            self._cache[s3_key] = text
+            self._cache_sizes[s3_key] = size
+            self._cache_bytes += size
+            while self._cache_bytes > self.cache_max_bytes:
+                evicted, _ = self._cache.popitem(last=False)
+                self._cache_bytes -= self._cache_sizes.pop(evicted)
+                self._stats["cache_evictions"] += 1
+
+
+# シングルトンインスタンス
+text_store = TextStore()
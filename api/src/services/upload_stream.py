@@ -0,0 +1,200 @@
+"""
+ストリーミングアップロードモジュール
+アップロードされたファイルをチャンク単位で読み、一時ファイル（抽出用）とS3マルチパートアップロードへ
+同時に流す。サイズ上限の確認とSHA-256の計算も読みながら行い、ファイル全体をメモリに載せない
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from ..config import (
+    UPLOAD_MAX_BYTES,
+    UPLOAD_READ_CHUNK_SIZE,
+    UPLOAD_SPOOL_DIR,
+    S3_MULTIPART_PART_SIZE,
+    S3_MULTIPART_CONCURRENCY,
+)
+from .async_storage import storage
+
+
+class UploadTooLargeError(Exception):
+    """アップロードされたファイルがサイズ上限を超えている"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"ファイルサイズが上限（{max_bytes // (1024 * 1024)}MB）を超えています")
+        self.max_bytes = max_bytes
+
+
+class SpooledFile:
+    """
+    一時ファイルに書き出したファイル（パス・サイズ・SHA-256）。使い終わったらcleanupで削除する
+
+    S3への保存を保留したアップロード（stream_uploadのcomplete=False）はcomplete_uploadで完了するか、
+    abort_uploadで中止する
+    """
+
+    def __init__(self, path: str, size: int, sha256: Optional[str] = None,
+                 upload: Optional["S3MultipartWriter"] = None):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self._upload = upload
+
+    async def complete_upload(self) -> None:
+        """保留中のS3への保存を完了"""
+        if self._upload is not None:
+            upload, self._upload = self._upload, None
+            try:
+                await upload.close()
+            except BaseException:
+                await upload.abort()
+                raise
+
+    async def abort_upload(self) -> None:
+        """保留中のS3への保存を中止（保留中のものがなければ何もしない）"""
+        if self._upload is not None:
+            upload, self._upload = self._upload, None
+            await upload.abort()
+
+    def cleanup(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class S3MultipartWriter:
+    """
+    S3へのマルチパートアップロード
+
+    書き込まれた内容がパートサイズに達するたびにパートを並列に送信する（同時送信数を超えると書き込みを待たせる）。
+    全体が1パートに満たない場合はマルチパートを使わず1回のPutObjectで保存する
+    """
+
+    def __init__(self, s3_key: str, content_type: str, part_size: int = S3_MULTIPART_PART_SIZE,
+                 concurrency: int = S3_MULTIPART_CONCURRENCY):
+        self.s3_key = s3_key
+        self.content_type = content_type
+        self.part_size = part_size
+        self._slots = asyncio.Semaphore(max(concurrency, 1))
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def write(self, chunk: bytes) -> None:
+        self._buffer.extend(chunk)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._send_part(part)
+
+    async def close(self) -> None:
+        """残りを送信してアップロードを完了"""
+        if self._upload_id is None:
+            await storage.put_object(bytes(self._buffer), self.s3_key, self.content_type)
+            return
+        if self._buffer:
+            await self._send_part(bytes(self._buffer))
+            self._buffer.clear()
+        parts = await asyncio.gather(*self._tasks)
+        await storage.complete_multipart_upload(self.s3_key, self._upload_id, list(parts))
+
+    async def abort(self) -> None:
+        """送信中のパートを取り消し、マルチパートアップロードを中止"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._upload_id is not None:
+            try:
+                await storage.abort_multipart_upload(self.s3_key, self._upload_id)
+            except Exception as e:
+                print(f"マルチパートアップロード中止エラー: {e}")
+
+    async def _send_part(self, body: bytes) -> None:
+        # 先に失敗したパートがあれば以降の送信をやめる
+        for task in self._tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        if self._upload_id is None:
+            self._upload_id = await storage.create_multipart_upload(self.s3_key, self.content_type)
+        await self._slots.acquire()
+        part_number = len(self._tasks) + 1
+        self._tasks.append(asyncio.create_task(self._upload_part(part_number, body)))
+
+    async def _upload_part(self, part_number: int, body: bytes) -> Dict[str, Any]:
+        try:
+            content_md5 = base64.b64encode(hashlib.md5(body).digest()).decode("ascii")
+            etag = await storage.upload_part(self.s3_key, self._upload_id, part_number, body, content_md5)
+            return {"PartNumber": part_number, "ETag": etag}
+        finally:
+            self._slots.release()
+
+
+async def stream_upload(upload, s3_key: str, content_type: str,
+                        max_bytes: int = UPLOAD_MAX_BYTES, complete: bool = True) -> SpooledFile:
+    """
+    アップロードされたファイルを一時ファイルとS3に同時に書き出す
+
+    Parameters:
+    -----------
+    upload : UploadFile
+        FastAPIのアップロードファイル
+    s3_key : str
+        保存先のS3オブジェクトキー
+    content_type : str
+        ファイルのMIMEタイプ
+    max_bytes : int
+        ファイルサイズの上限
+    complete : bool
+        FalseならS3への保存（マルチパートアップロードの完了）を保留し、呼び出し元がSHA-256を見て
+        SpooledFile.complete_upload / abort_upload で決める（送信済みのパートは完了するまでオブジェクトにならない）
+
+    Returns:
+    --------
+    SpooledFile
+        抽出用の一時ファイル（サイズ・SHA-256付き）
+
+    Raises:
+    -------
+    UploadTooLargeError
+        サイズ上限を超えた場合（S3への書き込みは中止し、一時ファイルも削除する）
+    """
+    spool = tempfile.NamedTemporaryFile(prefix="factify-upload-", dir=UPLOAD_SPOOL_DIR, delete=False)
+    writer = S3MultipartWriter(s3_key, content_type)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+            digest.update(chunk)
+            spool.write(chunk)
+            await writer.write(chunk)
+        spool.close()
+        if complete:
+            await writer.close()
+    except BaseException:
+        spool.close()
+        await writer.abort()
+        os.remove(spool.name)
+        raise
+    return SpooledFile(spool.name, size, digest.hexdigest(), upload=None if complete else writer)
+
+
+async def spool_from_s3(s3_key: str) -> SpooledFile:
+    """S3のオブジェクトを一時ファイルにダウンロード（非同期取り込みの抽出用）"""
+    fd, path = tempfile.mkstemp(prefix="factify-ingest-", dir=UPLOAD_SPOOL_DIR)
+    os.close(fd)
+    try:
+        await storage.download_to_path(s3_key, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledFile(path, os.path.getsize(path))
@@ -1,9 +1,33 @@
 """
 テキスト処理モジュール
-テキストの正規化とAI用フォーマット化を担当
+テキストの正規化とAI用フォーマット化、言語判定を担当
 """
 import re
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+# 言語判定に使う先頭の文字数（長文でも判定時間を一定に保つ）
+LANGUAGE_DETECTION_SAMPLE_CHARS = 4000
+# 判定できない場合の言語コード（ISO 639-2の「未確定」）
+UNDETERMINED_LANGUAGE = "und"
+
+_KANA_RE = re.compile(r"[\u3040-\u30ff\uff66-\uff9f]")
+_HAN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_HANGUL_RE = re.compile(r"[\uac00-\ud7af\u1100-\u11ff\u3130-\u318f]")
+_CYRILLIC_RE = re.compile(r"[\u0400-\u04ff]")
+_LATIN_WORD_RE = re.compile(r"[a-zA-Z\u00c0-\u024f]+")
+
+# パッセージの区切りに使う文字（パッセージ末尾の2割の範囲にあればそこで区切る）
+_PASSAGE_BREAK_CHARS = frozenset("。．！？!?.\n ")
+
+# ラテン文字言語の判定に使う頻出語
+_LATIN_STOPWORDS = {
+    "en": {"the", "and", "of", "to", "in", "is", "that", "for", "it", "with", "as", "was", "on", "are", "this", "be"},
+    "fr": {"le", "la", "les", "et", "des", "est", "une", "du", "que", "dans", "pour", "pas", "qui", "sur", "au"},
+    "de": {"der", "die", "das", "und", "ist", "nicht", "ein", "eine", "zu", "den", "mit", "sich", "auf", "dem", "von"},
+    "es": {"el", "la", "los", "las", "y", "es", "en", "que", "una", "del", "por", "con", "para", "se", "no"},
+    "it": {"il", "di", "che", "e", "la", "per", "una", "sono", "non", "gli", "del", "della", "con", "alla"},
+    "pt": {"o", "a", "os", "as", "de", "que", "e", "do", "da", "em", "um", "uma", "para", "com", "não"}
+}
 
 
 def clean_text(raw_text: str) -> str:
@@ -63,6 +87,8 @@ def format_for_ai(content: str, metadata: Dict[str, Any]) -> str:
     if metadata.get('file_type') == 'pdf':
         if 'page_count' in metadata:
             formatted_text += f"- ページ数: {metadata['page_count']}\n"
+        if metadata.get('truncated'):
+            formatted_text += f"- 抽出ページ数: {metadata.get('extracted_pages')}（上限により以降を省略）\n"
 
         # PDF特有のメタデータを追加
         for key, value in metadata.items():
@@ -96,3 +122,146 @@ def format_for_ai(content: str, metadata: Dict[str, Any]) -> str:
         formatted_text += f"- アップロード日時: {metadata['uploaded_at']}\n"
     
     return formatted_text
+
+
+def detect_language(text: str) -> str:
+    """
+    テキストの言語を判定する（文字種の比率とラテン文字の頻出語による軽量判定）
+    
+    Parameters:
+    -----------
+    text : str
+        判定するテキスト（先頭LANGUAGE_DETECTION_SAMPLE_CHARS文字のみ使用）
+        
+    Returns:
+    --------
+    str
+        ISO 639-1の言語コード（ja, zh, ko, ru, en, fr, de, es, it, pt）。判定できない場合は"und"
+    """
+    if not text:
+        return UNDETERMINED_LANGUAGE
+    sample = text[:LANGUAGE_DETECTION_SAMPLE_CHARS]
+    
+    kana = len(_KANA_RE.findall(sample))
+    han = len(_HAN_RE.findall(sample))
+    hangul = len(_HANGUL_RE.findall(sample))
+    cyrillic = len(_CYRILLIC_RE.findall(sample))
+    latin_words = _LATIN_WORD_RE.findall(sample)
+    latin = sum(len(word) for word in latin_words)
+    
+    script_counts = {"cjk": kana + han, "hangul": hangul, "cyrillic": cyrillic, "latin": latin}
+    script, count = max(script_counts.items(), key=lambda entry: entry[1])
+    if count == 0:
+        return UNDETERMINED_LANGUAGE
+    
+    if script == "cjk":
+        # 仮名を含めば日本語、漢字のみなら中国語
+        return "ja" if kana >= max(1, (kana + han) * 0.05) else "zh"
+    if script == "hangul":
+        return "ko"
+    if script == "cyrillic":
+        return "ru"
+    
+    # ラテン文字は頻出語の出現数が最も多い言語（判定できなければ英語）
+    words = [word.lower() for word in latin_words]
+    scores = {
+        language: sum(1 for word in words if word in stopwords)
+        for language, stopwords in _LATIN_STOPWORDS.items()
+    }
+    language, score = max(scores.items(), key=lambda entry: entry[1])
+    return language if score > 0 else "en"
+
+
+def extract_content_section(formatted_text: str) -> str:
+    """
+    format_for_aiで整形したテキストから本文（CONTENTセクション）を取り出す
+    
+    Parameters:
+    -----------
+    formatted_text : str
+        AI用に整形されたテキスト
+        
+    Returns:
+    --------
+    str
+        本文（セクションが見つからない場合は元のテキスト）
+    """
+    match = re.search(r"CONTENT:\n(.*?)\n\nMETADATA:\n", formatted_text or "", re.DOTALL)
+    return match.group(1) if match else (formatted_text or "")
+
+
+def split_passages(text: str, size: int, overlap: int = 0, max_passages: int = 0) -> List[Dict[str, Any]]:
+    """
+    本文を重なりのある一定長のパッセージに分割する
+    
+    同じ本文・設定なら常に同じ分割になるため、(ドキュメントID, ordinal)をパッセージの安定したIDに使える
+    
+    Parameters:
+    -----------
+    text : str
+        本文（extract_content_sectionで取り出したもの）
+    size : int
+        1パッセージの最大文字数（末尾の2割の範囲に文末・空白があればそこで区切る）
+    overlap : int
+        隣り合うパッセージの重なり（文字数）
+    max_passages : int
+        パッセージ数の上限（0で無制限）
+        
+    Returns:
+    --------
+    List[Dict[str, Any]]
+        {"ordinal": 連番, "start": 本文中の開始位置, "text": パッセージ} のリスト
+    """
+    passages: List[Dict[str, Any]] = []
+    length = len(text)
+    start = 0
+    while start < length and (not max_passages or len(passages) < max_passages):
+        end = min(start + size, length)
+        if end < length:
+            for index in range(end - 1, start + size * 4 // 5 - 1, -1):
+                if text[index] in _PASSAGE_BREAK_CHARS:
+                    end = index + 1
+                    break
+        passage = text[start:end].strip()
+        if passage:
+            passages.append({"ordinal": len(passages), "start": start, "text": passage})
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return passages
+
+
+def select_passages(text: str, query: str, size: int, overlap: int = 0, limit: int = 3) -> List[Dict[str, Any]]:
+    """
+    本文をパッセージに分割し、クエリの語を多く含むものから選ぶ（パッセージインデックスを使えない場合の検索用）
+    
+    Parameters:
+    -----------
+    text : str
+        本文
+    query : str
+        検索クエリ（空白で区切った語ごとに出現回数を数える）
+    size : int
+        1パッセージの最大文字数
+    overlap : int
+        隣り合うパッセージの重なり（文字数）
+    limit : int
+        返すパッセージ数
+        
+    Returns:
+    --------
+    List[Dict[str, Any]]
+        {"ordinal", "start", "text", "score"} のリスト（スコア順。語を含むパッセージがなければ先頭のパッセージ）
+    """
+    terms = [term for term in query.lower().split() if term]
+    scored = []
+    for passage in split_passages(text, size, overlap):
+        lowered = passage["text"].lower()
+        score = sum(lowered.count(term) for term in terms)
+        if score > 0:
+            scored.append({**passage, "score": float(score)})
+    if not scored:
+        passages = split_passages(text, size, overlap, max_passages=1)
+        return [{**passage, "score": 0.0} for passage in passages]
+    scored.sort(key=lambda passage: (-passage["score"], passage["ordinal"]))
+    return scored[:limit]
@@ -0,0 +1,100 @@
+from src.services.local_search_index import LocalSearchIndex, tokenize
+
+
+def _doc(title, content, user_id="u1"):
+    return {"title": title, "content": content, "user_id": user_id, "language": "ja"}
+
+
+def _ids(index, query, **kwargs):
+    return [result["id"] for result in index.search(query, size=50, **kwargs)["results"]]
+
+
+def _open(directory, **kwargs):
+    index = LocalSearchIndex(str(directory), **kwargs)
+    index.load()
+    return index
+
+
+def test_tokenize_splits_cjk_into_bigrams_and_drops_stop_words():
+    assert tokenize("東京都の天気") == ["東京", "京都", "都の", "の天", "天気"]
+    assert tokenize("The Quick ｆｏｘ") == ["quick", "fox"]
+    assert tokenize("猫") == ["猫"]
+
+
+def test_add_delete_flush_and_reopen(tmp_path):
+    index = _open(tmp_path, flush_threshold=1000)
+    index.rebuild([("a", _doc("alpha", "first document")), ("b", _doc("beta", "second document"))])
+    index.add_document("c", _doc("gamma", "third document"))
+    index.delete_document("a")
+    index.add_document("b", _doc("beta", "second document rewritten"))
+    assert sorted(_ids(index, "document")) == ["b", "c"]
+
+    index.flush()
+    assert index.stats()["delta_documents"] == 0
+    assert sorted(_ids(index, "document")) == ["b", "c"]
+    index.close()
+
+    reopened = _open(tmp_path)
+    assert reopened.ready
+    assert reopened.document_count() == 2
+    assert _ids(reopened, "rewritten") == ["b"]
+    assert _ids(reopened, "alpha") == []
+    reopened.close()
+
+
+def test_journal_is_replayed_after_crash(tmp_path):
+    index = _open(tmp_path, flush_threshold=1000)
+    index.rebuild([("a", _doc("alpha", "kept"))])
+    index.add_document("b", _doc("beta", "journaled"))
+    index.delete_document("a")
+    # closeせずに終了した場合（フラッシュされずジャーナルだけが残る）
+    with open(index.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": "torn"')
+
+    recovered = _open(tmp_path)
+    assert recovered.ready
+    assert _ids(recovered, "journaled") == ["b"]
+    assert _ids(recovered, "kept") == []
+    assert recovered.document_count() == 1
+    recovered.close()
+
+
+def test_title_hit_ranks_above_content_hit(tmp_path):
+    index = _open(tmp_path)
+    index.rebuild([
+        ("content", _doc("report", "notes about kyoto temples")),
+        ("title", _doc("kyoto", "notes about temples")),
+        ("other", _doc("osaka", "notes about castles")),
+    ])
+    index.add_document("delta", _doc("misc", "kyoto"))
+
+    assert _ids(index, "kyoto")[0] == "title"
+    assert set(_ids(index, "kyoto")) == {"title", "content", "delta"}
+    index.close()
+
+
+def test_rebuild_keeps_documents_added_while_it_runs(tmp_path):
+    index = _open(tmp_path, flush_threshold=2)
+    index.rebuild([("old0", _doc("old", "stale"))])
+
+    def snapshot():
+        yield "old0", _doc("old", "stale")
+        yield "old1", _doc("old", "stale")
+        # スナップショットの読み出し中に登録・削除を受け付ける（フラッシュは再構築が終わるまで行わない）
+        index.add_document("new0", _doc("new", "fresh"))
+        index.add_document("new1", _doc("new", "fresh"))
+        index.delete_document("old1")
+        index.flush()
+        yield "old2", _doc("old", "stale")
+
+    index.rebuild(snapshot())
+    assert sorted(_ids(index, "fresh")) == ["new0", "new1"]
+    assert sorted(_ids(index, "stale")) == ["old0", "old2"]
+
+    index.flush()
+    index.close()
+    reopened = _open(tmp_path)
+    assert reopened.document_count() == 4
+    assert sorted(_ids(reopened, "fresh")) == ["new0", "new1"]
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
+    reopened.close()
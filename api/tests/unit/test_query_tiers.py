@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+
+from src.services.opensearch_service import (
+    MinimalOpenSearchService,
+    TIER_FUZZY,
+    TIER_OR,
+    TIER_PHRASE_AND,
+)
+
+
+def _hits(count):
+    return {"hits": {"hits": [{"_id": f"doc{i}", "_score": 1.0, "sort": [1.0, f"doc{i}"]} for i in range(count)]}}
+
+
+def _service(hits_by_tier, calls):
+    """段（should句の数）ごとに決まった件数のヒットを返すOpenSearchサービス"""
+    service = MinimalOpenSearchService()
+    clause_tiers = {2: TIER_PHRASE_AND, 3: TIER_OR, 4: TIER_FUZZY}
+
+    async def request_async(method, path, body=None, timeout=None, track_health=True, ndjson=None):
+        if ndjson is not None:
+            tiers = [clause_tiers[len(line["query"]["bool"]["should"])]
+                     for line in ndjson[1::2]]
+            calls.append(tiers)
+            return httpx.Response(200, json={"responses": [_hits(hits_by_tier[tier]) for tier in tiers]})
+        tier = clause_tiers[len(body["query"]["bool"]["should"])]
+        calls.append(tier)
+        return httpx.Response(200, json=_hits(hits_by_tier[tier]))
+
+    service._request_async = request_async
+    return service
+
+
+def test_precise_query_with_few_exact_matches_does_not_escalate():
+    calls = []
+    service = _service({TIER_PHRASE_AND: 2, TIER_OR: 30, TIER_FUZZY: 50}, calls)
+
+    result = asyncio.run(service.search_documents_async("令和5年度 補正予算 第2号", size=10))
+
+    assert calls == [TIER_PHRASE_AND]
+    assert result["query_tier"] == TIER_PHRASE_AND
+    assert len(result["hits"]["hits"]) == 2
+
+
+def test_zero_hits_escalates_until_a_tier_matches():
+    calls = []
+    service = _service({TIER_PHRASE_AND: 0, TIER_OR: 0, TIER_FUZZY: 3}, calls)
+
+    result = asyncio.run(service.search_documents_async("typo qeury", size=10))
+
+    assert calls == [TIER_PHRASE_AND, TIER_OR, TIER_FUZZY]
+    assert result["query_tier"] == TIER_FUZZY
+
+
+def test_escalates_below_configured_minimum():
+    calls = []
+    service = _service({TIER_PHRASE_AND: 2, TIER_OR: 5, TIER_FUZZY: 8}, calls)
+    service.tier_min_hits = 3
+
+    result = asyncio.run(service.search_documents_async("query", size=10))
+
+    assert calls == [TIER_PHRASE_AND, TIER_OR]
+    assert result["query_tier"] == TIER_OR
+
+
+def test_msearch_escalation_does_not_depend_on_page_size():
+    calls = []
+    service = _service({TIER_PHRASE_AND: 1, TIER_OR: 4, TIER_FUZZY: 6}, calls)
+
+    results = asyncio.run(service.msearch_async([
+        {"query": "a", "size": 1},
+        {"query": "b", "size": 10},
+    ]))
+
+    assert calls == [[TIER_PHRASE_AND, TIER_PHRASE_AND]]
+    assert [result["query_tier"] for result in results] == [TIER_PHRASE_AND, TIER_PHRASE_AND]
@@ -0,0 +1,81 @@
+from src.services import search_cache as search_cache_module
+from src.services.search_cache import InMemorySearchCacheBackend, SearchResultCache
+
+
+class _Clock:
+    """time.monotonicの代わりに進める時計"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _page(*results):
+    return {"results": [{"id": doc_id, "user_id": owner} for doc_id, owner in results], "next_cursor": None}
+
+
+def _cache(monkeypatch, max_entries=100, ttl=60.0):
+    clock = _Clock()
+    monkeypatch.setattr(search_cache_module.time, "monotonic", clock)
+    return SearchResultCache(InMemorySearchCacheBackend(max_entries=max_entries), ttl=ttl), clock
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache, clock = _cache(monkeypatch, ttl=30.0)
+    cache.set("q", _page(("d1", "u1")))
+
+    clock.now += 29.9
+    assert cache.get("q") == _page(("d1", "u1"))
+    clock.now += 0.1
+    assert cache.get("q") is None
+    assert cache.backend.size() == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted_at_capacity(monkeypatch):
+    cache, _ = _cache(monkeypatch, max_entries=2)
+    cache.set("a", _page(("d1", "u1")))
+    cache.set("b", _page(("d2", "u1")))
+    assert cache.get("a") is not None  # aを最近使ったエントリにする
+
+    cache.set("c", _page(("d3", "u1")))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.backend.evictions == 1
+
+
+def test_invalidate_owner_removes_owner_and_scope_tagged_entries(monkeypatch):
+    cache, _ = _cache(monkeypatch)
+    cache.set("contains-u1", _page(("d1", "u1"), ("d2", "u2")))
+    cache.set("u1-only-search", _page(), scope_user_id="u1")
+    cache.set("u2-only-search", _page(("d2", "u2")), scope_user_id="u2")
+    cache.set("global", _page(("d3", "u3")))
+
+    assert cache.invalidate_owner("u1") == 2
+
+    assert cache.get("contains-u1") is None
+    assert cache.get("u1-only-search") is None
+    assert cache.get("u2-only-search") is not None
+    assert cache.get("global") is not None
+
+
+def test_invalidate_document_removes_only_entries_containing_it(monkeypatch):
+    cache, _ = _cache(monkeypatch)
+    cache.set("with-d1", _page(("d1", "u1"), ("d2", "u2")))
+    cache.set("with-d2", _page(("d2", "u2")))
+    cache.set("other-u1-doc", _page(("d3", "u1")))
+
+    assert cache.invalidate_document("d1") == 1
+
+    assert cache.get("with-d1") is None
+    assert cache.get("with-d2") is not None
+    assert cache.get("other-u1-doc") is not None
+
+    # 所有者を指定した場合はその所有者のドキュメントを含む結果も無効化する
+    assert cache.invalidate_document("d9", owner_id="u1") == 1
+    assert cache.get("other-u1-doc") is None
+    assert cache.get("with-d2") is not None
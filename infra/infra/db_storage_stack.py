@@ -108,6 +108,33 @@ class DbStorageStack(Stack):
             removal_policy=RemovalPolicy.DESTROY,
         )
 
+        # コンテンツインデックス用DynamoDBテーブルの作成（内容のSHA-256 → 共有する原本と参照数）
+        self.content_index_table = dynamodb.Table(
+            self,
+            "FactifyContentIndexTable",
+            table_name=f"factify-content-index-{self.account}-{self.region}",
+            partition_key=dynamodb.Attribute(
+                name="content_hash",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+        # 管理ジョブ用DynamoDBテーブルの作成（ジョブの進捗・再開用の状態。最終更新から一定期間でTTLにより削除）
+        self.jobs_table = dynamodb.Table(
+            self,
+            "FactifyJobsTable",
+            table_name=f"factify-admin-jobs-{self.account}-{self.region}",
+            partition_key=dynamodb.Attribute(
+                name="job_id",
+                type=dynamodb.AttributeType.STRING  # UUID
+            ),
+            time_to_live_attribute="expires_at",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
         # S3バケットの作成
         self.bucket = s3.Bucket(
             self, 
@@ -154,6 +181,20 @@ class DbStorageStack(Stack):
             description="Incentive Summary DynamoDB Table Name"
         )
 
+        CfnOutput(
+            self,
+            "ContentIndexTableName",
+            value=self.content_index_table.table_name,
+            description="Content Index DynamoDB Table Name"
+        )
+
+        CfnOutput(
+            self,
+            "JobsTableName",
+            value=self.jobs_table.table_name,
+            description="Admin Jobs DynamoDB Table Name"
+        )
+
     def grant_access_to_task_role(self, task_role):
         """
         指定されたタスクロールにS3バケットとDynamoDBテーブルへのアクセス権限を付与する
@@ -169,3 +210,9 @@ class DbStorageStack(Stack):
         
         # インセンティブ集計テーブルへのアクセス権限を付与
         self.incentive_summary_table.grant_read_write_data(task_role)
+        
+        # コンテンツインデックステーブルへのアクセス権限を付与
+        self.content_index_table.grant_read_write_data(task_role)
+
+        # 管理ジョブテーブルへのアクセス権限を付与
+        self.jobs_table.grant_read_write_data(task_role)
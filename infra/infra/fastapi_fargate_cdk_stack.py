@@ -88,6 +88,8 @@ class FastapiFargateCdkStack(Stack):
         container_env = {
             "S3_BUCKET_NAME": db_storage_stack.bucket.bucket_name if db_storage_stack else "factify-s3-bucket",
             "DYNAMODB_TABLE_NAME": db_storage_stack.table.table_name if db_storage_stack else "factify-dynamodb-table",
+            "CONTENT_INDEX_TABLE_NAME": db_storage_stack.content_index_table.table_name if db_storage_stack else "factify-content-index",
+            "JOBS_TABLE_NAME": db_storage_stack.jobs_table.table_name if db_storage_stack else "factify-admin-jobs",
             "REGION_NAME": self.region
         }
         
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+HTML抽出のベンチマークスクリプト
+BeautifulSoup（html.parser）での抽出とlxmlでの1回の走査による抽出の処理時間を比べ、結果が一致するかを確認する
+
+使い方:
+    python scripts/benchmark_html_extractor.py                 # 生成した大きなHTMLページで計測
+    python scripts/benchmark_html_extractor.py path/to/html/   # 指定したHTMLファイル（ディレクトリ内の*.html）で計測
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from src.file_extractors import (  # noqa: E402
+    _extract_html_content,
+    _extract_html_single_pass,
+    _extract_html_with_soup,
+)
+
+WORDS = ["ファクト", "チェック", "検索", "文書", "抽出", "データ", "分析", "報告", "結果", "確認",
+         "search", "document", "extract", "report", "analysis", "result", "&amp;", "&nbsp;", "&lt;tag&gt;", "&copy;"]
+
+
+def generate_page(target_bytes: int, seed: int) -> str:
+    """整形されたニュース記事風の大きなHTMLページを生成"""
+    rng = random.Random(seed)
+
+    def sentence() -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))) + "。"
+
+    head = (
+        "<!DOCTYPE html>\n<html lang=\"ja\">\n<head>\n"
+        "    <meta charset=\"UTF-8\">\n"
+        f"    <meta name=\"description\" content=\"ベンチマーク用ページ {seed}\">\n"
+        "    <meta name=\"keywords\" content=\"HTML, ベンチマーク\">\n"
+        f"    <title>ベンチマーク用ページ {seed}</title>\n"
+        "    <style>\n        body { font-family: sans-serif; }\n        .x > p { margin: 0; }\n    </style>\n"
+        "    <script>window.dataLayer = []; if (a < b && c > d) { run(); }</script>\n"
+        "</head>\n<body>\n"
+        "    <nav><ul><li><a href=\"/\">ホーム</a></li><li><a href=\"/search?q=x&amp;page=2\">検索</a></li></ul></nav>\n"
+        "    <main>\n"
+    )
+    parts = [head]
+    size = len(head)
+    section = 0
+    while size < target_bytes:
+        section += 1
+        block = [f"        <section id=\"s{section}\">\n            <h2>セクション {section}</h2>\n"]
+        for _ in range(rng.randint(3, 8)):
+            block.append(f"            <p>{sentence()} <b>{rng.choice(WORDS)}</b> {sentence()}</p>\n")
+        if rng.random() < 0.4:
+            block.append("            <table>\n")
+            for row in range(rng.randint(3, 10)):
+                cells = "".join(f"<td>{rng.choice(WORDS)} {row}</td>" for _ in range(4))
+                block.append(f"                <tr>{cells}</tr>\n")
+            block.append("            </table>\n")
+        if rng.random() < 0.3:
+            block.append("            <ul>\n")
+            for _ in range(rng.randint(3, 8)):
+                block.append(f"                <li><a href=\"/doc/{rng.randint(1, 9999)}\">{sentence()}</a></li>\n")
+            block.append("            </ul>\n")
+        if rng.random() < 0.1:
+            block.append("            <script>track('section', 1 < 2);</script>\n")
+        block.append("        </section>\n")
+        chunk = "".join(block)
+        parts.append(chunk)
+        size += len(chunk.encode("utf-8"))
+    parts.append("    </main>\n    <footer><p>&copy; factify</p></footer>\n</body>\n</html>\n")
+    return "".join(parts)
+
+
+def load_pages(paths):
+    """指定されたファイル・ディレクトリ内の*.htmlを読み込む"""
+    pages = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith((".html", ".htm")))
+            files = [os.path.join(path, name) for name in names]
+        else:
+            files = [path]
+        for file_path in files:
+            with open(file_path, "rb") as f:
+                pages.append((os.path.basename(file_path), f.read()))
+    return pages
+
+
+def best_time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML抽出（BeautifulSoup / lxml 1回走査）のベンチマーク")
+    parser.add_argument("paths", nargs="*", help="計測するHTMLファイルまたはディレクトリ（省略時は生成したページ）")
+    parser.add_argument("--pages", type=int, default=5, help="生成するページ数")
+    parser.add_argument("--size-kb", type=int, default=2048, help="生成するページ1件のサイズ（KB）")
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返し回数（最速の値を使う）")
+    args = parser.parse_args()
+
+    if args.paths:
+        pages = load_pages(args.paths)
+    else:
+        pages = [(f"generated-{i}.html", generate_page(args.size_kb * 1024, i).encode("utf-8"))
+                 for i in range(args.pages)]
+    if not pages:
+        print("計測するHTMLファイルがありません")
+        return 1
+
+    total_bytes = 0
+    total_soup = 0.0
+    total_fast = 0.0
+    fallbacks = 0
+    mismatches = 0
+    print(f"{'ページ':<24}{'サイズ(KB)':>12}{'BeautifulSoup(秒)':>20}{'lxml(秒)':>12}{'高速化':>10}")
+    for name, body in pages:
+        html_content = body.decode("utf-8")
+        soup_seconds = best_time(lambda: _extract_html_with_soup(html_content, {}), args.repeat)
+        fast_seconds = best_time(lambda: _extract_html_content(body, {}), args.repeat)
+
+        single_pass = _extract_html_single_pass(html_content)
+        if single_pass is None:
+            fallbacks += 1
+        elif single_pass != _extract_html_with_soup(html_content, {}):
+            mismatches += 1
+            print(f"  ⚠️ 抽出結果が一致しません: {name}")
+
+        total_bytes += len(body)
+        total_soup += soup_seconds
+        total_fast += fast_seconds
+        print(f"{name:<24}{len(body) / 1024:>12.0f}{soup_seconds:>20.3f}{fast_seconds:>12.3f}"
+              f"{soup_seconds / fast_seconds:>9.1f}x")
+
+    megabytes = total_bytes / (1024 * 1024)
+    print()
+    print(f"合計: {len(pages)}ページ / {megabytes:.1f}MB")
+    print(f"BeautifulSoup: {total_soup:.3f}秒（{megabytes / total_soup:.1f}MB/秒）")
+    print(f"lxml 1回走査 : {total_fast:.3f}秒（{megabytes / total_fast:.1f}MB/秒）")
+    print(f"高速化: {total_soup / total_fast:.1f}倍")
+    print(f"BeautifulSoupで抽出し直したページ: {fallbacks}件 / 抽出結果が一致しないページ: {mismatches}件")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())